@@ -1,25 +1,29 @@
 import os
+import time
 
 import openai
 from dotenv import load_dotenv
 
+from app.backends import function_config, get_backend
+from app.cache import get_cache
+from app.metrics import get_metrics, record_llm
+
 load_dotenv()
 openai.api_key = os.getenv("OPEN_AI_KEY")
-checklist_context = """
-        You are a technical bootcamp's Enrollment Coach (EC) Manager. 
-        EC rubric: 
-            A. Are they asking lead what motivated them to look into BloomTech?
-            B. Are we talking about the weekly time commitment and the length of the program?
-            C. Are we talking about any of the value props (job or money back guarantee, 
-            flexibility, beginner friendly, try before you buy (RFT))?
-            D. Are we asking lead if they are looking into competitors?
-            E. Are they scheduling another call with the lead?
-            F. Are we offering to demo the product?
-            G. Are we tasking the lead to complete enrollment and engage with the product?
-            H. Do we provide a good overview of the program, tuition options and expectations?
-            I. Are the coaches attempting to overcome obstacles?
-        to see if the enrollment coach hit all items in the rubric.
-        """
+openai.api_base = os.getenv("OPEN_AI_BASE", openai.api_base)
+
+RUBRIC = {
+    "A": "Are they asking lead what motivated them to look into BloomTech?",
+    "B": "Are we talking about the weekly time commitment and the length of the program?",
+    "C": "Are we talking about any of the value props (job or money back guarantee, "
+         "flexibility, beginner friendly, try before you buy (RFT))?",
+    "D": "Are we asking lead if they are looking into competitors?",
+    "E": "Are they scheduling another call with the lead?",
+    "F": "Are we offering to demo the product?",
+    "G": "Are we tasking the lead to complete enrollment and engage with the product?",
+    "H": "Do we provide a good overview of the program, tuition options and expectations?",
+    "I": "Are the coaches attempting to overcome obstacles?",
+}
 
 lead_question_context = """
         You are a technical bootcamp's Enrollment Coach (EC) Manager 
@@ -27,52 +31,91 @@ lead_question_context = """
         """
 
 
-def checklist_analysis(transcript):
+def rubric_context(keys: list[str] = None) -> str:
+    """system context listing the whole rubric, or only `keys`"""
+    rubric = "\n".join(f"            {key}. {RUBRIC[key]}" for key in keys or RUBRIC)
+    return f"""
+        You are a technical bootcamp's Enrollment Coach (EC) Manager. 
+        EC rubric: 
+{rubric}
+        to see if the enrollment coach hit all items in the rubric.
+        """
+
+
+checklist_context = rubric_context()
+
+
+def checklist_messages(transcript, keys: list[str] = None) -> list[dict[str, str]]:
+    """the whole rubric, or only `keys` when the rest was decided locally"""
+    keys = list(keys or RUBRIC)
+    example = ", ".join(f'"{key}": {value}' for key, value in zip(keys, ("true", "false")))
     prompt = f"""Analyze this {transcript} to see if the EC hit all rubric points.""" + \
-             """Use the following format: {rubric point key: True/False}.
-             do not add any other escape characters. Don't add \n. 
+             f"""Answer with a JSON object only, in this format: {{{example}, ...}}
+             with the rubric point keys {", ".join(keys)} and a true/false value.
              Don't add numbers to the beginning, just use the key and value.
-             Only use questions.
+             Do not add any other text.
              """
-    result = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": checklist_context},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    return result.get("choices")[0].get("message").get("content")
+    return [
+        {"role": "system", "content": checklist_context if keys == list(RUBRIC) else rubric_context(keys)},
+        {"role": "user", "content": prompt},
+    ]
 
 
-def lead_questions_analysis(transcript):
+def lead_questions_messages(transcript) -> list[dict[str, str]]:
     prompt = f"""First determine which speaker is the Enrollment Coach and which is the Lead in this transcript:
              {transcript}
              Next, give me all questions from the Lead and if the Enrollment Coach answered the question
-             in the conversation in this format:""" + """ {"question asked": Boolean} 
+             in the conversation as a JSON object in this format:""" + """ {"question asked": true} 
              """ + """ where 
              the boolean is based on whether the question asked by the Lead was answered by the 
              Enrollment Coach in the conversation. Do not tell me who the speakers are. Only give me the
              dictionary, do not add anything else."""
-    result = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": lead_question_context},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    return result.get("choices")[0].get("message").get("content")
+    return [
+        {"role": "system", "content": lead_question_context},
+        {"role": "user", "content": prompt},
+    ]
 
 
-def summarize(input_list):
+def summarize_messages(input_list) -> list[dict[str, str]]:
     prompt = f"""I have a list where the values are lists of questions. 
     Take this list of questions: {input_list} and 
     give me a short summary of the questions. Don't add escape characters.
     Don't mention what you're summarizing, just provide the summary in a string. 
     """
-    result = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "user", "content": prompt},
-        ],
-    )
-    return result.get("choices")[0].get("message").get("content")
+    return [
+        {"role": "user", "content": prompt},
+    ]
+
+
+def chat_completion(messages: list[dict[str, str]], function: str = "default", model: str = None) -> str:
+    config = function_config(function)
+    return get_backend(config["backend"]).complete(messages, model or config["model"])
+
+
+def complete(messages: list[dict[str, str]], function: str = "default", model: str = None) -> str:
+    config = function_config(function)
+    model = model or config["model"]
+    cache = get_cache()
+    key = cache.key(model, messages, get_backend(config["backend"]).provider)
+    if (content := cache.get(key)) is None:
+        get_metrics().inc("llm_cache_misses_total", function=function)
+        start = time.perf_counter()
+        content = chat_completion(messages, function, model)
+        record_llm(function, messages, content, time.perf_counter() - start)
+        cache.put(key, content)
+    else:
+        get_metrics().inc("llm_cache_hits_total", function=function)
+    return content
+
+
+
+def checklist_analysis(transcript):
+    return complete(checklist_messages(transcript), "checklist")
+
+
+def lead_questions_analysis(transcript):
+    return complete(lead_questions_messages(transcript), "lead_questions")
+
+
+def summarize(input_list):
+    return complete(summarize_messages(input_list), "summarize")
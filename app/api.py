@@ -1,19 +1,30 @@
+import asyncio
 import os
-import io
 import shutil
-import time
 
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from app.data import Database
-from app.ai import checklist_analysis, lead_questions_analysis
-from app.pipeline import FirefliesPipeline
-from app.utilities import (extract_summary,
-                           extract_transcript,
-                           group_summary_text,
-                           group_transcript_text,
-                           process_clusters, )
+from app.cache import get_cache
+from app.data import AsyncDatabase, Database
+from app.export import DATED_COLLECTIONS, EXPORT_COLLECTIONS, MEDIA_TYPES, export
+from app.ingest import file_sha256, stream_sha256
+from app.jobs import get_queue
+from app.metrics import RunReport, get_metrics
+from app.search import SearchIndex
+from app.turns import (SOURCE_COLLECTIONS,
+                       TurnStore,
+                       question_counts,
+                       stats_pipeline,
+                       talk_ratios)
+from app.views import (AnalyticsViews,
+                       cache_headers,
+                       not_modified,
+                       topic_counts,
+                       view_percent,
+                       weekly_percent)
 
 API = FastAPI(
     title="Enrollment Deep Dive",
@@ -29,16 +40,35 @@ API.add_middleware(
 )
 
 
+async def read_view(view_id: str) -> dict | None:
+    """an analytics view, the views are built from scratch when it is missing"""
+    views_db = AsyncDatabase("analytics_views")
+    view = await views_db.read_one({"_id": view_id})
+    if view is None:
+        await asyncio.to_thread(AnalyticsViews().rebuild)
+        view = await views_db.read_one({"_id": view_id})
+    return view
+
+
+def cached_response(request: Request, view: dict | None, body) -> Response:
+    headers = cache_headers(view)
+    if not_modified(headers, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(jsonable_encoder(body), headers=headers)
+
+
 @API.post("/upload-files", tags=["Upload"])
 async def upload_files_endpoint(upload_files: list[UploadFile] = File(...)):
     dir_fp = os.path.relpath("source_data")
     if not os.path.exists("source_data"):
         os.mkdir(dir_fp)
     for file in upload_files:
-        if file.filename not in dir_fp:
-            fp = os.path.join(dir_fp, file.filename)
-            with open(fp, "wb") as f:
-                shutil.copyfileobj(file.file, f)
+        fp = os.path.join(dir_fp, os.path.basename(file.filename))
+        if os.path.exists(fp) and file_sha256(fp) == stream_sha256(file.file):
+            continue
+        file.file.seek(0)
+        with open(fp, "wb") as f:
+            shutil.copyfileobj(file.file, f)
 
 
 # @API.post("/upload-pipeline", tags=["Data Pipeline"])
@@ -51,40 +81,40 @@ async def upload_files_endpoint(upload_files: list[UploadFile] = File(...)):
 
 
 @API.post("/upload-summaries-transcripts", tags=["Upload"])
-async def upload_summaries_transcripts_endpoint():
-    transcript_db = Database("transcripts")
-    summary_db = Database("summaries")
-    dir_fp = os.path.relpath("source_data")
-    for file in os.listdir(dir_fp):
-        if "summary" in file:
-            with open(os.path.join(dir_fp, file), "rb") as f:
-                text = io.BytesIO(f.read())
-                contents = extract_summary(text)
-                data = group_summary_text(contents)
-                data["filename"] = file
-                summary_db.create(data)
-        else:
-            with open(os.path.join(dir_fp, file), "rb") as f:
-                text = io.BytesIO(f.read())
-                contents = extract_transcript(text)
-                result = {
-                    "filename": file,
-                    "transcripts": group_transcript_text(contents),
-                }
-                transcript_db.create(result)
+def upload_summaries_transcripts_endpoint():
+    return {"job_id": get_queue().submit("ingest", dir_fp=os.path.relpath("source_data"))}
 
 
 @API.post("/upload-precision-analysis-cluster", tags=["Upload"])
-async def extract_cluster_to_mongo_endpoint():
-    t_df = Database("transcripts").dataframe()
-    db = Database("cluster")
-    clusters = process_clusters(t_df)
-    result = db.collection.insert_many(clusters).acknowledged
-    return {"result": f"Successfully Uploaded?: {result}"}
+def extract_cluster_to_mongo_endpoint(incremental: bool = False):
+    return {"job_id": get_queue().submit("cluster", incremental=incremental)}
+
 
+@API.get("/export/{collection}", tags=["Data"])
+def export_endpoint(collection: str,
+                    output: str = "ndjson",
+                    fields: str = None,
+                    start: str = None,
+                    end: str = None,
+                    batch_size: int = 1000):
+    """stream a collection as `ndjson`, `parquet` or `arrow`,
+       `fields` is a comma separated projection"""
+    if collection not in EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=404, detail="unknown collection")
+    if output not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"output must be one of {', '.join(MEDIA_TYPES)}")
+    if (start or end) and collection not in DATED_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"start / end apply to {', '.join(DATED_COLLECTIONS)}")
+    return StreamingResponse(
+        export(collection, output, fields.split(",") if fields else None, start, end, batch_size),
+        media_type=MEDIA_TYPES[output],
+        headers={"Content-Disposition": f'attachment; filename="{collection}.{output}"'},
+    )
 
-@API.post("/data-to-json", tags=["Data"])
+
+@API.post("/data-to-json", tags=["Data"], deprecated=True)
 async def data_to_json_endpoint():
+    """builds both collections in memory, use /export/{collection}"""
     summary_df = Database("summaries").dataframe().to_json()
     transcript_df = Database("transcripts").dataframe().to_json()
     return {
@@ -94,51 +124,155 @@ async def data_to_json_endpoint():
 
 
 @API.post("/add-precision-analysis", tags=["Analysis"])
-async def add_precision_analysis_endpoint():
-    transcript_db = Database("transcripts")
-    docs = transcript_db.collection.find({})
-    for doc in docs:
-        if "checklist_precision" not in doc.keys() or type(doc["questions_precision"]) != dict:
-            update_data = lead_questions_analysis(doc["transcripts"])
-            transcript_db.collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": {"questions_precision": update_data}},
-            )
-            time.sleep(10)
-            data = checklist_analysis(doc["transcripts"])
-            transcript_db.collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": {"checklist_precision": data}},
-            )
-            time.sleep(10)
+def add_precision_analysis_endpoint(batched: bool = False):
+    return {"job_id": get_queue().submit("score", batched=batched)}
 
 
 @API.get("/checklist_precision_percent", tags=["Analysis"])
-def checklist_precision_count():
-    """Calculates number of true's for each checklist precision obj in list"""
-    transcript_db = Database("transcripts")
-    return transcript_db.read_checklist_precision_percent()
+async def checklist_precision_count(request: Request, start: str = None, end: str = None):
+    """Calculates number of true's for each checklist precision obj in list,
+       served from the analytics views unless a date range is given"""
+    if start or end:
+        transcript_db = AsyncDatabase("transcripts")
+        return await transcript_db.read_checklist_precision_percent(start, end)
+    view = await read_view("checklist")
+    return cached_response(request, view, view_percent(view))
+
+
+@API.get("/checklist_precision_weekly", tags=["Analysis"])
+async def checklist_precision_weekly(request: Request):
+    """Percent of true's per rubric key for each ISO week"""
+    view = await read_view("checklist")
+    weeks = await AsyncDatabase("analytics_views").aggregate([
+        {"$match": {"_id": {"$regex": "^checklist:week:"}}}
+    ])
+    return cached_response(request, view, weekly_percent(weeks))
 
 
 @API.post("/keyword-count", tags=["Analysis"])
-async def keyword_count_endpoint(keyword: str):
-    transcript_db = Database("transcripts")
-    return transcript_db.read_keyword_count(keyword)
+def keyword_count_endpoint(keyword: str):
+    return SearchIndex().keyword_count(keyword)
+
+
+@API.get("/keyword-search", tags=["Analysis"])
+def keyword_search_endpoint(query: str, phrase: bool = False):
+    return SearchIndex().search(query, phrase)
+
+
+@API.post("/keyword-search/rebuild", tags=["Operations"])
+def keyword_search_rebuild_endpoint():
+    return {"job_id": get_queue().submit("search")}
+
+
+def turn_source(source: str) -> str:
+    if source not in SOURCE_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(SOURCE_COLLECTIONS)}")
+    return SOURCE_COLLECTIONS[source]
+
+
+@API.get("/talk-ratio", tags=["Analysis"])
+async def talk_ratio_endpoint(start: str = None, end: str = None, source: str = "pdf"):
+    """coach share of the words spoken, overall and per transcript, from `turn_stats`"""
+    rows = await AsyncDatabase(turn_source(source)).aggregate(stats_pipeline(start, end))
+    return talk_ratios(rows)
+
+
+@API.get("/question-count", tags=["Analysis"])
+async def question_count_endpoint(start: str = None, end: str = None, source: str = "pdf"):
+    """questions asked per role, overall and per transcript, from `turn_stats`"""
+    rows = await AsyncDatabase(turn_source(source)).aggregate(stats_pipeline(start, end))
+    return question_counts(rows)
+
+
+@API.get("/keyword-turns", tags=["Analysis"])
+def keyword_turns_endpoint(keyword: str, role: str = None):
+    """turns containing every term of `keyword`, per role"""
+    return TurnStore().keyword_turns(keyword, role)
+
+
+@API.get("/turn-questions", tags=["Analysis"])
+def turn_questions_endpoint(role: str = "lead", source: str = None, limit: int = 1000):
+    return TurnStore().questions(role, source, limit)
+
+
+@API.post("/turns/rebuild", tags=["Operations"])
+def turns_rebuild_endpoint():
+    return {"job_id": get_queue().submit("turns")}
 
 
 @API.get("/questions", tags=["Operations"])
-def questions():
-    questions_db = Database("cluster")
-    return questions_db.read()
+async def questions(request: Request):
+    view = await read_view("clusters")
+    headers = cache_headers(view)
+    if not_modified(headers, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    questions_db = AsyncDatabase("cluster")
+    return JSONResponse(jsonable_encoder(await questions_db.read()), headers=headers)
+
+
+@API.get("/llm-cache", tags=["Operations"])
+def llm_cache_stats():
+    return get_cache().stats()
+
+
+@API.get("/metrics", tags=["Operations"], response_class=PlainTextResponse)
+def metrics_endpoint():
+    """counters and timers of this process in the Prometheus text format"""
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
+
+
+@API.post("/rubric-agreement", tags=["Operations"])
+def rubric_agreement_endpoint(limit: int = 0):
+    """local rubric decisions against the stored LLM checklist labels, as a
+       job since it reads every labelled transcript"""
+    return {"job_id": get_queue().submit("agreement", limit=limit)}
+
+
+@API.get("/pipeline-runs", tags=["Operations"])
+def pipeline_runs_endpoint(pipeline: str = None, limit: int = 20):
+    return RunReport.list(pipeline, limit)
+
+
+@API.get("/pipeline-runs/{run_id}", tags=["Operations"])
+def pipeline_run_endpoint(run_id: str):
+    run = RunReport.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="run not found")
+    return run
 
 
 @API.get("/topic-count", tags=["Analysis"])
-def topics():
-    questions_db = Database("cluster")
-    return questions_db.extract_topic_count()
+async def topics(request: Request):
+    view = await read_view("topics")
+    return cached_response(request, view, topic_counts(view))
+
+
+@API.post("/analytics/rebuild", tags=["Operations"])
+def analytics_rebuild_endpoint():
+    return {"job_id": get_queue().submit("views")}
 
 
 @API.post("/fireflies_upload_pipeline", tags=["Upload"])
-async def fireflies_upload_pipeline_endpoint():
-    ff_pipeline = FirefliesPipeline()
-    ff_pipeline()
+def fireflies_upload_pipeline_endpoint(full: bool = False):
+    return {"job_id": get_queue().submit("fireflies", full=full)}
+
+
+@API.get("/jobs", tags=["Jobs"])
+def jobs_endpoint(status: str = None, limit: int = 50):
+    return get_queue().list(status, limit)
+
+
+@API.get("/jobs/{job_id}", tags=["Jobs"])
+def job_endpoint(job_id: str):
+    job = get_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+@API.post("/jobs/{job_id}/cancel", tags=["Jobs"])
+def cancel_job_endpoint(job_id: str):
+    job = get_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import time
+from functools import lru_cache
+
+import openai
+import requests
+
+
+def _content(result) -> str:
+    return result.get("choices")[0].get("message").get("content")
+
+
+class Backend:
+    """
+    Chat completion backend
+    - `complete` / `acomplete` send one request
+    - `complete_batch` sends many, returning None for failed items
+    - `provider` namespaces cached responses, backends of the same
+      provider share them
+    """
+    provider = "openai"
+
+    def complete(self, messages: list[dict[str, str]], model: str) -> str:
+        raise NotImplementedError
+
+    async def acomplete(self, messages: list[dict[str, str]], model: str) -> str:
+        return await asyncio.to_thread(self.complete, messages, model)
+
+    def complete_batch(self, batch: list[list[dict[str, str]]], model: str) -> list[str | None]:
+        results = []
+        for messages in batch:
+            try:
+                results.append(self.complete(messages, model))
+            except Exception:
+                results.append(None)
+        return results
+
+
+class OpenAIBackend(Backend):
+    """blocking client, one request at a time"""
+
+    def complete(self, messages, model):
+        return _content(openai.ChatCompletion.create(model=model, messages=messages))
+
+
+class AsyncOpenAIBackend(OpenAIBackend):
+    """aiohttp client for concurrent requests from the event loop,
+       sync callers get the blocking client"""
+
+    async def acomplete(self, messages, model):
+        return _content(await openai.ChatCompletion.acreate(model=model, messages=messages))
+
+
+class BatchBackend(Backend):
+    """
+    Submits prompts as batch jobs through the provider's /batches endpoint
+    and polls for the results, for nightly runs that would otherwise be
+    bound by per-request rate limits
+    """
+
+    def __init__(self, poll_interval: float = None, timeout: float = None):
+        self.poll_interval = poll_interval or float(os.getenv("LLM_BATCH_POLL_SECONDS", 30))
+        self.timeout = timeout or float(os.getenv("LLM_BATCH_TIMEOUT_SECONDS", 24 * 3600))
+        self.session = requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self.session.request(
+            method, f"{openai.api_base.rstrip('/')}/{path}",
+            headers={"Authorization": f"Bearer {openai.api_key}"}, **kwargs,
+        )
+        response.raise_for_status()
+        return response
+
+    def submit(self, batch: list[list[dict[str, str]]], model: str) -> str:
+        lines = "\n".join(json.dumps({
+            "custom_id": str(idx),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": model, "messages": messages},
+        }) for idx, messages in enumerate(batch))
+        upload = self._request("POST", "files", data={"purpose": "batch"},
+                               files={"file": ("batch.jsonl", io.BytesIO(lines.encode()))})
+        job = self._request("POST", "batches", json={
+            "input_file_id": upload.json()["id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+        })
+        return job.json()["id"]
+
+    def wait(self, job_id: str) -> dict:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            job = self._request("GET", f"batches/{job_id}").json()
+            if job["status"] in ("completed", "failed", "expired", "cancelled"):
+                return job
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"batch {job_id} still {job['status']}")
+            time.sleep(self.poll_interval)
+
+    def complete_batch(self, batch, model):
+        if not batch:
+            return []
+        job = self.wait(self.submit(batch, model))
+        results = [None] * len(batch)
+        if not job.get("output_file_id"):
+            return results
+        output = self._request("GET", f"files/{job['output_file_id']}/content")
+        for line in output.text.splitlines():
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                results[int(item["custom_id"])] = _content(response["body"])
+        return results
+
+    def complete(self, messages, model):
+        result = self.complete_batch([messages], model)[0]
+        if result is None:
+            raise RuntimeError("batch request failed")
+        return result
+
+
+class StubBackend(Backend):
+    """
+    Deterministic offline backend for load tests and benchmarks,
+    answers in the format each prompt asks for after `latency` seconds
+    """
+    provider = "stub"
+    questions = (
+        "How long is the program?", "Is there a job guarantee?",
+        "How much is tuition?", "Can I study part time?",
+        "When does the next cohort start?", "Do I need to know how to code?",
+    )
+
+    def __init__(self, latency: float = None):
+        self.latency = float(os.getenv("LLM_STUB_LATENCY", 0)) if latency is None else latency
+
+    def respond(self, messages: list[dict[str, str]]) -> str:
+        prompt = "".join(message["content"] for message in messages)
+        digest = hashlib.sha256(prompt.encode()).digest()
+        if "questions from the Lead" in prompt:
+            picked = {self.questions[byte % len(self.questions)]: bool(byte & 1) for byte in digest[:3]}
+            return json.dumps(picked)
+        if "rubric" in prompt:
+            return json.dumps({key: bool(digest[idx] & 1) for idx, key in enumerate("ABCDEFGHI")})
+        return f"Leads asked about {self.questions[digest[0] % len(self.questions)].lower()}"
+
+    def complete(self, messages, model):
+        time.sleep(self.latency)
+        return self.respond(messages)
+
+    async def acomplete(self, messages, model):
+        await asyncio.sleep(self.latency)
+        return self.respond(messages)
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "async": AsyncOpenAIBackend,
+    "batch": BatchBackend,
+    "stub": StubBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: str) -> Backend:
+    return BACKENDS[name]()
+
+
+def function_config(function: str) -> dict[str, str | int]:
+    """
+    Backend, model, concurrency and batch size for one LLM function
+    (`checklist`, `lead_questions`, `summarize`), read from
+    LLM_<FUNCTION>_<SETTING> and falling back to LLM_<SETTING>
+    """
+    def setting(name: str, default):
+        return os.getenv(f"LLM_{function.upper()}_{name}", os.getenv(f"LLM_{name}", default))
+
+    return {
+        "backend": setting("BACKEND", "async"),
+        "model": setting("MODEL", "gpt-4"),
+        "concurrency": int(setting("CONCURRENCY", 8)),
+        "batch_size": int(setting("BATCH_SIZE", 1000)),
+    }
@@ -0,0 +1,218 @@
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from pymongo.errors import OperationFailure
+
+from app.data import Database
+
+
+class LLMCache:
+    """
+    Persistent cache of LLM responses keyed on a hash of the backend
+    provider, the model and the rendered messages (system context + prompt),
+    so stub answers never serve real requests
+    - `ttl` seconds before an entry expires, 0 keeps entries forever
+    - `max_entries` least recently used entries kept, 0 for no limit
+    - `bypass` skips lookups but still stores fresh responses
+    Storage is `MongoCache` or `SQLiteCache`, picked by `get_cache`.
+    """
+    prune_every = 100
+
+    def __init__(self,
+                 ttl: int = None,
+                 max_entries: int = None,
+                 bypass: bool = None):
+        self.ttl = int(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600)) if ttl is None else ttl
+        self.max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 100000)) \
+            if max_entries is None else max_entries
+        self.bypass = os.getenv("LLM_CACHE_BYPASS", "0") == "1" if bypass is None else bypass
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, messages: list[dict[str, str]], provider: str = "openai") -> str:
+        payload = json.dumps({"provider": provider, "model": model, "messages": messages}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        value = None if self.bypass else self._get(key, time.time())
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        self._put(key, value, now)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self._prune(now)
+
+    def prune(self):
+        self._prune(time.time())
+
+    def stats(self) -> dict[str, int | bool]:
+        return {"hits": self.hits, "misses": self.misses, "size": self.size(), "bypass": self.bypass}
+
+    def _get(self, key: str, now: float) -> str | None:
+        """the live value, marking it used at `now`"""
+        raise NotImplementedError
+
+    def _put(self, key: str, value: str, now: float):
+        raise NotImplementedError
+
+    def _prune(self, now: float):
+        """drop expired entries, then the least recently used past `max_entries`"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def size(self) -> int:
+        raise NotImplementedError
+
+
+class MongoCache(LLMCache):
+    """
+    Entries in the `llm_cache` collection, so they outlive restarts and
+    deploys and are shared by every process
+    - a TTL index on `created` expires entries, reads also check `ttl`
+      since the TTL monitor runs about once a minute
+    """
+
+    def __init__(self, collection: str = "llm_cache", **kwargs):
+        super().__init__(**kwargs)
+        self.db = Database(collection)
+        self._indexed = False
+
+    @property
+    def collection(self):
+        if not self._indexed:
+            self.ensure_indexes()
+        return self.db.collection
+
+    def ensure_indexes(self):
+        self._indexed = True
+        collection = self.db.collection
+        collection.create_index("accessed")
+        if not self.ttl:
+            return
+        try:
+            collection.create_index("created", name="created_ttl", expireAfterSeconds=self.ttl)
+        except OperationFailure:
+            # LLM_CACHE_TTL changed since the index was created
+            collection.drop_index("created_ttl")
+            collection.create_index("created", name="created_ttl", expireAfterSeconds=self.ttl)
+
+    def _get(self, key, now):
+        doc = self.collection.find_one_and_update(
+            {"_id": key}, {"$set": {"accessed": datetime.datetime.utcfromtimestamp(now)}},
+            projection={"value": True, "created": True},
+        )
+        if doc is None or (self.ttl and now - doc["created"].replace(tzinfo=datetime.timezone.utc).timestamp()
+                           > self.ttl):
+            return None
+        return doc["value"]
+
+    def _put(self, key, value, now):
+        stamp = datetime.datetime.utcfromtimestamp(now)
+        self.collection.replace_one({"_id": key}, {"value": value, "created": stamp, "accessed": stamp},
+                                    upsert=True)
+
+    def _prune(self, now):
+        if self.ttl:
+            self.collection.delete_many({"created": {"$lt": datetime.datetime.utcfromtimestamp(now - self.ttl)}})
+        if self.max_entries:
+            oldest_kept = list(self.collection.find({}, {"accessed": True})
+                               .sort("accessed", -1).skip(self.max_entries - 1).limit(1))
+            if oldest_kept:
+                self.collection.delete_many({"accessed": {"$lt": oldest_kept[0]["accessed"]}})
+
+    def clear(self):
+        self.collection.delete_many({})
+
+    def size(self):
+        return self.collection.count_documents({})
+
+
+class SQLiteCache(LLMCache):
+    """
+    Entries in a local SQLite file, for development and the benchmarks,
+    a dyno's filesystem does not survive a restart or deploy
+    """
+
+    def __init__(self, path: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path or os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS accessed_idx ON responses (accessed)")
+        self._conn.commit()
+
+    def _get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return row[0]
+
+    def _put(self, key, value, now):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, value, now, now)
+            )
+            self._conn.commit()
+
+    def _prune(self, now):
+        with self._lock:
+            if self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            if self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+CACHES = {
+    "mongo": MongoCache,
+    "sqlite": SQLiteCache,
+}
+
+
+@lru_cache(maxsize=None)
+def get_cache() -> LLMCache:
+    """process-wide cache from `LLM_CACHE` (`mongo` by default), opened on first use"""
+    return CACHES[os.getenv("LLM_CACHE", "mongo")]()
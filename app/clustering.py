@@ -0,0 +1,179 @@
+import pickle
+
+import numpy as np
+from gridfs import GridFS
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import TfidfTransformer
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import normalize
+
+from app.data import Database, get_database
+from app.metrics import get_metrics, stage
+from app.summaries import summarize_clusters
+from app.views import AnalyticsViews, cluster_updates
+from app.utilities import (assign_leaders,
+                           cluster_document,
+                           cluster_topics,
+                           count_terms,
+                           indicator_matrix,
+                           leader_cluster,
+                           topics_by_cluster)
+
+# transcripts whose lead questions have been parsed
+SCORED = {"questions_precision": {"$type": "object"}}
+
+
+class ClusterModel:
+    """
+    Fitted TF-IDF vocabulary and per-cluster centroid sums, kept between runs
+    so new questions can be assigned without reclustering the corpus
+    - `sums` row i is the sum of the normalized rows of cluster `ids[i]`
+    - `vectorizer` is a count + TF-IDF pipeline, models saved with a
+      TfidfVectorizer still load and `transform` the same way
+    - `transcripts` are the filenames whose questions are in the clusters
+    """
+    filename = "cluster_model"
+
+    def __init__(self,
+                 vectorizer: Pipeline,
+                 sums: csr_matrix,
+                 ids: list[int],
+                 distance_threshold: float = 0.6,
+                 transcripts: set[str] = None):
+        self.vectorizer = vectorizer
+        self.sums = sums
+        self.ids = list(ids)
+        self.distance_threshold = distance_threshold
+        self.transcripts = set(transcripts or ())
+
+    @classmethod
+    def fit(cls, questions: list[str],
+            distance_threshold: float = 0.6
+            ) -> tuple["ClusterModel", dict[int, list[str]], dict[int, list[tuple[str, int]]]]:
+        """cluster `questions` from scratch, cluster ids are ranked by size,
+           topics come from the same document-term counts"""
+        counts, terms, counter = count_terms(questions)
+        tfidf = TfidfTransformer()
+        matrix = tfidf.fit_transform(counts)
+        labels, _ = leader_cluster(matrix, distance_threshold)
+        sizes = np.bincount(labels)
+        order = np.argsort(-sizes, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        labels = rank[labels]
+        sums = (indicator_matrix(labels, len(order)) @ matrix).tocsr()
+        clusters = {cluster_id: [] for cluster_id in range(1, len(order) + 1)}
+        for question, label in zip(questions, labels):
+            clusters[int(label) + 1].append(question)
+        topics = dict(zip(clusters, cluster_topics(counts, terms, labels, len(order))))
+        model = cls(make_pipeline(counter, tfidf), sums, range(1, len(order) + 1), distance_threshold)
+        return model, clusters, topics
+
+    def assign(self, questions: list[str]) -> dict[int, list[str]]:
+        """add `questions` to their nearest cluster, or to new clusters past
+           the distance threshold, returning the new members per cluster id"""
+        matrix = self.vectorizer.transform(questions)
+        labels, leaders = assign_leaders(matrix, normalize(self.sums), self.distance_threshold)
+        added = leaders.shape[0] - self.sums.shape[0]
+        next_id = max(self.ids, default=0) + 1
+        self.ids.extend(range(next_id, next_id + added))
+        self.sums = vstack([self.sums, csr_matrix((added, self.sums.shape[1]))]).tocsr()
+        self.sums = (self.sums + indicator_matrix(labels, leaders.shape[0]) @ matrix).tocsr()
+        assigned = {}
+        for question, label in zip(questions, labels):
+            assigned.setdefault(self.ids[label], []).append(question)
+        return assigned
+
+    def save(self):
+        fs = GridFS(get_database(), collection=self.filename)
+        old = [grid_file._id for grid_file in fs.find({"filename": self.filename})]
+        fs.put(pickle.dumps(self), filename=self.filename)
+        for file_id in old:
+            fs.delete(file_id)
+
+    @classmethod
+    def load(cls) -> "ClusterModel | None":
+        fs = GridFS(get_database(), collection=cls.filename)
+        grid_file = fs.find_one({"filename": cls.filename}, sort=[("uploadDate", -1)])
+        return pickle.loads(grid_file.read()) if grid_file is not None else None
+
+
+def _unclustered(transcript_db: Database, query: dict) -> tuple[list, set[str], list[str]]:
+    """(document ids, filenames, questions) of the matching transcripts"""
+    docs = list(transcript_db.collection.find(query, {"filename": True, "questions_precision": True}))
+    questions = [question for doc in docs for question in doc["questions_precision"]]
+    return [doc["_id"] for doc in docs], {doc.get("filename") for doc in docs}, questions
+
+
+def rebuild_clusters() -> dict[str, int]:
+    """recluster every scored question and replace the cluster collection"""
+    transcript_db = Database("transcripts")
+    cluster_db = Database("cluster")
+    doc_ids, filenames, questions = _unclustered(transcript_db, SCORED)
+    if not questions:
+        return {"questions": 0, "clusters": 0}
+    with stage("cluster_fit"):
+        model, clusters, topics = ClusterModel.fit(questions)
+        model.transcripts = filenames
+    with stage("summarize"):
+        summaries = summarize_clusters(clusters, model.vectorizer.transform)
+    results = [
+        cluster_document(cluster_id, value, topics[cluster_id], summaries[cluster_id])
+        for cluster_id, value in clusters.items()
+    ]
+    with stage("mongo_write"):
+        cluster_db.reset()
+        cluster_db.create_all(results)
+        cluster_db.collection.create_index("id", unique=True)
+        AnalyticsViews().rebuild_clusters()
+        model.save()
+        transcript_db.collection.update_many({"_id": {"$in": doc_ids}}, {"$set": {"clustered": True}})
+    get_metrics().inc("clustering_questions_total", len(questions), mode="rebuild")
+    get_metrics().inc("mongo_documents_written_total", len(results), collection="cluster")
+    return {"questions": len(questions), "clusters": len(results)}
+
+
+def update_clusters() -> dict[str, int]:
+    """assign questions from newly scored transcripts to the saved clusters,
+       re-summarizing and upserting only the clusters that changed, a
+       re-ingested transcript still has its old questions in the clusters
+       so it falls back to `rebuild_clusters`"""
+    model = ClusterModel.load()
+    # models saved before `transcripts` was tracked can't tell re-ingested files apart
+    if model is None or getattr(model, "transcripts", None) is None:
+        return rebuild_clusters()
+    transcript_db = Database("transcripts")
+    cluster_db = Database("cluster")
+    doc_ids, filenames, questions = _unclustered(transcript_db, {**SCORED, "clustered": {"$ne": True}})
+    if not questions:
+        return {"questions": 0, "clusters": 0}
+    if filenames & model.transcripts:
+        return rebuild_clusters()
+    with stage("cluster_assign"):
+        assigned = model.assign(questions)
+        model.transcripts |= filenames
+    existing = {
+        doc["id"]: doc
+        for doc in cluster_db.collection.find({"id": {"$in": list(assigned)}},
+                                              {"id": True, "questions": True, "topic": True, "count": True})
+    }
+    members = {
+        cluster_id: existing.get(cluster_id, {}).get("questions", []) + value
+        for cluster_id, value in assigned.items()
+    }
+    topics = topics_by_cluster(members)
+    with stage("summarize"):
+        summaries = summarize_clusters(members, model.vectorizer.transform)
+    results = [
+        cluster_document(cluster_id, value, topics[cluster_id], summaries[cluster_id])
+        for cluster_id, value in members.items()
+    ]
+    with stage("mongo_write"):
+        cluster_db.upsert_all(results, "id")
+        if (views := AnalyticsViews()).built("clusters"):
+            views.apply(cluster_updates(list(existing.values()), results))
+        model.save()
+        transcript_db.collection.update_many({"_id": {"$in": doc_ids}}, {"$set": {"clustered": True}})
+    get_metrics().inc("clustering_questions_total", len(questions), mode="update")
+    get_metrics().inc("mongo_documents_written_total", len(results), collection="cluster")
+    return {"questions": len(questions), "clusters": len(results)}
@@ -1,22 +1,134 @@
+import asyncio
+from functools import lru_cache
 from os import getenv
-from ast import literal_eval
-from typing import Mapping, Any
+from typing import TYPE_CHECKING, Mapping, Any
 
 from dotenv import load_dotenv
 from certifi import where
-from pymongo import MongoClient
-import pandas as pd
+from pymongo import MongoClient, ReplaceOne
 from pymongo.cursor import Cursor
 
-from app.utilities import clean_string
+if TYPE_CHECKING:
+    import pandas as pd
+
+load_dotenv()
+
+
+RUBRIC_KEYS = ("A", "B", "C", "D", "E", "F", "G", "H", "I")
+
+
+def transcript_filter(start: str = None, end: str = None) -> dict:
+    """match on the `date` field ('%Y-%m-%d %H:%M:%S' strings, `end`
+       exclusive), missing arguments are not filtered on"""
+    query = {}
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lt"] = end
+    return query
+
+
+def checklist_percent_pipeline(query: dict) -> list[dict]:
+    return [
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            **{key: {"$sum": {"$cond": [{"$eq": [f"$checklist_precision.{key}", True]}, 1, 0]}}
+               for key in RUBRIC_KEYS},
+        }},
+    ]
+
+
+def checklist_percent(result: dict | None) -> dict[str, float]:
+    if not result or not result["total"]:
+        return {key: 0 for key in RUBRIC_KEYS}
+    return {key: result[key] / result["total"] * 100 for key in RUBRIC_KEYS}
+
+
+TOPIC_COUNT_PIPELINE = [
+    {"$unwind": "$topic"},
+    {"$group": {
+        "_id": {"$arrayElemAt": ["$topic", 0]},
+        "count": {"$sum": {"$arrayElemAt": ["$topic", 1]}},
+    }},
+    {"$sort": {"count": -1, "_id": 1}},
+]
+
+
+def client_options(url: str) -> dict:
+    """
+    Pool, timeout, read preference and write concern settings from
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_READ_PREFERENCE and MONGO_WRITE_CONCERN (w: a number or "majority")
+    """
+    socket_timeout = getenv("MONGO_SOCKET_TIMEOUT_MS")
+    options = {
+        "maxPoolSize": int(getenv("MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(getenv("MONGO_MIN_POOL_SIZE", 0)),
+        "connectTimeoutMS": int(getenv("MONGO_CONNECT_TIMEOUT_MS", 10000)),
+        "serverSelectionTimeoutMS": int(getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+        "socketTimeoutMS": int(socket_timeout) if socket_timeout else None,
+        "readPreference": getenv("MONGO_READ_PREFERENCE", "primary"),
+    }
+    if w := getenv("MONGO_WRITE_CONCERN"):
+        options["w"] = int(w) if w.isdigit() else w
+    if url and (url.startswith("mongodb+srv://") or "tls=true" in url.lower() or "ssl=true" in url.lower()):
+        options["tlsCAFile"] = where()
+    return options
+
+
+def is_mock(url: str | None) -> bool:
+    return bool(url) and url.startswith("mongomock://")
+
+
+@lru_cache(maxsize=None)
+def get_client() -> MongoClient:
+    """
+    Process-wide client created on first use, so importing the app needs
+    no network, `mongomock://` runs against an in-memory server with
+    GridFS support for the saved cluster model
+    """
+    url = getenv("MONGO_URL")
+    if is_mock(url):
+        import mongomock
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration()
+        return mongomock.MongoClient()
+    return MongoClient(url, connect=False, **client_options(url))
+
+
+@lru_cache(maxsize=None)
+def get_async_client():
+    """Motor client sharing the settings of `get_client`"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    url = getenv("MONGO_URL")
+    return AsyncIOMotorClient(url, **client_options(url))
+
+
+def get_database():
+    if Database.database is not None:
+        return Database.database
+    return get_client()[getenv("MONGO_DB", "DB_NAME")]
 
 
 class Database:
-    load_dotenv()
-    database = MongoClient(getenv("MONGO_URL"), tlsCAFile=where())["DB_NAME"]
+    # set to a pymongo / mongomock database to override the shared client
+    database = None
 
     def __init__(self, collection: str):
-        self.collection = self.database[collection]
+        self.name = collection
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_database()[self.name]
+        return self._collection
 
     def count(self) -> int:
         return self.collection.count_documents({})
@@ -24,8 +136,26 @@ class Database:
     def create(self, data: dict = None):
         return self.collection.insert_one(data)
 
-    def create_all(self, data):
-        return self.collection.insert_many(data)
+    def create_all(self, data, ordered: bool = True):
+        return self.collection.insert_many(data, ordered=ordered)
+
+    def upsert_all(self, data: list[dict], key: str):
+        """replace documents matching on `key`, inserting the ones not found"""
+        return self.collection.bulk_write(
+            [ReplaceOne({key: doc[key]}, doc, upsert=True) for doc in data],
+            ordered=False,
+        )
+
+    def remove_duplicates(self, key: str):
+        """keep the first document for each value of `key`"""
+        duplicates = self.collection.aggregate([
+            {"$group": {"_id": f"${key}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+        extra = [_id for group in duplicates for _id in group["ids"][1:]]
+        if extra:
+            self.collection.delete_many({"_id": {"$in": extra}})
+        return len(extra)
 
     def read(self, data: dict = None) -> Cursor[Mapping[str, Any] | Any]:
         return self.collection.find(data or {}, {"_id": False})
@@ -35,38 +165,29 @@ class Database:
            objs from all transcripts"""
         return self.collection.find({}, {"_id": False, "checklist_precision": True})
 
-    def read_checklist_precision_percent(self) -> dict:
+    def read_checklist_precision_percent(self, start: str = None, end: str = None) -> dict:
         """return dict of checklist_precision keys and percent of
-           true's for each key from all transcripts"""
-        output = {"A": 0, "B": 0, "C": 0, "D": 0, "E": 0,
-                  "F": 0, "G": 0, "H": 0, "I": 0}
-        for obj in self.collection.find({}, {"_id": False, "checklist_precision": True}):
-            for key in output.keys():
-                if obj['checklist_precision'][key]:
-                    output[key] += 1
-        for key in output.keys():
-            output[key] = output[key] / self.count() * 100
-        return output
+           true's for each key from all transcripts, in one aggregation"""
+        query = transcript_filter(start, end)
+        result = next(self.collection.aggregate(checklist_percent_pipeline(query)), None)
+        return checklist_percent(result)
 
     def read_keyword_count(self, keyword: str) -> int:
-        """check to see if keyword in transcript text and
-        return number of times keyword appears"""
+        """full scan fallback for `SearchIndex.keyword_count`,
+        return number of times keyword appears in transcript text"""
+        keyword = keyword.lower()
         count = 0
         for obj in self.collection.find({}, {"_id": False, "transcripts": True}):
             for transcript in obj['transcripts']:
-                if keyword in transcript.lower():
-                    count += 1
+                count += transcript.lower().count(keyword)
         return count
 
     def extract_topic_count(self) -> dict:
-        output = {}
-        for obj in self.collection.find({}, {"_id": False}):
-            for key, value in obj["topic"]:
-                if key in output.keys():
-                    output[key] += value
-                else:
-                    output[key] = value
-        return dict(sorted(output.items(), key=lambda x: x[1], reverse=True))
+        return {doc["_id"]: doc["count"] for doc in self.collection.aggregate(TOPIC_COUNT_PIPELINE)}
+
+    def ensure_analytics_indexes(self):
+        """supports the date filter of the transcript analytics"""
+        self.collection.create_index([("date", 1)])
 
     def delete(self, data: dict):
         return self.collection.delete_one(data)
@@ -74,19 +195,62 @@ class Database:
     def reset(self):
         return self.collection.delete_many({})
 
-    def dataframe(self) -> pd.DataFrame:
+    def dataframe(self) -> "pd.DataFrame":
+        import pandas as pd
+
         return pd.DataFrame(self.collection.find({}, {"_id": False}))
 
-    def change_type(self, field: str):
-        docs = self.collection.find({})
-        for doc in docs:
-            old_value = doc[field]
-            if type(old_value) == str:
-                new_value = literal_eval(clean_string(old_value))
-                self.collection.update_one(
-                    {"_id": doc["_id"]},
-                    {"$set": {field: new_value}}
-                )
+
+class AsyncDatabase:
+    """
+    Async counterpart of `Database` for the API's read endpoints, on Motor
+    with a real server and on a worker thread with an overridden or
+    `mongomock://` database
+    """
+
+    def __init__(self, collection: str):
+        self.name = collection
+        self._collection = None
+
+    @staticmethod
+    def is_sync() -> bool:
+        return Database.database is not None or is_mock(getenv("MONGO_URL"))
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_async_client()[getenv("MONGO_DB", "DB_NAME")][self.name]
+        return self._collection
+
+    async def count(self, data: dict = None) -> int:
+        if self.is_sync():
+            return await asyncio.to_thread(Database(self.name).collection.count_documents, data or {})
+        return await self.collection.count_documents(data or {})
+
+    async def read(self, data: dict = None, projection: dict = None, limit: int = 0) -> list[dict]:
+        projection = {"_id": False, **(projection or {})}
+        if self.is_sync():
+            return await asyncio.to_thread(
+                lambda: list(Database(self.name).collection.find(data or {}, projection).limit(limit))
+            )
+        return await self.collection.find(data or {}, projection).to_list(limit or None)
+
+    async def read_one(self, data: dict) -> dict | None:
+        if self.is_sync():
+            return await asyncio.to_thread(Database(self.name).collection.find_one, data)
+        return await self.collection.find_one(data)
+
+    async def aggregate(self, pipeline: list[dict]) -> list[dict]:
+        if self.is_sync():
+            return await asyncio.to_thread(lambda: list(Database(self.name).collection.aggregate(pipeline)))
+        return await self.collection.aggregate(pipeline).to_list(None)
+
+    async def read_checklist_precision_percent(self, start: str = None, end: str = None) -> dict:
+        results = await self.aggregate(checklist_percent_pipeline(transcript_filter(start, end)))
+        return checklist_percent(results[0] if results else None)
+
+    async def extract_topic_count(self) -> dict:
+        return {doc["_id"]: doc["count"] for doc in await self.aggregate(TOPIC_COUNT_PIPELINE)}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,158 @@
+import json
+from typing import Iterable, Iterator
+
+from app.data import Database, transcript_filter
+
+EXPORT_COLLECTIONS = ("transcripts", "summaries", "cluster")
+# collections with the `date` ingest sets, clusters span many calls
+DATED_COLLECTIONS = ("transcripts", "summaries")
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def iter_batches(collection: str,
+                 fields: list[str] = None,
+                 start: str = None,
+                 end: str = None,
+                 batch_size: int = 1000) -> Iterator[list[dict]]:
+    """documents of `collection` in lists of `batch_size`, only `fields`
+       when given, `start` / `end` filter on the `date` field"""
+    if (start or end) and collection not in DATED_COLLECTIONS:
+        raise ValueError(f"{collection} has no date, start / end apply to {', '.join(DATED_COLLECTIONS)}")
+    projection = {"_id": False, **{field: True for field in fields or []}}
+    cursor = Database(collection).collection.find(
+        transcript_filter(start, end), projection, batch_size=batch_size
+    )
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_ndjson(batches: Iterable[list[dict]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(json.dumps(doc, default=str) + "\n" for doc in batch).encode()
+
+
+class _Chunks:
+    """write-only sink that hands written bytes back to a generator"""
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _cell(value):
+    """nested values have per-document shapes, they are carried as JSON
+       strings so every batch fits the first one's schema"""
+    if isinstance(value, dict) or (isinstance(value, list) and any(isinstance(v, (dict, list)) for v in value)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def _array(values: list, data_type):
+    """values that don't fit the column type become null, or strings
+       for a string column"""
+    import pyarrow as pa
+
+    try:
+        return pa.array(values, type=data_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if pa.types.is_string(data_type):
+            return pa.array([None if value is None else str(value) for value in values], type=data_type)
+        fitted = []
+        for value in values:
+            try:
+                pa.array([value], type=data_type)
+                fitted.append(value)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                fitted.append(None)
+        return pa.array(fitted, type=data_type)
+
+
+def _table(batch: list[dict], schema):
+    """(table, schema) of one batch, the schema is inferred from the first
+       batch, all-null columns there are typed as strings"""
+    import pyarrow as pa
+
+    rows = [{key: _cell(value) for key, value in doc.items()} for doc in batch]
+    if schema is None:
+        schema = pa.schema([
+            field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+            for field in pa.Table.from_pylist(rows).schema
+        ])
+    columns = [_array([row.get(field.name) for row in rows], field.type) for field in schema]
+    return pa.Table.from_arrays(columns, schema=schema), schema
+
+
+def iter_parquet(batches: Iterable[list[dict]]) -> Iterator[bytes]:
+    """one Parquet row group per batch, the schema comes from the first batch
+       and later documents' extra fields are dropped"""
+    import pyarrow.parquet as pq
+
+    sink, writer, schema = _Chunks(), None, None
+    for batch in batches:
+        table, schema = _table(batch, schema)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        writer.write_table(table, row_group_size=len(batch))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def iter_arrow(batches: Iterable[list[dict]]) -> Iterator[bytes]:
+    """Arrow IPC stream, one record batch per batch"""
+    import pyarrow as pa
+
+    sink, writer, schema = _Chunks(), None, None
+    for batch in batches:
+        table, schema = _table(batch, schema)
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+WRITERS = {"ndjson": iter_ndjson, "parquet": iter_parquet, "arrow": iter_arrow}
+
+
+def export(collection: str,
+           output: str = "ndjson",
+           fields: list[str] = None,
+           start: str = None,
+           end: str = None,
+           batch_size: int = 1000) -> Iterator[bytes]:
+    """stream `collection` as NDJSON, Parquet or an Arrow IPC stream"""
+    return WRITERS[output](iter_batches(collection, fields, start, end, batch_size))
@@ -0,0 +1,118 @@
+import datetime
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from app.queries import read_all_query
+
+
+def iso_date(timestamp_ms: int) -> str:
+    """Fireflies `date` (epoch milliseconds) as the DateTime `fromDate` expects"""
+    date_obj = datetime.datetime.fromtimestamp(timestamp_ms / 1000, tz=datetime.timezone.utc)
+    return date_obj.isoformat(timespec="milliseconds")
+
+
+def build_turns(sentences: Iterable[dict], timing: bool = False) -> list[dict]:
+    """
+    Collapse consecutive sentences of one speaker into a turn in one pass,
+    sentence fields are read by name so extra fields are ignored
+    - turn: `speaker`, `text`
+    - with `timing`: also `start_time`, `end_time` and `words`
+    """
+    turns = []
+    parts = []
+    speaker = start_time = end_time = None
+    words = 0
+
+    def flush():
+        turn = {"speaker": speaker, "text": " ".join(parts)}
+        if timing:
+            turn.update(start_time=start_time, end_time=end_time, words=words)
+        turns.append(turn)
+
+    for sentence in sentences:
+        name = sentence.get("speaker_name") or sentence.get("speaker_id")
+        text = sentence.get("text") or ""
+        if name != speaker or not parts:
+            if parts:
+                flush()
+            speaker, parts, words = name, [], 0
+            start_time = sentence.get("start_time")
+        parts.append(text)
+        if timing:
+            end_time = sentence.get("end_time", sentence.get("start_time"))
+            words += len(text.split())
+    if parts:
+        flush()
+    return turns
+
+
+def turns_text(turns: list[dict]) -> str:
+    return "|".join(f"Speaker {turn['speaker']}: {turn['text']}" for turn in turns)
+
+
+class FirefliesClient:
+    """
+    Paginated reader for the Fireflies GraphQL API
+    - one pooled session, 429/5xx retried with backoff
+    - `concurrency` pages of `page_size` transcripts in flight at once,
+      yielded in order so callers can checkpoint after every page
+    """
+
+    def __init__(self,
+                 url: str = None,
+                 key: str = None,
+                 page_size: int = None,
+                 concurrency: int = None,
+                 timeout: float = 60):
+        self.url = url or os.getenv("GRAPHQL_URL")
+        self.page_size = page_size or int(os.getenv("FIREFLIES_PAGE_SIZE", 50))
+        self.concurrency = concurrency or int(os.getenv("FIREFLIES_CONCURRENCY", 4))
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {key or os.getenv('GRAPHQL_KEY')}",
+            "Content-Type": "application/json",
+        })
+        retry = Retry(total=5, backoff_factor=1, allowed_methods=None,
+                      status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_maxsize=self.concurrency, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch_page(self, skip: int, from_date: str = None) -> list[dict]:
+        response = self.session.post(self.url, timeout=self.timeout, json={
+            "query": read_all_query,
+            "variables": {"limit": self.page_size, "skip": skip, "fromDate": from_date},
+        })
+        response.raise_for_status()
+        body = response.json()
+        if body.get("errors"):
+            raise RuntimeError(f"fireflies query failed: {body['errors']}")
+        return body.get("data", {}).get("transcripts") or []
+
+    def iter_pages(self, from_date: str = None, skip: int = 0) -> Iterator[tuple[int, list[dict]]]:
+        """(skip of the following page, page) until the first short page"""
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            futures = deque()
+            next_skip = skip
+            for _ in range(self.concurrency):
+                futures.append(pool.submit(self.fetch_page, next_skip, from_date))
+                next_skip += self.page_size
+            try:
+                while futures:
+                    page = futures.popleft().result()
+                    skip += self.page_size
+                    yield skip, page
+                    if len(page) < self.page_size:
+                        break
+                    futures.append(pool.submit(self.fetch_page, next_skip, from_date))
+                    next_skip += self.page_size
+            finally:
+                for future in futures:
+                    future.cancel()
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Callable
+
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from app.data import Database
+from app.metrics import get_metrics, record, stage
+from app.search import SearchIndex
+from app.turns import TurnStore, turn_storage_enabled
+from app.utilities import pdf_date, read_summary, iter_transcript_turns
+from app.views import TRANSCRIPT_FIELDS, AnalyticsViews, checklist_updates
+
+
+def stream_sha256(stream: BinaryIO, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    while chunk := stream.read(chunk_size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return stream_sha256(f)
+
+
+def parse_source_file(path: str) -> tuple[str, dict]:
+    """parse one file from source_data into (collection name, document),
+       `date` is when the call's PDF was created"""
+    file = os.path.basename(path)
+    if "summary" in file:
+        data = read_summary(path)
+        data["filename"] = file
+        data["date"] = pdf_date(path)
+        return "summaries", data
+    return "transcripts", {
+        "filename": file,
+        "date": pdf_date(path),
+        "transcripts": list(iter_transcript_turns(path)),
+    }
+
+
+def _parse_isolated(task: tuple[str, str | None]) -> tuple[str, str | None, dict | None, str | None, float]:
+    """runs in a worker process: hash the file, parse it only if the hash
+       differs from the manifest, a bad PDF comes back as an error
+       instead of breaking the pool, the last item is the parse time"""
+    path, known_hash = task
+    start = time.perf_counter()
+    try:
+        sha256 = file_sha256(path)
+        if sha256 == known_hash:
+            return sha256, None, None, None, time.perf_counter() - start
+        collection, doc = parse_source_file(path)
+        doc["sha256"] = sha256
+        return sha256, collection, doc, None, time.perf_counter() - start
+    except Exception as error:
+        return None, None, None, repr(error), time.perf_counter() - start
+
+
+def ensure_indexes():
+    """unique filename per collection so re-ingesting upserts instead of duplicating"""
+    manifest = Database("manifest")
+    manifest.collection.create_index("filename", unique=True)
+    manifest.collection.create_index("sha256")
+    for collection in ("transcripts", "summaries"):
+        db = Database(collection)
+        try:
+            db.collection.create_index("filename", unique=True)
+        except OperationFailure:
+            db.remove_duplicates("filename")
+            db.collection.create_index("filename", unique=True)
+    Database("transcripts").ensure_analytics_indexes()
+    SearchIndex().ensure_indexes()
+    if turn_storage_enabled():
+        TurnStore().ensure_indexes()
+
+
+class BatchWriter:
+    """buffers documents per collection and flushes them as unordered
+       upserts of `batch_size`, recording each written file in the manifest,
+       transcripts are split into the `turns` collection with TURN_STORAGE=1"""
+
+    def __init__(self, batch_size: int, report: dict):
+        self.batch_size = batch_size
+        self.report = report
+        self.turns = TurnStore() if turn_storage_enabled() else None
+        self.batches = {"transcripts": [], "summaries": []}
+        self.entries = []
+
+    def add(self, collection: str, doc: dict, entry: dict):
+        self.batches[collection].append((doc, entry))
+        if len(self.batches[collection]) >= self.batch_size:
+            self.flush(collection)
+
+    def record(self, entry: dict):
+        self.entries.append(entry)
+        if len(self.entries) >= self.batch_size:
+            self.flush_manifest()
+
+    def flush(self, collection: str):
+        batch = self.batches[collection]
+        if not batch:
+            return
+        self.batches[collection] = []
+        replaced = self.scored(collection, batch)
+        failed = set()
+        try:
+            with stage("mongo_write"):
+                if collection == "transcripts" and self.turns is not None:
+                    self.turns.add_transcripts([doc for doc, _ in batch])
+                Database(collection).upsert_all([doc for doc, _ in batch], "filename")
+        except BulkWriteError as error:
+            for write_error in error.details.get("writeErrors", []):
+                failed.add(write_error["index"])
+                self.report["failed"].append({
+                    "filename": batch[write_error["index"]][0].get("filename"),
+                    "error": write_error.get("errmsg"),
+                })
+        self.report[collection] += len(batch) - len(failed)
+        get_metrics().inc("mongo_documents_written_total", len(batch) - len(failed), collection=collection)
+        written = [(doc, entry) for idx, (doc, entry) in enumerate(batch) if idx not in failed]
+        if collection == "transcripts" and written:
+            SearchIndex().add([doc for doc, _ in written])
+            # the replacement drops the checklist, the views lose it until rescored
+            AnalyticsViews().apply([
+                update for doc, _ in written if (old := replaced.get(doc["filename"]))
+                for update in checklist_updates(old, old["checklist_precision"], None)
+            ])
+        for _, entry in written:
+            self.record(entry)
+
+    @staticmethod
+    def scored(collection: str, batch: list[tuple[dict, dict]]) -> dict[str, dict]:
+        """filename -> stored transcript of the batch that has a checklist,
+           none before the views exist, their first read counts from scratch"""
+        if collection != "transcripts" or not AnalyticsViews().built("checklist"):
+            return {}
+        return {
+            doc["filename"]: doc for doc in Database(collection).collection.find(
+                {"filename": {"$in": [doc["filename"] for doc, _ in batch]},
+                 "checklist_precision": {"$type": "object"}},
+                {"filename": True, **TRANSCRIPT_FIELDS},
+            )
+        }
+
+    def flush_manifest(self):
+        if self.entries:
+            with stage("mongo_write"):
+                Database("manifest").upsert_all(self.entries, "filename")
+            get_metrics().inc("mongo_documents_written_total", len(self.entries), collection="manifest")
+            self.entries = []
+
+    def close(self):
+        for collection in self.batches:
+            self.flush(collection)
+        self.flush_manifest()
+
+
+def ingest_directory(dir_fp: str = "source_data",
+                     workers: int = None,
+                     batch_size: int = None,
+                     progress: Callable[[dict], None] = None) -> dict:
+    """
+    Parse new or changed files in `dir_fp` across `workers` processes
+    and upsert them into the transcripts and summaries collections
+    - unchanged size and mtime in the manifest: skipped without reading
+    - changed stat but same content hash: manifest refreshed, not parsed
+    - `progress` gets the running report after every file, an exception
+      from it stops the run after flushing what was already parsed
+    """
+    workers = workers or int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+    batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", 500))
+    ensure_indexes()
+    manifest = {entry["filename"]: entry for entry in Database("manifest").read()}
+    report = {"transcripts": 0, "summaries": 0, "unchanged": 0, "failed": []}
+    writer = BatchWriter(batch_size, report)
+
+    tasks, stats = [], []
+    for entry in os.scandir(dir_fp):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        known = manifest.get(entry.name, {})
+        if known.get("size") == stat.st_size and known.get("mtime") == stat.st_mtime:
+            report["unchanged"] += 1
+            continue
+        tasks.append((entry.path, known.get("sha256")))
+        stats.append({"filename": entry.name, "size": stat.st_size, "mtime": stat.st_mtime})
+
+    if workers == 1 or len(tasks) < 2:
+        results = map(_parse_isolated, tasks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(workers)
+        results = pool.map(_parse_isolated, tasks, chunksize=max(1, len(tasks) // (workers * 8)))
+    report["total"] = len(tasks) + report["unchanged"]
+    metrics = get_metrics()
+    try:
+        for entry, (sha256, collection, doc, error, seconds) in zip(stats, results):
+            metrics.observe("pdf_parse_seconds", seconds)
+            metrics.inc("pdf_files_total", outcome="failed" if error else "unchanged" if doc is None else "parsed")
+            record("pdf_parse", seconds)
+            if error is not None:
+                report["failed"].append({"filename": entry["filename"], "error": error})
+            elif doc is None:
+                report["unchanged"] += 1
+                writer.record({**entry, "sha256": sha256})
+            else:
+                writer.add(collection, doc, {**entry, "sha256": sha256})
+            if progress:
+                progress(report)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        writer.close()
+    return report
@@ -0,0 +1,251 @@
+import datetime
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable
+
+from app.data import Database
+from app.metrics import RunReport
+from app.views import AnalyticsViews
+
+ACTIVE = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    """raised from a progress callback once a cancel was requested"""
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Job:
+    """
+    Handle a running task reports through
+    - `progress(report)` stores the task's running report (counts and
+      per-item `failed` errors) at most every `interval` seconds and
+      raises JobCancelled once a cancel was requested, from any process
+    """
+
+    def __init__(self, job_id: str, collection, interval: float = 1.0):
+        self.id = job_id
+        self.collection = collection
+        self.interval = interval
+        self.cancel_event = threading.Event()
+        self._written = 0.0
+
+    def progress(self, report: dict, force: bool = False):
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+        if not force and time.monotonic() - self._written < self.interval:
+            return
+        self._written = time.monotonic()
+        doc = self.collection.find_one_and_update(
+            {"_id": self.id},
+            {"$set": {"progress": report, "updated": _now()}},
+            projection={"cancel_requested": True},
+        )
+        if doc and doc.get("cancel_requested"):
+            self.cancel_event.set()
+            raise JobCancelled(self.id)
+
+
+class JobQueue:
+    """
+    Runs long pipeline tasks on a local thread pool so request handlers
+    return a job id at once, job records live in the `jobs` collection
+    - statuses: queued, running, succeeded, failed, cancelled, interrupted
+    - tasks are `TASKS[name](job, **params)` and return a JSON-able result
+    - every `heartbeat` seconds the queue stamps `updated` on its active
+      jobs, an active job not stamped for `stale_after` seconds belongs to
+      a process that is gone, whichever host or dyno ran it
+    """
+    db = Database("jobs")
+
+    def __init__(self, workers: int = None, heartbeat: float = None, stale_after: float = None):
+        self.workers = workers or int(os.getenv("JOB_WORKERS", 2))
+        self.heartbeat = heartbeat or float(os.getenv("JOB_HEARTBEAT_SECONDS", 30))
+        self.stale_after = stale_after or float(os.getenv("JOB_STALE_SECONDS", 300))
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        self.running: dict[str, Job] = {}
+        self.host = socket.gethostname()
+        self.db.collection.create_index([("status", 1), ("created", -1)])
+        self.recover()
+        threading.Thread(target=self._beat, name="job-heartbeat", daemon=True).start()
+
+    def _dead(self, doc: dict, stale: datetime.datetime) -> bool:
+        if doc["_id"] in self.running:
+            return False
+        if (doc.get("updated") or doc["created"]) < stale:
+            return True
+        # a restart on the same host is caught before the heartbeat goes stale
+        return doc.get("host") == self.host and doc.get("pid") != os.getpid() and not _alive(doc.get("pid", 0))
+
+    def recover(self):
+        """mark jobs left queued or running by a process that is gone as interrupted"""
+        stale = _now() - datetime.timedelta(seconds=self.stale_after)
+        for doc in self.db.collection.find({"status": {"$in": list(ACTIVE)}},
+                                           {"host": True, "pid": True, "created": True, "updated": True}):
+            if not self._dead(doc, stale):
+                continue
+            self.db.collection.update_one(
+                {"_id": doc["_id"], "status": {"$in": list(ACTIVE)}},
+                {"$set": {"status": "interrupted", "finished": _now()}},
+            )
+
+    def _beat(self):
+        while True:
+            time.sleep(self.heartbeat)
+            try:
+                if self.running:
+                    self.db.collection.update_many(
+                        {"_id": {"$in": list(self.running)}, "status": {"$in": list(ACTIVE)}},
+                        {"$set": {"updated": _now()}},
+                    )
+                self.recover()
+            except Exception:
+                # Mongo unreachable, try again on the next beat
+                continue
+
+    def submit(self, task: str, **params) -> str:
+        if task not in TASKS:
+            raise KeyError(task)
+        job_id = uuid.uuid4().hex
+        self.db.collection.insert_one({
+            "_id": job_id,
+            "task": task,
+            "params": params,
+            "status": "queued",
+            "host": self.host,
+            "pid": os.getpid(),
+            "created": _now(),
+            "updated": _now(),
+            "progress": {},
+            "result": None,
+            "error": None,
+        })
+        job = Job(job_id, self.db.collection)
+        self.running[job_id] = job
+        self.executor.submit(self._run, job, TASKS[task], params)
+        return job_id
+
+    def _finish(self, job: Job, status: str, **fields):
+        self.db.collection.update_one(
+            {"_id": job.id}, {"$set": {"status": status, "finished": _now(), **fields}}
+        )
+        self.running.pop(job.id, None)
+
+    def _run(self, job: Job, task: Callable, params: dict):
+        """the task runs inside a RunReport, its id is kept as the job's `run_id`"""
+        claimed = self.db.collection.find_one_and_update(
+            {"_id": job.id, "status": "queued", "cancel_requested": {"$ne": True}},
+            {"$set": {"status": "running", "started": _now()}},
+        )
+        if claimed is None:
+            return self._finish(job, "cancelled")
+        with RunReport(claimed["task"], job_id=job.id) as run:
+            try:
+                result = task(job, **params)
+            except JobCancelled:
+                run.status = "cancelled"
+                self._finish(job, "cancelled", run_id=run.id)
+            except Exception as error:
+                run.status, run.error = "failed", repr(error)
+                self._finish(job, "failed", run_id=run.id, error=repr(error), traceback=traceback.format_exc())
+            else:
+                self._finish(job, "succeeded", run_id=run.id, result=result)
+
+    def get(self, job_id: str) -> dict | None:
+        return self.db.collection.find_one({"_id": job_id}, {"traceback": False, "host": False, "pid": False})
+
+    def list(self, status: str = None, limit: int = 50) -> list[dict]:
+        query = {"status": status} if status else {}
+        return list(self.db.collection.find(
+            query, {"traceback": False, "host": False, "pid": False}
+        ).sort("created", -1).limit(limit))
+
+    def cancel(self, job_id: str) -> dict | None:
+        """a queued job never starts, a running one stops at its next progress report"""
+        if job_id in self.running:
+            self.running[job_id].cancel_event.set()
+        self.db.collection.update_one(
+            {"_id": job_id, "status": {"$in": list(ACTIVE)}}, {"$set": {"cancel_requested": True}}
+        )
+        self.db.collection.update_one(
+            {"_id": job_id, "status": "queued"}, {"$set": {"status": "cancelled", "finished": _now()}}
+        )
+        return self.get(job_id)
+
+
+@lru_cache(maxsize=None)
+def get_queue() -> JobQueue:
+    return JobQueue()
+
+
+# task modules pull in pypdf, scikit-learn and openai, they are imported
+# when a job runs so starting the API stays fast
+
+def ingest_task(job: Job, dir_fp: str = "source_data") -> dict:
+    from app.pipeline import PDFPipeline
+    return PDFPipeline().push_raw_to_mongo(dir_fp, progress=job.progress)
+
+
+def score_task(job: Job, batched: bool = False) -> dict:
+    from app.pipeline import PDFPipeline
+    return PDFPipeline().add_precision_data(batched, progress=job.progress)
+
+
+def cluster_task(job: Job, incremental: bool = False) -> dict:
+    from app.pipeline import PDFPipeline
+    return PDFPipeline().cluster_analysis(incremental)
+
+
+def fireflies_task(job: Job, full: bool = False) -> dict:
+    from app.pipeline import FirefliesPipeline
+    return FirefliesPipeline()(full, progress=job.progress)
+
+
+def search_task(job: Job) -> dict:
+    from app.search import SearchIndex
+    return {"indexed": SearchIndex().rebuild()}
+
+
+def turns_task(job: Job) -> dict:
+    from app.turns import TurnStore
+    return {"transcripts": TurnStore().rebuild()}
+
+
+def agreement_task(job: Job, limit: int = 0) -> dict:
+    from app.rubric import agreement
+    return agreement(Database("transcripts").collection, limit, progress=job.progress)
+
+
+def views_task(job: Job) -> dict:
+    return AnalyticsViews().rebuild()
+
+
+TASKS = {
+    "ingest": ingest_task,
+    "score": score_task,
+    "cluster": cluster_task,
+    "fireflies": fireflies_task,
+    "views": views_task,
+    "turns": turns_task,
+    "search": search_task,
+    "agreement": agreement_task,
+}
@@ -0,0 +1,346 @@
+import datetime
+import io
+import os
+import resource
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Iterator
+
+from app.data import Database
+
+# cProfile, pstats and tracemalloc are imported when a stage is profiled
+
+Labels = tuple[tuple[str, str], ...]
+
+# tracemalloc is process-wide: memory-profiled stages of concurrent runs
+# share one tracing session, stopped when the last of them ends
+_tracing_lock = threading.Lock()
+_tracing_stages = 0
+_tracing_started = False
+
+
+def _start_tracing():
+    global _tracing_stages, _tracing_started
+    import tracemalloc
+
+    with _tracing_lock:
+        if _tracing_stages == 0:
+            # tracing someone else started is left running
+            _tracing_started = not tracemalloc.is_tracing()
+            if _tracing_started:
+                tracemalloc.start()
+        _tracing_stages += 1
+        tracemalloc.reset_peak()
+
+
+def _stop_tracing():
+    global _tracing_stages
+    import tracemalloc
+
+    with _tracing_lock:
+        _tracing_stages -= 1
+        if _tracing_stages == 0 and _tracing_started:
+            tracemalloc.stop()
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _render_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def max_rss_bytes() -> int:
+    """high-water resident set size of this process"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Metrics:
+    """
+    Process-wide counters, gauges and timers, rendered in the Prometheus
+    text format for `/metrics`
+    - `inc(name, amount, **labels)`: counter, name it `<something>_total`
+    - `observe(name, seconds, **labels)`: timer, exposed as a summary with
+      `_count` and `_sum`
+    - `set(name, value, **labels)`: gauge
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.timers: dict[tuple[str, Labels], list[float]] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = name, _labels(labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[name, _labels(labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = name, _labels(labels)
+        with self._lock:
+            count_sum = self.timers.setdefault(key, [0, 0.0])
+            count_sum[0] += 1
+            count_sum[1] += seconds
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "timers": {key: tuple(value) for key, value in self.timers.items()},
+            }
+
+    def render(self) -> str:
+        self.set("process_max_resident_memory_bytes", max_rss_bytes())
+        with self._lock:
+            counters, gauges = dict(self.counters), dict(self.gauges)
+            timers = {key: tuple(value) for key, value in self.timers.items()}
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for name, _ in series}):
+                lines.append(f"# TYPE {name} {kind}")
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name == name:
+                        lines.append(f"{name}{_render_labels(labels)} {_number(value)}")
+        for name in sorted({name for name, _ in timers}):
+            lines.append(f"# TYPE {name} summary")
+            for (series_name, labels), (count, total) in sorted(timers.items()):
+                if series_name == name:
+                    lines.append(f"{name}_count{_render_labels(labels)} {_number(count)}")
+                    lines.append(f"{name}_sum{_render_labels(labels)} {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=None)
+def get_metrics() -> Metrics:
+    return Metrics()
+
+
+def _delta(before: dict, after: dict) -> dict[str, list[dict]]:
+    """what the process-wide metrics gained between two snapshots"""
+    counters = [
+        {"metric": name, "labels": dict(labels), "value": value - before["counters"].get((name, labels), 0)}
+        for (name, labels), value in sorted(after["counters"].items())
+        if value != before["counters"].get((name, labels), 0)
+    ]
+    timers = []
+    for (name, labels), (count, total) in sorted(after["timers"].items()):
+        old_count, old_total = before["timers"].get((name, labels), (0, 0.0))
+        if count != old_count:
+            timers.append({"metric": name, "labels": dict(labels),
+                           "count": count - old_count, "seconds": round(total - old_total, 6)})
+    return {"counters": counters, "timers": timers}
+
+
+_current_run: ContextVar["RunReport | None"] = ContextVar("run_report", default=None)
+
+
+class RunReport:
+    """
+    Structured report of one pipeline or job run, saved to `pipeline_runs`
+    when the `with` block exits
+    - `stage(name)` adds the block's time to the stage, a stage entered
+      again (one per page, one per batch) accumulates `seconds` and `calls`
+    - `status` is `failed` when the block raises, callers that handle
+      errors themselves set `status` and `error`
+    - every stage records the process high-water RSS when it ends
+    - `metrics` is what the process-wide counters and timers (LLM calls,
+      tokens, retries, cache hits, Mongo writes) gained during the run
+    - PIPELINE_PROFILE=cpu,memory captures a cProfile listing and the
+      tracemalloc peak and top allocations of the stages named in
+      PIPELINE_PROFILE_STAGES (all stages when unset), the outermost
+      profiled stage wins when stages nest, stages of concurrent runs
+      share the process-wide tracemalloc session and see each other's
+      allocations
+    """
+    db = Database("pipeline_runs")
+    profile_lines = 25
+
+    def __init__(self, pipeline: str, profile: set[str] = None, profile_stages: set[str] = None, **fields):
+        self.pipeline = pipeline
+        self.fields = fields
+        self.profile = profile if profile is not None else \
+            {mode for mode in os.getenv("PIPELINE_PROFILE", "").split(",") if mode}
+        self.profile_stages = profile_stages if profile_stages is not None else \
+            {stage for stage in os.getenv("PIPELINE_PROFILE_STAGES", "").split(",") if stage}
+        self.id = uuid.uuid4().hex
+        self.status = "succeeded"
+        self.error = None
+        self.stages: dict[str, dict] = {}
+        self._profilers = {}
+        self._profiling = False
+        self._token = None
+
+    def __enter__(self) -> "RunReport":
+        self.started = datetime.datetime.utcnow()
+        self._start = time.perf_counter()
+        self._before = get_metrics().snapshot()
+        self._token = _current_run.set(self)
+        return self
+
+    def __exit__(self, error_type, error, tb):
+        _current_run.reset(self._token)
+        if error is not None:
+            self.status, self.error = "failed", repr(error)
+        self.save()
+        return False
+
+    def _profiled(self, name: str) -> bool:
+        return bool(self.profile) and not self._profiling and (not self.profile_stages or name in self.profile_stages)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        profiled = self._profiled(name)
+        profiler = None
+        tracing = False
+        if profiled:
+            self._profiling = True
+            if "cpu" in self.profile:
+                import cProfile
+                profiler = self._profilers.setdefault(name, cProfile.Profile())
+                profiler.enable()
+            if "memory" in self.profile:
+                _start_tracing()
+                tracing = True
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            if tracing:
+                try:
+                    self._memory(stage)
+                finally:
+                    _stop_tracing()
+            if profiled:
+                self._profiling = False
+            stage["seconds"] += seconds
+            stage["calls"] += 1
+            stage["max_rss_mb"] = round(max_rss_bytes() / 2 ** 20, 1)
+            get_metrics().observe("pipeline_stage_seconds", seconds, pipeline=self.pipeline, stage=name)
+
+    def record(self, name: str, seconds: float, calls: int = 1):
+        """time spent elsewhere, e.g. summed over worker processes"""
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        stage["seconds"] += seconds
+        stage["calls"] += calls
+
+    def _memory(self, stage: dict):
+        import tracemalloc
+
+        peak = tracemalloc.get_traced_memory()[1]
+        stage["peak_traced_mb"] = max(stage.get("peak_traced_mb", 0), round(peak / 2 ** 20, 1))
+        stage["top_allocations"] = [
+            {"where": str(stat.traceback), "mb": round(stat.size / 2 ** 20, 2), "count": stat.count}
+            for stat in tracemalloc.take_snapshot().statistics("lineno")[:10]
+        ]
+
+    def _cpu(self, name: str) -> str:
+        import pstats
+
+        out = io.StringIO()
+        pstats.Stats(self._profilers[name], stream=out).sort_stats("cumulative").print_stats(self.profile_lines)
+        return out.getvalue()
+
+    def document(self) -> dict:
+        for name in self._profilers:
+            self.stages[name]["cpu_profile"] = self._cpu(name)
+        return {
+            "_id": self.id,
+            "pipeline": self.pipeline,
+            **self.fields,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "status": self.status,
+            "error": self.error,
+            "started": self.started,
+            "finished": datetime.datetime.utcnow(),
+            "seconds": round(time.perf_counter() - self._start, 3),
+            "stages": {name: {**stage, "seconds": round(stage["seconds"], 3)} for name, stage in self.stages.items()},
+            "metrics": _delta(self._before, get_metrics().snapshot()),
+        }
+
+    def save(self) -> dict:
+        doc = self.document()
+        get_metrics().inc("pipeline_runs_total", pipeline=self.pipeline, status=self.status)
+        self.db.collection.insert_one(doc)
+        return doc
+
+    @classmethod
+    def list(cls, pipeline: str = None, limit: int = 20) -> list[dict]:
+        query = {"pipeline": pipeline} if pipeline else {}
+        return list(cls.db.collection.find(query).sort("started", -1).limit(limit))
+
+    @classmethod
+    def get(cls, run_id: str) -> dict | None:
+        return cls.db.collection.find_one({"_id": run_id})
+
+
+def current_run() -> RunReport | None:
+    return _current_run.get()
+
+
+@contextmanager
+def run_report(pipeline: str, **fields) -> Iterator[RunReport]:
+    """the run in progress, e.g. the job this pipeline runs in, or a new
+       one saved when the block exits"""
+    if (run := _current_run.get()) is not None:
+        yield run
+        return
+    with RunReport(pipeline, **fields) as run:
+        yield run
+
+
+@contextmanager
+def stage(name: str) -> Iterator[dict]:
+    """a stage of the current run, only timed into
+       `pipeline_stage_seconds` outside of one"""
+    if (run := _current_run.get()) is not None:
+        with run.stage(name) as entry:
+            yield entry
+        return
+    with get_metrics().timer("pipeline_stage_seconds", pipeline="none", stage=name):
+        yield {}
+
+
+def record(name: str, seconds: float, calls: int = 1):
+    """add time measured elsewhere to a stage of the current run"""
+    if (run := _current_run.get()) is not None:
+        run.record(name, seconds, calls)
+
+
+def record_llm(function: str, messages: list[dict[str, str]], content: str, seconds: float):
+    """latency and estimated tokens (~4 characters each) of one completion"""
+    metrics = get_metrics()
+    metrics.observe("llm_request_seconds", seconds, function=function)
+    metrics.inc("llm_prompt_tokens_total", sum(len(message["content"]) for message in messages) // 4,
+                function=function)
+    metrics.inc("llm_completion_tokens_total", len(content or "") // 4, function=function)
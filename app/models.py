@@ -0,0 +1,56 @@
+import json
+from ast import literal_eval
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict, RootModel, ValidationError
+
+from app.utilities import clean_string
+
+
+class ChecklistPrecision(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    A: bool
+    B: bool
+    C: bool
+    D: bool
+    E: bool
+    F: bool
+    G: bool
+    H: bool
+    I: bool
+
+
+class QuestionsPrecision(RootModel[dict[str, bool]]):
+    pass
+
+
+class MalformedResponse(ValueError):
+    """an LLM response that could not be parsed into its model"""
+
+    def __init__(self, function: str, raw: str, error: Exception):
+        super().__init__(f"{function}: {error}")
+        self.function = function
+        self.raw = raw
+        self.error = error
+
+
+def load_object(text: str) -> Any:
+    """JSON first, then the python-literal style older prompts produced"""
+    text = text.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return literal_eval(clean_string(text))
+
+
+def parse_checklist(text: str, resolved: dict[str, bool] = None) -> dict[str, bool]:
+    """`resolved` keys were decided locally and override the response"""
+    return ChecklistPrecision.model_validate({**load_object(text), **(resolved or {})}).model_dump()
+
+
+def parse_questions(text: str) -> dict[str, bool]:
+    return QuestionsPrecision.model_validate(load_object(text)).model_dump()
+
+
+PARSE_ERRORS = (ValueError, SyntaxError, TypeError, ValidationError)
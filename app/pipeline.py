@@ -1,21 +1,18 @@
+import asyncio
 import datetime
-import io
-import json
 import os
-import time
-from itertools import groupby
+from typing import Callable
 
-import requests
 from dotenv import load_dotenv
+from pymongo.errors import OperationFailure
 
-from app.ai import lead_questions_analysis, checklist_analysis
+from app.clustering import rebuild_clusters, update_clusters
 from app.data import Database
-from app.queries import read_all_query
-from app.utilities import (extract_summary,
-                           group_summary_text,
-                           extract_transcript,
-                           group_transcript_text,
-                           process_clusters)
+from app.fireflies import FirefliesClient, build_turns, iso_date, turns_text
+from app.ingest import ingest_directory
+from app.metrics import get_metrics, run_report, stage
+from app.turns import TurnStore, turn_storage_enabled
+from app.scoring import ScoringEngine, score_collection_batched
 
 
 class PDFPipeline:
@@ -24,98 +21,70 @@ class PDFPipeline:
     - Add checklist_precision and questions_precision
     - Perform questions_precision cluster analysis
     - Push cluster data to Mongo (cluster)
+    Each step is a stage of the run report, run alone by a job or
+    together by `__call__`
     """
     transcript_db = Database("transcripts")
     summary_db = Database("summaries")
     cluster_db = Database("cluster")
 
-    def push_raw_to_mongo(self):
-        dir_fp = os.path.relpath("source_data")
-        for file in os.listdir(dir_fp):
-            if "summary" in file:
-                with open(os.path.join(dir_fp, file), "rb") as f:
-                    text = io.BytesIO(f.read())
-                    contents = extract_summary(text)
-                    data = group_summary_text(contents)
-                    data["filename"] = file
-                    self.summary_db.create(data)
-            else:
-                with open(os.path.join(dir_fp, file), "rb") as f:
-                    text = io.BytesIO(f.read())
-                    contents = extract_transcript(text)
-                    result = {
-                        "filename": file,
-                        "transcripts": group_transcript_text(contents),
-                    }
-                    self.transcript_db.create(result)
-
-    def add_precision_data(self):
-        docs = self.transcript_db.collection.find({})
-        for doc in docs:
-            if "checklist_precision" not in doc.keys() or type(doc["questions_precision"]) != dict:
-                update_data = lead_questions_analysis(doc["transcripts"])
-                self.transcript_db.collection.update_one(
-                    {"_id": doc["_id"]},
-                    {"$set": {"questions_precision": update_data}},
-                )
-                time.sleep(10)
-                data = checklist_analysis(doc["transcripts"])
-                self.transcript_db.collection.update_one(
-                    {"_id": doc["_id"]},
-                    {"$set": {"checklist_precision": data}},
-                )
-                time.sleep(10)
-
-    def cluster_analysis(self):
-        df = self.transcript_db.dataframe()
-        self.cluster_db.collection.insert_many(process_clusters(df))
-
-    def __call__(self):
-        self.push_raw_to_mongo()
-        self.add_precision_data()
-        self.transcript_db.change_type("checklist_precision")
-        self.transcript_db.change_type("questions_precision")
-        self.cluster_analysis()
+    def push_raw_to_mongo(self, dir_fp: str = None, progress: Callable[[dict], None] = None):
+        with stage("ingest"):
+            return ingest_directory(dir_fp or os.path.relpath("source_data"), progress=progress)
+
+    def add_precision_data(self, batched: bool = False, progress: Callable[[dict], None] = None):
+        with stage("score"):
+            if batched:
+                return score_collection_batched(self.transcript_db.collection, progress=progress)
+            return asyncio.run(ScoringEngine().score_collection(self.transcript_db.collection, progress))
+
+    def cluster_analysis(self, incremental: bool = False):
+        with stage("cluster"), get_metrics().timer("clustering_seconds",
+                                                   mode="update" if incremental else "rebuild"):
+            return update_clusters() if incremental else rebuild_clusters()
+
+    def __call__(self) -> dict:
+        with run_report("pdf") as run:
+            results = {
+                "ingest": self.push_raw_to_mongo(),
+                "score": self.add_precision_data(),
+                "cluster": self.cluster_analysis(),
+            }
+        return {"run_id": run.id, **results}
 
 
 class FirefliesPipeline:
+    """
+    - Page through Fireflies transcripts newer than the stored high-water mark
+    - Clean each page and upsert it on the transcript `id`
+    - Checkpoint after every page so an interrupted run resumes where it stopped
+    """
     load_dotenv()
     db = Database("test")
+    state_db = Database("sync_state")
+    state_id = "fireflies"
 
-    def __init__(self):
-        header = {"Authorization": f"Bearer {os.getenv('GRAPHQL_KEY')}",
-                  "Content-Type": "application/json", }
-        self.data = requests.post(
-            url=os.getenv("GRAPHQL_URL"),
-            headers=header,
-            data=json.dumps({"query": read_all_query}),
-        ).json()
+    def __init__(self, client: FirefliesClient = None, timing: bool = False):
+        self.client = client or FirefliesClient()
+        self.timing = timing
+        self.turn_store = TurnStore() if turn_storage_enabled() else None
 
     def clean_sentences(self, transcripts):
-        split = []
-        result = []
+        """with TURN_STORAGE=1 the turns also go to the `turns` collection
+           and their `turn_stats` onto the transcript"""
+        page_turns = {}
         for transcript in transcripts:
-            sentences = transcript.get("sentences", [])
-            raw_text = [
-                str(dictionary[key])
-                for dictionary in sentences
-                for key, value in dictionary.items()
-                if type(value) != dict
-            ]
-            split_data = [
-                raw_text[idx:idx + 3]
-                for idx in range(0, len(raw_text), 3)
-            ]
-            split.append(split_data)
-        for item in split:
-            groups = []
-            groupings = groupby(item, lambda x: x[0])
-            for key, group in groupings:
-                combined = " ".join(item[-1] for item in list(group))
-                groups.append(f"Speaker {key}: {combined}")
-            result.append("|".join(groups))
-        for j in range(len(transcripts)):
-            transcripts[j]["transcript_text"] = result[j]
+            turns = build_turns(transcript.get("sentences") or [], self.timing or self.turn_store is not None)
+            transcript["transcript_text"] = turns_text(turns)
+            if self.timing:
+                transcript["turns"] = turns
+            if self.turn_store is not None:
+                page_turns[transcript["id"]] = [{**turn} for turn in turns]
+        if page_turns:
+            with stage("mongo_write"):
+                stats = self.turn_store.replace("fireflies", page_turns)
+            for transcript in transcripts:
+                transcript["turn_stats"] = stats[transcript["id"]]
         return transcripts
 
     def clean_dates(self, transcripts):
@@ -126,9 +95,50 @@ class FirefliesPipeline:
         return transcripts
 
     def send_to_mongo(self, data):
-        return {"Successfully Loaded?": self.db.collection.insert_many(data).acknowledged}
+        with stage("mongo_write"):
+            result = self.db.upsert_all(data, "id")
+        get_metrics().inc("mongo_documents_written_total", len(data), collection=self.db.collection.name)
+        return result
+
+    def save_state(self, from_date: str | None, skip: int, high_water: int):
+        self.state_db.collection.update_one(
+            {"_id": self.state_id},
+            {"$set": {"from_date": from_date, "skip": skip, "high_water": high_water}},
+            upsert=True,
+        )
+
+    def __call__(self, full: bool = False, progress: Callable[[dict], None] = None) -> dict:
+        """fetch new meetings, or every meeting with `full`, `progress`
+           gets the running report after every page"""
+        with run_report("fireflies"):
+            return self._sync(full, progress)
 
-    def __call__(self):
-        transcripts = self.data.get("data").get("transcripts", [])
-        text = self.clean_dates(self.clean_sentences(transcripts))
-        self.send_to_mongo(text)
+    def _sync(self, full: bool, progress: Callable[[dict], None] = None) -> dict:
+        try:
+            self.db.collection.create_index("id", unique=True)
+        except OperationFailure:
+            self.db.remove_duplicates("id")
+            self.db.collection.create_index("id", unique=True)
+        if self.turn_store is not None:
+            self.turn_store.ensure_indexes()
+        state = {} if full else self.state_db.collection.find_one({"_id": self.state_id}) or {}
+        from_date, skip, high_water = state.get("from_date"), state.get("skip", 0), state.get("high_water", 0)
+        report = {"transcripts": 0, "pages": 0}
+        pages = self.client.iter_pages(from_date, skip)
+        while True:
+            with stage("fireflies_fetch"):
+                next_skip, page = next(pages, (None, None))
+            if page is None:
+                break
+            if page:
+                high_water = max(high_water, *(transcript["date"] for transcript in page))
+                with stage("fireflies_clean"):
+                    page = self.clean_dates(self.clean_sentences(page))
+                self.send_to_mongo(page)
+            report["transcripts"] += len(page)
+            report["pages"] += 1
+            self.save_state(from_date, next_skip, high_water)
+            if progress:
+                progress(report)
+        self.save_state(iso_date(high_water) if high_water else from_date, 0, high_water)
+        return report
@@ -0,0 +1,18 @@
+read_all_query = """
+query Transcripts($limit: Int, $skip: Int, $fromDate: DateTime) {
+    transcripts(limit: $limit, skip: $skip, fromDate: $fromDate) {
+        id
+        title
+        date
+        duration
+        organizer_email
+        participants
+        sentences {
+            speaker_name
+            start_time
+            end_time
+            text
+        }
+    }
+}
+"""
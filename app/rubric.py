@@ -0,0 +1,143 @@
+import os
+import re
+from functools import lru_cache
+from typing import Callable
+
+from pymongo.collection import Collection
+
+from app.data import RUBRIC_KEYS
+from app.metrics import get_metrics
+
+# key -> (strong cues, weak cue), case-insensitive regexes
+# - every strong cue matches: the coach hit the item
+# - the weak cue does not match: nothing in the call touches the item
+# - anything in between goes to the LLM
+RUBRIC_CUES = {
+    "A": ((r"\bwhat (made|got|brought|motivated|prompted|led) you\b|\bwhy (do you want|did you decide|are you "
+           r"(interested|looking))\b|\bwhat motivat",),
+          r"motivat|\bwhy\b|\breason|interest"),
+    "B": ((r"\b\d+\s*(to \d+ )?(hours|hrs)( a| per|/)\s?week|\bweekly (time )?commitment|\b\d+[- ](week|month) "
+           r"(program|course|bootcamp)|\bprogram (is|takes|lasts) (about )?\d+ (weeks|months)",),
+          r"hours|weekly|per week|\bweeks\b|\bmonths\b|part[- ]time|full[- ]time|commitment"),
+    "C": ((r"job guarantee|money[- ]back|beginner[- ]friendly|try before you buy|risk[- ]free trial|\bRFT\b",),
+          r"guarantee|refund|flexib|beginner|trial"),
+    "D": ((r"\b(any|other) (bootcamps?|programs|schools|options)\b|competitor|general assembly|flatiron"
+           r"|springboard|app academy|hack reactor|codesmith|lambda school",),
+          r"\bother\b|compar|option|alternative|looking at"),
+    "E": ((r"\b(schedule|set up|book|hop on) (a|another|our next|a follow[- ]up|the next) (call|meeting|session|time)"
+           r"|\bfollow[- ]up (call|meeting)|\b(talk|speak|chat) again\b",),
+          r"\bcall\b|follow[- ]up|tomorrow|next week|calendar|schedul"),
+    "F": ((r"\bdemo\b|\bshow you (the|our) (platform|product|portal)|\bwalk you through (the|our) (platform|product)",),
+          r"\bshow\b|platform|screen|portal|walk you through"),
+    "G": ((r"\b(complete|finish|start|submit) (your|the) (enrollment|application|onboarding)|enrollment link"
+           r"|\bsign(ing)? up\b|\bdeposit\b",),
+          r"enrol|appl(y|ication)|\bsign\b|onboard|\blink\b"),
+    "H": ((r"tuition|income share|\bISA\b|payment plan|upfront|financ",
+           r"curriculum|modules?\b|\bunits?\b|syllabus|what you.{0,10} learn|\bcohort"),
+          r"tuition|\bcost|price|pay|curriculum|module|program"),
+    "I": ((r"\b(what|anything)( is| might be|'s)? (holding you back|stopping you|in your way)"
+           r"|\b(worried|concerned|hesitant) about\b|\bany concerns\b|\bwhat concerns\b",),
+          r"concern|worr|afford|obstacle|hesitat|holding|doubt|not sure|decision"),
+}
+
+
+@lru_cache(maxsize=None)
+def compiled_cues() -> dict[str, tuple[tuple[re.Pattern, ...], re.Pattern]]:
+    return {
+        key: (tuple(re.compile(cue, re.IGNORECASE) for cue in strong), re.compile(weak, re.IGNORECASE))
+        for key, (strong, weak) in RUBRIC_CUES.items()
+    }
+
+
+def transcript_text(transcript) -> str:
+    """PDF transcripts are lists of speaker turns, Fireflies ones strings"""
+    return transcript if isinstance(transcript, str) else "\n".join(transcript)
+
+
+def classify(transcript) -> dict[str, bool | None]:
+    """True / False per rubric key decided from lexical cues, None when ambiguous"""
+    text = transcript_text(transcript)
+    decisions = {}
+    for key, (strong, weak) in compiled_cues().items():
+        if all(cue.search(text) for cue in strong):
+            decisions[key] = True
+        elif not weak.search(text) and not any(cue.search(text) for cue in strong):
+            decisions[key] = False
+        else:
+            decisions[key] = None
+    return decisions
+
+
+def rubric_prefilter_enabled() -> bool:
+    return os.getenv("RUBRIC_PREFILTER", "0") == "1"
+
+
+class RubricPrefilter:
+    """
+    Local first pass of the checklist (RUBRIC_PREFILTER=1): rubric keys
+    with a clear lexical answer are decided without the LLM, which is
+    asked about the rest only, and not at all when every key is decided
+    - `keys`: the keys that may be decided locally, `RUBRIC_LOCAL_KEYS`
+      (comma separated, default none), pick them from the `local_keys`
+      of `agreement`
+    """
+
+    def __init__(self, keys: tuple[str, ...] = None):
+        if keys is None:
+            keys = tuple(key for key in os.getenv("RUBRIC_LOCAL_KEYS", "").split(",") if key)
+        self.keys = keys
+
+    def __call__(self, transcript) -> tuple[dict[str, bool], list[str]]:
+        """(keys decided locally, keys left to the LLM)"""
+        decisions = classify(transcript)
+        resolved = {key: decisions[key] for key in self.keys if decisions.get(key) is not None}
+        ambiguous = [key for key in RUBRIC_KEYS if key not in resolved]
+        metrics = get_metrics()
+        for key in RUBRIC_KEYS:
+            metrics.inc("rubric_prefilter_keys_total", key=key, outcome="local" if key in resolved else "llm")
+        metrics.inc("rubric_prefilter_transcripts_total", outcome="partial" if ambiguous else "local")
+        return resolved, ambiguous
+
+
+def agreement(collection: Collection, limit: int = 0, progress: Callable[[dict], None] = None) -> dict:
+    """
+    Local decisions against the stored LLM checklist labels, keys a run
+    already decided locally (`checklist_local`) are left out, `progress`
+    gets the transcripts read so far
+    - per key: `decided` locally, `agreement` with the LLM on those and
+      `coverage` of the labelled transcripts
+    - `local_keys`: keys at 95% agreement or better, for RUBRIC_LOCAL_KEYS
+    - `transcripts_local`: share of transcripts decided without the LLM
+    """
+    keys = {key: {"labelled": 0, "decided": 0, "agreed": 0} for key in RUBRIC_KEYS}
+    transcripts = fully_local = 0
+    docs = collection.find(
+        {"checklist_precision": {"$type": "object"}},
+        {"transcripts": True, "checklist_precision": True, "checklist_local": True},
+    ).limit(limit)
+    for doc in docs:
+        transcripts += 1
+        if progress:
+            progress({"transcripts": transcripts})
+        decisions = classify(doc["transcripts"])
+        fully_local += all(decision is not None for decision in decisions.values())
+        local = set(doc.get("checklist_local") or ())
+        for key, decision in decisions.items():
+            label = doc["checklist_precision"].get(key)
+            if key in local or not isinstance(label, bool):
+                continue
+            keys[key]["labelled"] += 1
+            if decision is not None:
+                keys[key]["decided"] += 1
+                keys[key]["agreed"] += decision == label
+    for stats in keys.values():
+        stats["agreement"] = round(stats["agreed"] / stats["decided"], 4) if stats["decided"] else None
+        stats["coverage"] = round(stats["decided"] / stats["labelled"], 4) if stats["labelled"] else None
+    decided = sum(stats["decided"] for stats in keys.values())
+    return {
+        "transcripts": transcripts,
+        "agreement": round(sum(stats["agreed"] for stats in keys.values()) / decided, 4) if decided else None,
+        "transcripts_local": round(fully_local / transcripts, 4) if transcripts else None,
+        "local_keys": [key for key, stats in keys.items() if (stats["agreement"] or 0) >= 0.95],
+        "keys": keys,
+    }
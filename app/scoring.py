@@ -0,0 +1,399 @@
+import asyncio
+import datetime
+import os
+import random
+import threading
+import time
+from functools import lru_cache, partial
+from typing import Awaitable, Callable
+
+import openai
+from pymongo import InsertOne, UpdateOne
+from pymongo.collection import Collection
+
+from app.ai import checklist_messages, lead_questions_messages
+from app.backends import function_config, get_backend
+from app.cache import LLMCache, get_cache
+from app.data import Database
+from app.metrics import get_metrics, record_llm, stage
+from app.models import MalformedResponse, PARSE_ERRORS, parse_checklist, parse_questions
+from app.rubric import RubricPrefilter, rubric_prefilter_enabled
+from app.views import TRANSCRIPT_FIELDS, AnalyticsViews, checklist_updates
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+# field -> (LLM function, prompt builder, response parser)
+PRECISION_FIELDS = {
+    "questions_precision": ("lead_questions", lead_questions_messages, parse_questions),
+    "checklist_precision": ("checklist", checklist_messages, parse_checklist),
+}
+
+# transcripts that still need a precision pass
+PENDING_PRECISION = {
+    "$or": [
+        {"checklist_precision": {"$exists": False}},
+        {"questions_precision": {"$not": {"$type": "object"}}},
+    ]
+}
+
+
+def precision_requests(transcript, prefilter: RubricPrefilter = None) -> tuple[dict, dict]:
+    """
+    (field -> (function, messages, parse) still to send, fields decided
+    locally), with a prefilter the checklist asks only for the rubric keys
+    it left open and is not sent when it left none, `checklist_local`
+    lists the keys it decided
+    """
+    requests, values = {}, {}
+    for field, (function, build, parse) in PRECISION_FIELDS.items():
+        if field == "checklist_precision" and prefilter is not None:
+            resolved, ambiguous = prefilter(transcript)
+            values["checklist_local"] = sorted(resolved)
+            if not ambiguous:
+                values[field] = resolved
+                continue
+            if resolved:
+                requests[field] = function, checklist_messages(transcript, ambiguous), \
+                    partial(parse_checklist, resolved=resolved)
+                continue
+        requests[field] = function, build(transcript), parse
+    return requests, values
+
+
+def local_values(values: dict, local: dict) -> dict:
+    """`values` plus the locally decided fields, `checklist_local` only
+       alongside the checklist it belongs to"""
+    values = {**values, **local}
+    if "checklist_precision" not in values:
+        values.pop("checklist_local", None)
+    return values
+
+
+class TokenBucket:
+    """refills `rate` units per minute, holding at most `capacity` units,
+       safe to share between threads and event loops"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate / 60
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        """take `amount` units, going into debt when short, and return
+           the seconds until the debt is paid off"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self, amount: float = 1):
+        """wait until `amount` units are available and take them,
+           callers are served in arrival order"""
+        if wait := self._reserve(min(amount, self.capacity)):
+            await asyncio.sleep(wait)
+
+
+@lru_cache(maxsize=None)
+def rate_limits(rpm: int, tpm: int) -> tuple[TokenBucket, TokenBucket]:
+    """process-wide requests and tokens buckets, every engine with the same
+       quota draws from the same pair"""
+    return TokenBucket(rpm), TokenBucket(tpm)
+
+
+def estimate_tokens(messages: list[dict[str, str]]) -> int:
+    """rough prompt size, ~4 characters per token"""
+    return sum(len(message["content"]) for message in messages) // 4
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return isinstance(error, openai.error.APIError) and (error.http_status or 0) >= 500
+
+
+class ScoringEngine:
+    """
+    - Bounded pool of async workers pulling transcripts off a queue
+    - Requests-per-minute and tokens-per-minute token buckets, shared by
+      every engine in the process (`rate_limits`)
+    - Exponential backoff with full jitter on 429/5xx responses
+    - Both precision prompts for a transcript are sent at once
+    - Cached responses are served without touching the rate limits
+    - Backend, model and concurrency per function from `function_config`
+    - Checklist keys with a clear lexical answer are decided locally with
+      RUBRIC_PREFILTER=1, see `RubricPrefilter`
+    """
+
+    def __init__(self,
+                 workers: int = None,
+                 rpm: int = None,
+                 tpm: int = None,
+                 completion_tokens: int = 500,
+                 max_retries: int = 6,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 complete: Callable[..., Awaitable[str]] = None,
+                 cache: LLMCache = None,
+                 prefilter: RubricPrefilter = None):
+        self.workers = workers or int(os.getenv("SCORING_WORKERS", 8))
+        self.requests, self.tokens = rate_limits(rpm or int(os.getenv("OPEN_AI_RPM", 200)),
+                                                 tpm or int(os.getenv("OPEN_AI_TPM", 40000)))
+        self.completion_tokens = completion_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._complete = complete
+        self.cache = cache or get_cache()
+        self.prefilter = prefilter or (RubricPrefilter() if rubric_prefilter_enabled() else None)
+        self._functions = {}
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = (getattr(error, "headers", None) or {}).get("retry-after")
+        try:
+            return max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            return delay
+
+    def _function(self, function: str) -> tuple[dict, asyncio.Semaphore]:
+        if function not in self._functions:
+            config = function_config(function)
+            self._functions[function] = config, asyncio.Semaphore(config["concurrency"])
+        return self._functions[function]
+
+    async def complete(self, messages: list[dict[str, str]], function: str = "default", parse=None):
+        """completion content, or `parse(content)` when a parser is given,
+           malformed responses raise MalformedResponse and are not cached"""
+        config, semaphore = self._function(function)
+        metrics = get_metrics()
+        key = self.cache.key(config["model"], messages, get_backend(config["backend"]).provider)
+        if (content := await asyncio.to_thread(self.cache.get, key)) is not None:
+            metrics.inc("llm_cache_hits_total", function=function)
+            return parse(content) if parse else content
+        metrics.inc("llm_cache_misses_total", function=function)
+        complete = self._complete or get_backend(config["backend"]).acomplete
+        tokens = estimate_tokens(messages) + self.completion_tokens
+        for attempt in range(self.max_retries + 1):
+            await self.requests.acquire()
+            await self.tokens.acquire(tokens)
+            try:
+                async with semaphore:
+                    start = time.perf_counter()
+                    content = await complete(messages, config["model"])
+            except Exception as error:
+                metrics.inc("llm_errors_total", function=function, error=type(error).__name__)
+                if attempt == self.max_retries or not is_retryable(error):
+                    raise
+                metrics.inc("llm_retries_total", function=function)
+                await asyncio.sleep(self.backoff(attempt, error))
+                continue
+            record_llm(function, messages, content, time.perf_counter() - start)
+            try:
+                value = parse(content) if parse else content
+            except PARSE_ERRORS as error:
+                metrics.inc("llm_malformed_total", function=function)
+                raise MalformedResponse(function, content, error)
+            await asyncio.to_thread(self.cache.put, key, content)
+            return value
+
+    async def score(self, transcript) -> tuple[dict, list[MalformedResponse]]:
+        """parsed values per precision field and the malformed responses,
+           any other error propagates"""
+        requests, local = precision_requests(transcript, self.prefilter)
+        results = await asyncio.gather(*(
+            self.complete(messages, function, parse)
+            for function, messages, parse in requests.values()
+        ), return_exceptions=True)
+        values, malformed = {}, []
+        for field, result in zip(requests, results):
+            if isinstance(result, MalformedResponse):
+                malformed.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                values[field] = result
+        return local_values(values, local), malformed
+
+    async def run(self, docs,
+                  on_result: Callable[[dict, dict, list], None],
+                  progress: Callable[[dict], None] = None) -> dict:
+        """score every doc with at most `workers` transcripts in flight,
+           a failed transcript is recorded and skipped, `progress` gets the
+           running report as docs are queued and may raise to stop the run"""
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        report = {"scored": 0, "failed": []}
+
+        async def worker():
+            while (doc := await queue.get()) is not None:
+                try:
+                    values, malformed = await self.score(doc["transcripts"])
+                    on_result(doc, values, malformed)
+                    if malformed:
+                        report["failed"].append({"filename": doc.get("filename"),
+                                                 "error": "; ".join(map(str, malformed))})
+                    else:
+                        report["scored"] += 1
+                except Exception as error:
+                    report["failed"].append({"filename": doc.get("filename"), "error": repr(error)})
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            for doc in docs:
+                await queue.put(doc)
+                if progress:
+                    progress(report)
+            for _ in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return report
+
+    async def score_collection(self, collection: Collection, progress: Callable[[dict], None] = None) -> dict:
+        docs = collection.find(PENDING_PRECISION, {"filename": True, "transcripts": True, **TRANSCRIPT_FIELDS})
+        writer = PrecisionWriter(collection)
+        try:
+            return await self.run(docs, writer.add, progress)
+        finally:
+            writer.flush()
+
+
+class PrecisionWriter:
+    """
+    Buffers parsed precision values as one bulk write per `batch_size`
+    transcripts, malformed responses go to the `dead_letter` collection
+    with the raw text and the transcript stays pending for the next run,
+    checklist changes are applied to the analytics views after each write
+    """
+
+    def __init__(self, collection: Collection, batch_size: int = 100):
+        self.collection = collection
+        self.dead_letter = Database("dead_letter").collection
+        self.batch_size = batch_size
+        self.updates = []
+        self.letters = []
+        self.views = []
+
+    def add(self, doc: dict, values: dict, malformed: list[MalformedResponse]):
+        if values:
+            self.updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": values}))
+        if "checklist_precision" in values:
+            self.views.extend(checklist_updates(doc, doc.get("checklist_precision"), values["checklist_precision"]))
+        for error in malformed:
+            self.letters.append(InsertOne({
+                "transcript_id": doc["_id"],
+                "filename": doc.get("filename"),
+                "function": error.function,
+                "raw": error.raw,
+                "error": str(error.error),
+                "created": datetime.datetime.utcnow(),
+            }))
+        if len(self.updates) >= self.batch_size or len(self.letters) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        metrics = get_metrics()
+        if self.updates:
+            with stage("mongo_write"):
+                self.collection.bulk_write(self.updates, ordered=False)
+                if (views := AnalyticsViews()).built("checklist"):
+                    views.apply(self.views)
+            metrics.inc("mongo_documents_written_total", len(self.updates), collection=self.collection.name)
+            self.updates = []
+            self.views = []
+        if self.letters:
+            with stage("mongo_write"):
+                self.dead_letter.bulk_write(self.letters, ordered=False)
+            metrics.inc("mongo_documents_written_total", len(self.letters), collection="dead_letter")
+            self.letters = []
+
+
+def score_collection_batched(collection: Collection,
+                             cache: LLMCache = None,
+                             progress: Callable[[dict], None] = None,
+                             prefilter: RubricPrefilter = None) -> dict:
+    """
+    Nightly alternative to the engine: both prompts of every pending
+    transcript go through `complete_batch` of the configured backend,
+    `batch_size` transcripts per submission, skipping cached prompts and
+    the checklist keys the rubric prefilter decided
+    """
+    cache = cache or get_cache()
+    prefilter = prefilter or (RubricPrefilter() if rubric_prefilter_enabled() else None)
+    metrics = get_metrics()
+    batch_size = min(function_config(function)["batch_size"] for function, _, _ in PRECISION_FIELDS.values())
+    writer = PrecisionWriter(collection)
+    report = {"scored": 0, "failed": []}
+
+    def flush(docs: list[dict]):
+        values = {doc["_id"]: {} for doc in docs}
+        malformed = {doc["_id"]: [] for doc in docs}
+        requests = {doc["_id"]: precision_requests(doc["transcripts"], prefilter) for doc in docs}
+        for field, (function, _, _) in PRECISION_FIELDS.items():
+            config = function_config(function)
+            contents = {}
+            pending = []
+            parsers = {}
+            for doc in docs:
+                if field not in requests[doc["_id"]][0]:
+                    continue
+                _, messages, parsers[doc["_id"]] = requests[doc["_id"]][0][field]
+                key = cache.key(config["model"], messages, get_backend(config["backend"]).provider)
+                if (content := cache.get(key)) is not None:
+                    contents[doc["_id"]] = (key, content)
+                else:
+                    pending.append((doc["_id"], key, messages))
+            metrics.inc("llm_cache_hits_total", len(contents), function=function)
+            metrics.inc("llm_cache_misses_total", len(pending), function=function)
+            with metrics.timer("llm_batch_seconds", function=function):
+                results = get_backend(config["backend"]).complete_batch(
+                    [messages for _, _, messages in pending], config["model"]
+                )
+            for (doc_id, key, messages), content in zip(pending, results):
+                if content is not None:
+                    contents[doc_id] = (key, content)
+                    metrics.inc("llm_prompt_tokens_total", estimate_tokens(messages), function=function)
+                    metrics.inc("llm_completion_tokens_total", len(content) // 4, function=function)
+                else:
+                    metrics.inc("llm_errors_total", function=function, error="batch_item")
+            for doc_id, (key, content) in contents.items():
+                try:
+                    values[doc_id][field] = parsers[doc_id](content)
+                    cache.put(key, content)
+                except PARSE_ERRORS as error:
+                    metrics.inc("llm_malformed_total", function=function)
+                    malformed[doc_id].append(MalformedResponse(function, content, error))
+        for doc in docs:
+            values[doc["_id"]] = local_values(values[doc["_id"]], requests[doc["_id"]][1])
+            writer.add(doc, values[doc["_id"]], malformed[doc["_id"]])
+            if all(field in values[doc["_id"]] for field in PRECISION_FIELDS):
+                report["scored"] += 1
+            else:
+                errors = "; ".join(map(str, malformed[doc["_id"]])) or "batch item failed"
+                report["failed"].append({"filename": doc.get("filename"), "error": errors})
+
+    batch = []
+    try:
+        for doc in collection.find(PENDING_PRECISION, {"filename": True, "transcripts": True, **TRANSCRIPT_FIELDS}):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+                if progress:
+                    progress(report)
+        if batch:
+            flush(batch)
+    finally:
+        writer.flush()
+    return report
@@ -0,0 +1,186 @@
+from collections import defaultdict
+
+from pymongo import InsertOne, UpdateOne
+
+from app.data import Database
+from app.turns import speaker_roles
+from app.utilities import split_turn, tokenize
+
+
+def _posting(postings: dict, term: str) -> dict:
+    return postings.setdefault(term, {"count": 0, "turns": 0, "roles": defaultdict(int)})
+
+
+def index_turns(turns: list[str]) -> tuple[dict[str, dict], dict[str, dict]]:
+    """
+    (word postings, two-word phrase postings) of one transcript: occurrence
+    count, number of turns and count per speaker role (`speaker_roles`),
+    words also carry their [turn, position, role] positions
+    """
+    parsed = []
+    for turn in turns:
+        speaker, text = split_turn(turn)
+        parsed.append((speaker or "unknown", tokenize(text)))
+    roles = speaker_roles([{"speaker": speaker, "words": len(tokens)} for speaker, tokens in parsed])
+    words, pairs = {}, {}
+    for idx, (speaker, tokens) in enumerate(parsed):
+        role = roles[speaker]
+        seen = set()
+        for position, term in enumerate(tokens):
+            keys = [(words, term)]
+            if position:
+                keys.append((pairs, f"{tokens[position - 1]} {term}"))
+            for postings, key in keys:
+                posting = _posting(postings, key)
+                posting["count"] += 1
+                posting["roles"][role] += 1
+                if key not in seen:
+                    seen.add(key)
+                    posting["turns"] += 1
+            words[term].setdefault("positions", []).append([idx, position, role])
+    return words, pairs
+
+
+def _term_update(term: str, posting: dict, sign: int) -> UpdateOne:
+    return UpdateOne({"_id": term}, {"$inc": {
+        "count": sign * posting["count"],
+        "turns": sign * posting["turns"],
+        "docs": sign * posting.get("docs", 1),
+        **{f"roles.{role}": sign * count for role, count in posting["roles"].items()},
+    }}, upsert=True)
+
+
+class SearchIndex:
+    """
+    Inverted index over transcript speaker turns, maintained at ingest
+    - `search_terms`: one document per word or two-word phrase ('a b')
+      with corpus-wide occurrence, turn and document frequencies and
+      counts per speaker role
+    - `search_postings`: one document per (word, transcript) with
+      positions, for phrases of three or more words
+    - `search_pairs`: the two-word phrase postings of each transcript in
+      one document, subtracted from the totals when it is reindexed
+    """
+    terms_db = Database("search_terms")
+    postings_db = Database("search_postings")
+    pairs_db = Database("search_pairs")
+
+    def ensure_indexes(self):
+        self.postings_db.collection.create_index([("term", 1), ("filename", 1)], unique=True)
+        self.postings_db.collection.create_index("filename")
+        self.pairs_db.collection.create_index("filename", unique=True)
+
+    def remove(self, filenames: list[str]):
+        """subtract previously indexed transcripts from the term totals"""
+        old = self.postings_db.collection.find(
+            {"filename": {"$in": filenames}}, {"positions": False}
+        )
+        updates = [_term_update(posting["term"], posting, -1) for posting in old]
+        for doc in self.pairs_db.collection.find({"filename": {"$in": filenames}}):
+            updates.extend(_term_update(pair, posting, -1) for pair, posting in doc["pairs"].items())
+        if updates:
+            self.terms_db.collection.bulk_write(updates, ordered=False)
+        # transcripts indexed without words still hold an empty pairs document
+        if filenames:
+            self.postings_db.collection.delete_many({"filename": {"$in": filenames}})
+            self.pairs_db.collection.delete_many({"filename": {"$in": filenames}})
+
+    def add(self, docs: list[dict]):
+        """(re)index transcript documents with `filename` and `transcripts`"""
+        self.remove([doc["filename"] for doc in docs])
+        term_updates = defaultdict(lambda: {"count": 0, "turns": 0, "docs": 0,
+                                            "roles": defaultdict(int)})
+        inserts, pair_inserts = [], []
+        for doc in docs:
+            words, pairs = index_turns(doc["transcripts"])
+            inserts.extend(InsertOne({"term": term, "filename": doc["filename"], **posting})
+                           for term, posting in words.items())
+            pair_inserts.append(InsertOne({"filename": doc["filename"], "pairs": pairs}))
+            for term, posting in (*words.items(), *pairs.items()):
+                total = term_updates[term]
+                total["count"] += posting["count"]
+                total["turns"] += posting["turns"]
+                total["docs"] += 1
+                for role, count in posting["roles"].items():
+                    total["roles"][role] += count
+        if pair_inserts:
+            self.pairs_db.collection.bulk_write(pair_inserts, ordered=False)
+        if inserts:
+            self.postings_db.collection.bulk_write(inserts, ordered=False)
+            self.terms_db.collection.bulk_write(
+                [_term_update(term, total, 1) for term, total in term_updates.items()],
+                ordered=False,
+            )
+
+    def rebuild(self, batch_size: int = 200) -> int:
+        self.terms_db.reset()
+        self.postings_db.reset()
+        self.pairs_db.reset()
+        self.ensure_indexes()
+        batch, indexed = [], 0
+        for doc in Database("transcripts").collection.find({}, {"filename": True, "transcripts": True}):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self.add(batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            self.add(batch)
+            indexed += len(batch)
+        return indexed
+
+    def term_stats(self, terms: list[str]) -> dict[str, dict]:
+        found = {doc.pop("_id"): doc for doc in self.terms_db.collection.find({"_id": {"$in": terms}})}
+        empty = {"count": 0, "turns": 0, "docs": 0, "roles": {}}
+        return {term: found.get(term, empty) for term in terms}
+
+    def phrase_stats(self, terms: list[str]) -> dict:
+        """occurrences of the terms in sequence within one speaker turn,
+           a two-word phrase is one lookup, a longer one reads the positions
+           in every transcript holding its rarest word"""
+        stats = {"count": 0, "turns": 0, "docs": 0, "roles": defaultdict(int)}
+        pairs = [f"{first} {second}" for first, second in zip(terms, terms[1:])]
+        pair_stats = self.term_stats(list(dict.fromkeys(pairs)))
+        if len(terms) == 2:
+            return pair_stats[pairs[0]]
+        if not all(pair["docs"] for pair in pair_stats.values()):
+            return {**stats, "roles": {}}
+        rarest = min(self.term_stats(terms).items(), key=lambda item: item[1]["docs"])
+        filenames = self.postings_db.collection.distinct("filename", {"term": rarest[0]})
+        postings = defaultdict(dict)
+        for posting in self.postings_db.collection.find(
+                {"term": {"$in": list(set(terms))}, "filename": {"$in": filenames}},
+                {"term": True, "filename": True, "positions": True}):
+            postings[posting["filename"]][posting["term"]] = {
+                (turn, position): role for turn, position, role in posting["positions"]
+            }
+        for filename, positions in postings.items():
+            if len(positions) < len(set(terms)):
+                continue
+            turns = set()
+            for (turn, position), role in positions[terms[0]].items():
+                if all((turn, position + offset) in positions[term]
+                       for offset, term in enumerate(terms[1:], start=1)):
+                    stats["count"] += 1
+                    stats["roles"][role] += 1
+                    turns.add(turn)
+            stats["turns"] += len(turns)
+            stats["docs"] += bool(turns)
+        return {**stats, "roles": dict(stats["roles"])}
+
+    def search(self, query: str, phrase: bool = False) -> dict:
+        """per-term frequencies, plus phrase frequencies for a multi-term phrase query"""
+        terms = tokenize(query)
+        result = {"terms": self.term_stats(list(dict.fromkeys(terms)))}
+        if phrase and len(terms) > 1:
+            result["phrase"] = self.phrase_stats(terms)
+        return result
+
+    def keyword_count(self, keyword: str) -> int:
+        """occurrences of a keyword, or of a multi-word keyword as a phrase"""
+        terms = tokenize(keyword)
+        if not terms:
+            return 0
+        if len(terms) == 1:
+            return self.term_stats(terms)[terms[0]]["count"]
+        return self.phrase_stats(terms)["count"]
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Callable
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from app.ai import summarize_messages
+from app.backends import function_config, get_backend
+from app.cache import LLMCache, get_cache
+from app.metrics import get_metrics
+from app.scoring import ScoringEngine
+
+
+def representative_sample(questions: list[str], matrix: csr_matrix, size: int) -> list[str]:
+    """the `size` questions whose TF-IDF rows are closest to the cluster
+       centroid, closest first"""
+    rows = normalize(matrix)
+    similarity = np.asarray(rows @ rows.sum(axis=0).T).ravel()
+    order = np.argsort(-similarity, kind="stable")[:size]
+    return [questions[idx] for idx in order]
+
+
+def _local_vectors(questions: list[str]) -> csr_matrix:
+    try:
+        return TfidfVectorizer().fit_transform(questions)
+    except ValueError:  # no tokens, any sample is as good as another
+        return csr_matrix((len(questions), 1))
+
+
+class ClusterSummarizer:
+    """
+    Summaries for a whole clustering run
+    - clusters under `min_size` questions skip the LLM, the summary is
+      the questions themselves
+    - clusters over `sample_size` questions are summarized from the
+      questions nearest their centroid
+    - summaries are cached on a hash of the provider, model and cluster membership,
+      so unchanged clusters cost nothing on the next run
+    - requests go through a ScoringEngine: rate limits, retries and
+      `LLM_SUMMARIZE_CONCURRENCY` requests in flight
+    Defaults come from `SUMMARY_MIN_CLUSTER_SIZE` and `SUMMARY_SAMPLE_SIZE`.
+    """
+    function = "summarize"
+
+    def __init__(self,
+                 min_size: int = None,
+                 sample_size: int = None,
+                 vectorize: Callable[[list[str]], csr_matrix] = None,
+                 engine: ScoringEngine = None,
+                 cache: LLMCache = None):
+        self.min_size = int(os.getenv("SUMMARY_MIN_CLUSTER_SIZE", 3)) if min_size is None else min_size
+        self.sample_size = int(os.getenv("SUMMARY_SAMPLE_SIZE", 25)) if sample_size is None else sample_size
+        self.vectorize = vectorize or _local_vectors
+        self.cache = cache or get_cache()
+        self.engine = engine or ScoringEngine(cache=self.cache)
+        config = function_config(self.function)
+        self.model = config["model"]
+        self.provider = get_backend(config["backend"]).provider
+        self.stats = {"skipped": 0, "cached": 0, "summarized": 0, "sampled": 0}
+
+    def membership_key(self, questions: list[str]) -> str:
+        payload = json.dumps({"provider": self.provider, "model": self.model, "function": self.function,
+                              "sample_size": self.sample_size, "questions": sorted(questions)})
+        return "cluster:" + hashlib.sha256(payload.encode()).hexdigest()
+
+    def sample(self, questions: list[str]) -> list[str]:
+        if len(questions) <= self.sample_size:
+            return questions
+        self.stats["sampled"] += 1
+        return representative_sample(questions, self.vectorize(questions), self.sample_size)
+
+    async def asummarize(self, questions: list[str]) -> str:
+        if len(questions) < self.min_size:
+            return self._count("skipped", "; ".join(questions))
+        key = self.membership_key(questions)
+        if (summary := await asyncio.to_thread(self.cache.get, key)) is not None:
+            return self._count("cached", summary)
+        summary = await self.engine.complete(summarize_messages(self.sample(questions)), self.function)
+        await asyncio.to_thread(self.cache.put, key, summary)
+        return self._count("summarized", summary)
+
+    def _count(self, outcome: str, summary: str) -> str:
+        self.stats[outcome] += 1
+        get_metrics().inc("cluster_summaries_total", outcome=outcome)
+        return summary
+
+    async def summarize_all(self, clusters: dict[int, list[str]]) -> dict[int, str]:
+        summaries = await asyncio.gather(*(self.asummarize(questions) for questions in clusters.values()))
+        return dict(zip(clusters, summaries))
+
+    def __call__(self, clusters: dict[int, list[str]]) -> dict[int, str]:
+        return asyncio.run(self.summarize_all(clusters))
+
+
+def summarize_clusters(clusters: dict[int, list[str]],
+                       vectorize: Callable[[list[str]], csr_matrix] = None) -> dict[int, str]:
+    """cluster id -> summary, `vectorize` maps questions to TF-IDF rows for
+       sampling and defaults to a vectorizer fitted on the cluster"""
+    return ClusterSummarizer(vectorize=vectorize)(clusters)
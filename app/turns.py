@@ -0,0 +1,218 @@
+import os
+import zlib
+from collections import Counter
+from typing import Iterable
+
+from pymongo import DeleteMany, InsertOne, UpdateOne
+
+from app.data import Database, transcript_filter
+from app.utilities import split_turn, tokenize
+
+ROLES = ("coach", "lead")
+# a turn asks a question when it has a question mark, which the PDF text
+# loses, or opens with one of these words
+QUESTION_STARTS = frozenset((
+    "what", "how", "when", "why", "where", "who", "which", "is", "are", "do", "does",
+    "did", "can", "could", "would", "will", "should", "have", "has", "am",
+))
+
+
+def turn_storage_enabled() -> bool:
+    return os.getenv("TURN_STORAGE", "0") == "1"
+
+
+def term_hash(term: str) -> int:
+    """stable across processes, unlike hash()"""
+    return zlib.crc32(term.encode())
+
+
+def signature(tokens: Iterable[str]) -> list[int]:
+    """sorted distinct term hashes of a turn, multikey-indexed for keyword lookups"""
+    return sorted({term_hash(token) for token in tokens})
+
+
+def is_question(text: str, tokens: list[str]) -> bool:
+    return "?" in text or (bool(tokens) and tokens[0] in QUESTION_STARTS)
+
+
+def speaker_roles(turns: list[dict]) -> dict[str, str]:
+    """the speaker with the most words is the coach, everyone else a lead"""
+    words = Counter()
+    for turn in turns:
+        words[turn["speaker"]] += turn["words"]
+    coach = max(words, key=words.get, default=None)
+    return {speaker: "coach" if speaker == coach else "lead" for speaker in words}
+
+
+def pdf_turns(turns: list[str]) -> list[dict]:
+    """`group_transcript_text` turns ('Speaker1 text') as speaker / text"""
+    parsed = []
+    for turn in turns:
+        speaker, text = split_turn(turn)
+        parsed.append({"speaker": speaker or "unknown", "text": text})
+    return parsed
+
+
+def turn_documents(transcript: str, source: str, turns: list[dict]) -> tuple[list[dict], dict]:
+    """
+    (turn documents, per-transcript stats) for `{speaker, text}` turns,
+    `start_time` is kept when the turns have it
+    - offset: words spoken before the turn
+    - text is stored only for questions, for question extraction
+    """
+    for turn in turns:
+        turn["tokens"] = tokenize(turn["text"])
+        turn["words"] = len(turn["tokens"])
+    roles = speaker_roles(turns)
+    docs, offset = [], 0
+    stats = {"turns": len(turns), "words": dict.fromkeys(ROLES, 0), "questions": dict.fromkeys(ROLES, 0)}
+    for idx, turn in enumerate(turns):
+        question = is_question(turn["text"], turn["tokens"])
+        role = roles[turn["speaker"]]
+        doc = {
+            "transcript": transcript,
+            "source": source,
+            "idx": idx,
+            "speaker": str(turn["speaker"]),
+            "role": role,
+            "offset": offset,
+            "words": turn["words"],
+            "question": question,
+            "signature": signature(turn["tokens"]),
+        }
+        if turn.get("start_time") is not None:
+            doc["start_time"] = turn["start_time"]
+        if question:
+            doc["text"] = turn["text"]
+        docs.append(doc)
+        offset += turn["words"]
+        stats["words"][role] += turn["words"]
+        stats["questions"][role] += question
+    total = sum(stats["words"].values())
+    stats["talk_ratio"] = round(stats["words"]["coach"] / total, 4) if total else None
+    return docs, stats
+
+
+class TurnStore:
+    """
+    Optional normalized storage (TURN_STORAGE=1): one `turns` document per
+    speaker turn, written next to the transcript at ingest and Fireflies sync,
+    plus `turn_stats` (turns, words and questions per role, talk ratio) on
+    the transcript itself so per-transcript analytics are a projection
+    """
+    db = Database("turns")
+
+    def ensure_indexes(self):
+        self.db.collection.create_index([("source", 1), ("transcript", 1), ("idx", 1)], unique=True)
+        self.db.collection.create_index([("source", 1), ("role", 1), ("question", 1)])
+        self.db.collection.create_index([("signature", 1), ("role", 1)])
+
+    def replace(self, source: str, turns: dict[str, list[dict]]) -> dict[str, dict]:
+        """write the turns of each transcript id over its old ones,
+           returning the stats per transcript id"""
+        requests, stats = [], {}
+        for transcript, transcript_turns in turns.items():
+            docs, stats[transcript] = turn_documents(transcript, source, transcript_turns)
+            requests.append(DeleteMany({"source": source, "transcript": transcript}))
+            requests.extend(InsertOne(doc) for doc in docs)
+        if requests:
+            self.db.collection.bulk_write(requests, ordered=True)
+        return stats
+
+    def add_transcripts(self, docs: list[dict]) -> list[dict]:
+        """PDF transcripts: sets `turn_stats` on the documents before they are written"""
+        stats = self.replace("pdf", {doc["filename"]: pdf_turns(doc["transcripts"]) for doc in docs})
+        for doc in docs:
+            doc["turn_stats"] = stats[doc["filename"]]
+        return docs
+
+    def rebuild(self, batch_size: int = 200) -> int:
+        """turns and `turn_stats` of every PDF transcript already stored"""
+        self.ensure_indexes()
+        transcripts = Database("transcripts").collection
+        batch, written = [], 0
+
+        def flush():
+            stats = self.replace("pdf", {doc["filename"]: pdf_turns(doc["transcripts"]) for doc in batch})
+            transcripts.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": {"turn_stats": stats[doc["filename"]]}})
+                for doc in batch
+            ], ordered=False)
+
+        for doc in transcripts.find({"transcripts": {"$type": "array"}}, {"filename": True, "transcripts": True}):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                flush()
+                written += len(batch)
+                batch = []
+        if batch:
+            flush()
+            written += len(batch)
+        return written
+
+    def keyword_turns(self, keyword: str, role: str = None) -> dict[str, int]:
+        """turns containing every term of `keyword`, per role, from the signature index"""
+        terms = tokenize(keyword)
+        if not terms:
+            return dict.fromkeys(ROLES, 0)
+        query = {"signature": {"$all": [term_hash(term) for term in terms]}}
+        if role:
+            query["role"] = role
+        counts = dict.fromkeys(ROLES, 0)
+        for row in self.db.collection.aggregate([
+            {"$match": query},
+            {"$group": {"_id": "$role", "turns": {"$sum": 1}}},
+        ]):
+            counts[row["_id"]] = row["turns"]
+        return counts
+
+    def questions(self, role: str = "lead", source: str = None, limit: int = 1000) -> list[dict]:
+        """question turns of `role` with their text, from the role / question index"""
+        query = {"role": role, "question": True}
+        if source:
+            query["source"] = source
+        return list(self.db.collection.find(
+            query, {"_id": False, "transcript": True, "idx": True, "offset": True, "text": True}
+        ).limit(limit))
+
+
+# collection holding the transcripts of each source
+SOURCE_COLLECTIONS = {"pdf": "transcripts", "fireflies": "test"}
+
+
+def stats_pipeline(start: str = None, end: str = None) -> list[dict]:
+    """`turn_stats` of every transcript in the date range, no turn is read"""
+    match = {**transcript_filter(start, end), "turn_stats": {"$exists": True}}
+    return [
+        {"$match": match},
+        {"$project": {"_id": False, "filename": True, "id": True, "date": True, "turn_stats": True}},
+    ]
+
+
+def _transcript(row: dict) -> str:
+    """PDF transcripts are keyed by filename, Fireflies ones by id"""
+    return row.get("filename", row.get("id"))
+
+
+def talk_ratios(rows: list[dict]) -> dict:
+    words = {role: sum(row["turn_stats"]["words"][role] for row in rows) for role in ROLES}
+    total = sum(words.values())
+    return {
+        "talk_ratio": round(words["coach"] / total, 4) if total else None,
+        "words": words,
+        "transcripts": [
+            {"transcript": _transcript(row), "date": row.get("date"),
+             "talk_ratio": row["turn_stats"]["talk_ratio"]}
+            for row in rows
+        ],
+    }
+
+
+def question_counts(rows: list[dict]) -> dict:
+    return {
+        "questions": {role: sum(row["turn_stats"]["questions"][role] for row in rows) for role in ROLES},
+        "transcripts": [
+            {"transcript": _transcript(row), "date": row.get("date"), **row["turn_stats"]["questions"]}
+            for row in rows
+        ],
+    }
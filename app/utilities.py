@@ -1,41 +1,115 @@
+from contextlib import contextmanager
+from functools import lru_cache
 from itertools import groupby
 from collections import Counter
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator
+import datetime
 import io
+import mmap
+import os
+import re
 
-from pandas import DataFrame
-from pypdf import PdfReader
-from scipy.cluster.hierarchy import linkage, fcluster
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+# numpy, scipy, scikit-learn, pandas, pypdf, nltk and openai are imported
+# where they are used, the API's read endpoints never load them
+if TYPE_CHECKING:
+    import numpy as np
+    from pandas import DataFrame
+    from scipy.sparse import csr_matrix
 
-from app.ai import summarize
 
+TRANSCRIPT_TABLE = str.maketrans({"\n": " ", "\t": " ", ".": " ", "?": " ", ",": None})
+TURN_PATTERN = re.compile(r"^(Speaker\s*[^\s:]+):?(?:\s+(.*))?$", re.DOTALL)
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
 
-def extract_summary(file: io.BytesIO) -> list[str]:
-    all_text = []
-    reader = PdfReader(file)
-    pages = reader.pages
+
+@contextmanager
+def open_pdf(path: str) -> Iterator[mmap.mmap]:
+    """memory-map a PDF so pages are read from the page cache
+       instead of copying the whole file into the heap"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
+def iter_pages(file: BinaryIO | mmap.mmap) -> Iterator[str]:
+    from pypdf import PdfReader
+
+    for page in PdfReader(file).pages:
+        yield page.extract_text()
+
+
+def iter_summary_lines(pages: Iterable[str]) -> Iterator[str]:
+    """lines of the pages joined by a space, one page in memory at a time"""
+    carry = None
     for page in pages:
-        all_text.append(page.extract_text())
-    return " ".join(all_text).split("\n")
+        lines = (page if carry is None else carry + " " + page).split("\n")
+        carry = lines.pop()
+        yield from lines
+    yield "" if carry is None else carry
 
 
-def extract_transcript(file: io.BytesIO) -> list[str]:
-    all_text = []
-    reader = PdfReader(file)
-    pages = reader.pages
+def iter_transcript_tokens(pages: Iterable[str]) -> Iterator[str]:
+    """words of the pages joined without a separator, a word split
+       across a page break is carried over to the next page"""
+    carry = ""
     for page in pages:
-        all_text.append(page.extract_text())
-    long_string = "".join(all_text)
-    cleaned_string = long_string.replace(
-        "\n", " "
-    ).replace("\t", " ").replace(".", " ").replace("?", " ").replace(",", "").split(" ")
-    return [item for item in cleaned_string if item != '']
+        words = (carry + page.translate(TRANSCRIPT_TABLE)).split(" ")
+        carry = words.pop()
+        yield from filter(None, words)
+    if carry:
+        yield carry
+
+
+def iter_speaker_turns(tokens: Iterable[str]) -> Iterator[str]:
+    current_speaker = None
+    current_text = []
+    for token in tokens:
+        if token.startswith("Speaker"):
+            if current_speaker is not None:
+                yield " ".join((current_speaker, " ".join(current_text)))
+            current_speaker = token
+            current_text = []
+        else:
+            current_text.append(token)
+    if current_speaker is not None:
+        yield " ".join((current_speaker, " ".join(current_text)))
+
+
+def iter_transcript_turns(path: str) -> Iterator[str]:
+    with open_pdf(path) as pdf:
+        yield from iter_speaker_turns(iter_transcript_tokens(iter_pages(pdf)))
+
+
+def pdf_date(path: str) -> str:
+    """the PDF's creation date, or the file's modification time when the
+       PDF has none, as a '%Y-%m-%d %H:%M:%S' string like Fireflies dates"""
+    from pypdf import PdfReader
+
+    with open_pdf(path) as pdf:
+        try:
+            created = PdfReader(pdf).metadata.creation_date
+        except (AttributeError, ValueError):
+            created = None
+    if created is None:
+        created = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+    elif created.tzinfo is not None:
+        created = created.astimezone().replace(tzinfo=None)
+    return created.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def read_summary(path: str) -> dict[str, str]:
+    with open_pdf(path) as pdf:
+        return group_summary_text(iter_summary_lines(iter_pages(pdf)))
+
+
+def extract_summary(file: io.BytesIO) -> list[str]:
+    return list(iter_summary_lines(iter_pages(file)))
+
+
+def extract_transcript(file: io.BytesIO) -> list[str]:
+    return list(iter_transcript_tokens(iter_pages(file)))
 
 
-def group_summary_text(input_list: list[str]) -> dict[str, str]:
+def group_summary_text(input_list: Iterable[str]) -> dict[str, str]:
     keywords = [
         "AI meeting summary:",
         "Action items:",
@@ -58,24 +132,20 @@ def group_summary_text(input_list: list[str]) -> dict[str, str]:
     return result
 
 
-def group_transcript_text(input_list: list[str]) -> list[str]:
-    speaker_list = []
-    current_speaker = None
-    current_text = []
+def group_transcript_text(input_list: Iterable[str]) -> list[str]:
+    return list(iter_speaker_turns(input_list))
 
-    for item in input_list:
-        if item.startswith('Speaker'):
-            if current_speaker is not None:
-                speaker_list.append(current_speaker + ' ' + ' '.join(current_text))
-            current_speaker = item
-            current_text = []
-        else:
-            current_text.append(item)
 
-    if current_speaker is not None:
-        speaker_list.append(" ".join((current_speaker, ' '.join(current_text))))
+def split_turn(turn: str) -> tuple[str | None, str]:
+    """'Speaker1 text' or 'Speaker 1: text' -> (speaker label, text)"""
+    match = TURN_PATTERN.match(turn)
+    if match is None:
+        return None, turn
+    return match.group(1), match.group(2) or ""
+
 
-    return speaker_list
+def tokenize(text: str) -> list[str]:
+    return WORD_PATTERN.findall(text.lower())
 
 
 def count_questions(input_list: list[str]) -> int:
@@ -99,22 +169,166 @@ def count_answers(input_list: list[str]) -> tuple[int, int]:
     return true_count, false_count
 
 
-def extract_questions(df: DataFrame) -> list[str]:
+def extract_questions(df: "DataFrame") -> list[str]:
     q_dict = df["questions_precision"].to_dict()
     question_list = [q_dict[key] for key, _ in q_dict.items()]
     combined_list = [item for sublist in question_list for item in sublist]
     return combined_list
 
 
-def cluster_questions(input_list: list[str]) -> dict[int, list[str]]:
-    distance_threshold = 0.6
-    tfidf = TfidfVectorizer()
-    matrix = tfidf.fit_transform(input_list)
-    cosine_similarities = cosine_similarity(matrix)
-    linked = linkage(cosine_similarities, method="complete", metric="cosine")
-    flat_clusters = fcluster(linked, distance_threshold, criterion="distance")
+def best_match(rows: "csr_matrix", centroids: "csr_matrix",
+               chunk_size: int = 4096) -> tuple["np.ndarray", "np.ndarray"]:
+    """index and cosine similarity of the closest centroid for each
+       L2-normalized row, centroids are scored `chunk_size` at a time"""
+    import numpy as np
+
+    best = np.zeros(rows.shape[0], dtype=np.int64)
+    score = np.full(rows.shape[0], -1.0)
+    for start in range(0, centroids.shape[0], chunk_size):
+        sims = (rows @ centroids[start:start + chunk_size].T).toarray()
+        idx = sims.argmax(axis=1)
+        value = sims[np.arange(rows.shape[0]), idx]
+        better = value > score
+        best[better] = idx[better] + start
+        score[better] = value[better]
+    return best, score
+
+
+def assign_leaders(matrix: "csr_matrix", leaders: "csr_matrix", distance_threshold: float,
+                   batch_size: int = 512) -> tuple["np.ndarray", "csr_matrix"]:
+    """
+    Leader pass over L2-normalized sparse rows, `batch_size` rows at a time
+    - a row joins the closest leader within `distance_threshold`
+      (cosine distance), otherwise it becomes a new leader
+    Returns the leader index of every row and the grown leaders matrix
+    """
+    import numpy as np
+    from scipy.sparse import vstack
+
+    min_similarity = 1 - distance_threshold
+    labels = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], batch_size):
+        batch = matrix[start:start + batch_size]
+        best, score = best_match(batch, leaders)
+        unmatched = np.flatnonzero(score < min_similarity)
+        if len(unmatched):
+            # unmatched rows may still match leaders created earlier in this batch
+            sims = (batch[unmatched] @ batch[unmatched].T).toarray()
+            new = []
+            for k, row in enumerate(unmatched):
+                if new and sims[k, new].max() >= min_similarity:
+                    best[row] = leaders.shape[0] + int(sims[k, new].argmax())
+                    continue
+                best[row] = leaders.shape[0] + len(new)
+                new.append(k)
+            leaders = vstack([leaders, batch[unmatched[new]]]).tocsr()
+        labels[start:start + batch_size] = best
+    return labels, leaders
+
+
+def leader_cluster(matrix: "csr_matrix", distance_threshold: float,
+                   batch_size: int = 512) -> tuple["np.ndarray", "csr_matrix"]:
+    """
+    Mini-batch leader clustering on L2-normalized sparse rows
+    - `assign_leaders` from an empty set of leaders
+    - one refinement pass reassigns every row to the closest
+      cluster centroid, rows similar to none (no terms, e.g. "?")
+      keep their leader-pass cluster
+    Memory is O(nnz + batch_size * chunk_size), never n x n
+    """
+    import numpy as np
+    from sklearn.preprocessing import normalize
+
+    labels, leaders = assign_leaders(matrix, matrix[:0], distance_threshold, batch_size)
+    centroids = normalize(indicator_matrix(labels, leaders.shape[0]) @ matrix)
+    for start in range(0, matrix.shape[0], batch_size):
+        best, score = best_match(matrix[start:start + batch_size], centroids)
+        labels[start:start + batch_size] = np.where(score > 0, best, labels[start:start + batch_size])
+    used, labels = np.unique(labels, return_inverse=True)
+    return labels, centroids[used]
+
+
+def indicator_matrix(labels: "np.ndarray", n_clusters: int) -> "csr_matrix":
+    """n_clusters x len(labels) matrix with a 1 at (label, row)"""
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    return csr_matrix(
+        (np.ones(len(labels)), (labels, np.arange(len(labels)))),
+        shape=(n_clusters, len(labels)),
+    )
+
+
+def count_terms(input_list: list[str]) -> tuple["csr_matrix", "np.ndarray", object]:
+    """
+    Document-term counts shared by clustering and topic extraction
+    Returns (counts, terms, fitted CountVectorizer), TfidfTransformer
+    on the counts gives the same matrix as TfidfVectorizer
+    """
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    vectorizer = CountVectorizer()
+    counts = vectorizer.fit_transform(input_list)
+    return counts.tocsr(), vectorizer.get_feature_names_out(), vectorizer
+
+
+def cluster_topics(counts: "csr_matrix", terms: "np.ndarray", labels: "np.ndarray",
+                   n_clusters: int, top: int = 4) -> list[list[tuple[str, int]]]:
+    """
+    `top` most frequent non-stopword terms of every cluster in one pass,
+    terms are CountVectorizer's (lowercased, two or more characters)
+    - per-cluster term sums: indicator matrix @ document-term counts
+    - stopword columns dropped with a diagonal mask
+    - nonzeros ranked per row with one lexsort (count desc, term asc)
+    """
+    import numpy as np
+    from scipy.sparse import diags
+
+    stop = topic_stop_words()
+    keep = np.fromiter((term not in stop for term in terms), dtype=np.float64, count=len(terms))
+    sums = (indicator_matrix(labels, n_clusters) @ counts @ diags(keep)).tocsr()
+    sums.eliminate_zeros()
+    rows = np.repeat(np.arange(n_clusters), np.diff(sums.indptr))
+    order = np.lexsort((sums.indices, -sums.data, rows))
+    rank = np.arange(len(order)) - sums.indptr[rows[order]]
+    picked = order[rank < top]
+    topics = [[] for _ in range(n_clusters)]
+    for row, column, count in zip(rows[picked], sums.indices[picked], sums.data[picked]):
+        topics[row].append((str(terms[column]), int(count)))
+    return topics
+
+
+def topics_by_cluster(clusters: dict[int, list[str]], top: int = 4) -> dict[int, list[tuple[str, int]]]:
+    """`cluster_topics` for clusters given as id -> questions"""
+    import numpy as np
+
+    ids = list(clusters)
+    questions = [question for cluster_id in ids for question in clusters[cluster_id]]
+    try:
+        counts, terms, _ = count_terms(questions)
+    except ValueError:  # no questions, or no tokens in them
+        return {cluster_id: [] for cluster_id in ids}
+    labels = np.repeat(np.arange(len(ids)), [len(clusters[cluster_id]) for cluster_id in ids])
+    return dict(zip(ids, cluster_topics(counts, terms, labels, len(ids), top)))
+
+
+def cluster_labels(input_list: list[str],
+                   distance_threshold: float = 0.6) -> tuple["np.ndarray", "csr_matrix", "np.ndarray"]:
+    """(labels, counts, terms), the counts are tokenized once and
+       reused for topic extraction"""
+    from sklearn.feature_extraction.text import TfidfTransformer
+
+    counts, terms, _ = count_terms(input_list)
+    matrix = TfidfTransformer().fit_transform(counts)
+    labels, _ = leader_cluster(matrix, distance_threshold)
+    return labels, counts, terms
+
+
+def group_by_label(input_list: list[str], labels: "np.ndarray") -> dict[int, list[str]]:
+    """cluster id (label + 1) -> members, largest cluster first"""
     clustered_questions = {}
-    for idx, cluster_id in enumerate(flat_clusters):
+    for idx, label in enumerate(labels):
+        cluster_id = int(label) + 1
         if cluster_id not in clustered_questions:
             clustered_questions[cluster_id] = []
         clustered_questions[cluster_id].append(input_list[idx])
@@ -126,45 +340,79 @@ def cluster_questions(input_list: list[str]) -> dict[int, list[str]]:
     )
 
 
+def cluster_questions(input_list: list[str]) -> dict[int, list[str]]:
+    labels, _, _ = cluster_labels(input_list)
+    return group_by_label(input_list, labels)
+
+
+FILLER_WORDS = (
+    ",", ".", "!", "?", ":", ";", "'s", "'d",
+    "get", "n't", "like", "could", "would",
+    "should", "much", "'m", "got", "'ll",
+)
+
+
+@lru_cache(maxsize=None)
+def stop_words() -> frozenset[str]:
+    """nltk's English stopwords plus punctuation and filler, read once"""
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words("english") + list(FILLER_WORDS))
+
+
+@lru_cache(maxsize=None)
+def topic_stop_words() -> frozenset[str]:
+    """`stop_words`, or scikit-learn's English list plus filler where
+       the nltk corpus isn't downloaded"""
+    try:
+        return stop_words()
+    except LookupError:
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+        return frozenset(ENGLISH_STOP_WORDS | set(FILLER_WORDS))
+
+
 def extract_topics(text_list: list[str]) -> list[tuple[str, int]]:
-    stop_words = stopwords.words("english")
-    stop_words.extend([",", ".", "!", "?", ":", ";", "'s", "'d",
-                       "get", "n't", "like", "could", "would",
-                       "should", "much", "'m", "got", "'ll", ])
+    from nltk.tokenize import word_tokenize
+
+    stop = stop_words()
     all_docs = " ".join(text_list)
     tokens = word_tokenize(all_docs)
-    filtered_tokens = [word for word in tokens if word.lower() not in stop_words]
+    filtered_tokens = [word for word in tokens if word.lower() not in stop]
     word_freq = Counter(filtered_tokens)
     topics = word_freq.most_common(4)
     return topics
 
 
-def process_clusters(df: DataFrame) -> list[dict[str, str | int]]:
-    first_result = []
-    second_result = []
-    final = []
-    counter = 1
+def cluster_document(cluster_id: int, questions: list[str],
+                     topic: list[tuple[str, int]] = None,
+                     summary: str = None) -> dict[str, str | int]:
+    """`topic` from `cluster_topics` and `summary` from `summarize_clusters`,
+       computed for this cluster alone when not given"""
+    if summary is None:
+        from app.ai import summarize
+        summary = summarize(questions)
+    return {
+        "id": cluster_id,
+        "summary": summary,
+        "topic": extract_topics(questions) if topic is None else topic,
+        "count": len(questions),
+        "questions": questions,
+    }
+
+
+def process_clusters(df: "DataFrame") -> list[dict[str, str | int]]:
+    from app.summaries import summarize_clusters
+
     questions = extract_questions(df)
-    clusters = cluster_questions(questions)
-    for _, value in clusters.items():
-        summary = summarize(value)
-        first_dict = {"id": counter, "summary": summary}
-        first_result.append(first_dict)
-        counter += 1
-    for i in clusters.keys():
-        questions = clusters[i]
-        count = len(questions)
-        second_dict = {
-            "topic": extract_topics(questions),
-            "count": count,
-            "questions": questions
-        }
-        second_result.append(second_dict)
-    for dict1, dict2 in zip(first_result, second_result):
-        result = {**dict1, **dict2}
-        final.append(result)
-
-    return final
+    labels, counts, terms = cluster_labels(questions)
+    topics = cluster_topics(counts, terms, labels, int(labels.max()) + 1)
+    clusters = group_by_label(questions, labels)
+    summaries = summarize_clusters(clusters)
+    return [
+        cluster_document(counter, value, topics[cluster_id - 1], summaries[cluster_id])
+        for counter, (cluster_id, value) in enumerate(clusters.items(), start=1)
+    ]
 
 
 def clean_string(text: str) -> str:
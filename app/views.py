@@ -0,0 +1,186 @@
+import datetime
+from collections import Counter, defaultdict
+from email.utils import format_datetime, parsedate_to_datetime
+
+from pymongo import ReplaceOne, UpdateOne
+
+from app.data import Database, RUBRIC_KEYS, checklist_percent
+
+TRANSCRIPT_FIELDS = {"checklist_precision": True, "date": True}
+
+
+def field_key(text) -> str:
+    """usable as a Mongo field name"""
+    return str(text).replace(".", "_").lstrip("$") or "_"
+
+
+def week_key(date: str | None) -> str | None:
+    """ISO week ('2023-W31') of a '%Y-%m-%d %H:%M:%S' date string"""
+    try:
+        year, week, _ = datetime.date.fromisoformat(str(date)[:10]).isocalendar()
+    except ValueError:
+        return None
+    return f"{year}-W{week:02d}"
+
+
+def checklist_view_ids(doc: dict) -> list[str]:
+    """the global rubric view plus the week view of a transcript"""
+    ids = ["checklist"]
+    if week := week_key(doc.get("date")):
+        ids.append(f"checklist:week:{week}")
+    return ids
+
+
+def checklist_counts(checklist) -> Counter:
+    counts = Counter()
+    if isinstance(checklist, dict):
+        counts["total"] += 1
+        for key in RUBRIC_KEYS:
+            if checklist.get(key) is True:
+                counts[f"hits.{key}"] += 1
+    return counts
+
+
+def _view_update(view_id: str, inc: dict = None, fields: dict = None) -> UpdateOne:
+    update = {"$inc": {**(inc or {}), "version": 1}, "$currentDate": {"updated": True}}
+    if fields:
+        update["$set"] = fields
+    return UpdateOne({"_id": view_id}, update, upsert=True)
+
+
+def checklist_updates(doc: dict, old, new) -> list[UpdateOne]:
+    """view increments for a transcript whose checklist changed from `old` to `new`"""
+    inc = checklist_counts(new)
+    inc.subtract(checklist_counts(old))
+    inc = {field: count for field, count in inc.items() if count}
+    if not inc:
+        return []
+    return [_view_update(view_id, inc) for view_id in checklist_view_ids(doc)]
+
+
+def cluster_updates(old: list[dict], new: list[dict]) -> list[UpdateOne]:
+    """view increments for clusters replaced from `old` to `new` documents"""
+    topics = Counter()
+    for cluster in new:
+        topics.update({field_key(word): count for word, count in cluster.get("topic") or []})
+    for cluster in old:
+        topics.subtract({field_key(word): count for word, count in cluster.get("topic") or []})
+    questions = sum(cluster["count"] for cluster in new) - sum(cluster.get("count", 0) for cluster in old)
+    return [
+        _view_update("topics", {f"counts.{word}": count for word, count in topics.items() if count}),
+        _view_update("clusters", {"questions": questions},
+                     {f"sizes.{cluster['id']}": cluster["count"] for cluster in new}),
+    ]
+
+
+class AnalyticsViews:
+    """
+    Summary documents in `analytics_views`, kept current by the scoring and
+    clustering writes so dashboard reads are one lookup by `_id`
+    - `checklist`, `checklist:week:<YYYY-Www>` (from the ingest `date`):
+      `total` scored transcripts and `hits.<key>` per rubric key
+    - `topics`: `counts.<word>` summed over clusters
+    - `clusters`: `sizes.<id>` and total `questions`
+    - every document carries `version` and `updated` for HTTP caching
+    Writes skip the increments of a view that was never built, an upsert
+    would start it from that write's delta alone, its first read counts
+    from scratch instead
+    """
+    db = Database("analytics_views")
+
+    def apply(self, updates: list[UpdateOne]):
+        if updates:
+            self.db.collection.bulk_write(updates, ordered=False)
+
+    def get(self, view_id: str) -> dict | None:
+        return self.db.collection.find_one({"_id": view_id})
+
+    def built(self, view_id: str) -> bool:
+        return self.db.collection.count_documents({"_id": view_id}, limit=1) > 0
+
+    def rebuild_checklist(self) -> int:
+        counts = defaultdict(Counter)
+        for doc in Database("transcripts").collection.find({"checklist_precision": {"$type": "object"}},
+                                                           TRANSCRIPT_FIELDS):
+            doc_counts = checklist_counts(doc["checklist_precision"])
+            for view_id in checklist_view_ids(doc):
+                counts[view_id].update(doc_counts)
+        counts.setdefault("checklist", Counter())
+        self.db.collection.delete_many({"_id": {"$regex": "^checklist"}})
+        self._replace({
+            view_id: {"total": view["total"], "hits": {key: view[f"hits.{key}"] for key in RUBRIC_KEYS}}
+            for view_id, view in counts.items()
+        })
+        return len(counts)
+
+    def rebuild_clusters(self) -> int:
+        clusters = list(Database("cluster").collection.find({}, {"id": True, "topic": True, "count": True}))
+        topics = Counter()
+        for cluster in clusters:
+            topics.update({field_key(word): count for word, count in cluster.get("topic") or []})
+        self._replace({
+            "topics": {"counts": dict(topics)},
+            "clusters": {"sizes": {str(cluster["id"]): cluster["count"] for cluster in clusters},
+                         "questions": sum(cluster["count"] for cluster in clusters)},
+        })
+        return len(clusters)
+
+    def rebuild(self) -> dict[str, int]:
+        return {"checklist_views": self.rebuild_checklist(), "clusters": self.rebuild_clusters()}
+
+    def _replace(self, views: dict[str, dict]):
+        """new contents with a version past the old one, so old ETags go stale"""
+        versions = {doc["_id"]: doc.get("version", 0)
+                    for doc in self.db.collection.find({"_id": {"$in": list(views)}}, {"version": True})}
+        now = datetime.datetime.utcnow()
+        self.db.collection.bulk_write([
+            ReplaceOne({"_id": view_id}, {**view, "version": versions.get(view_id, 0) + 1, "updated": now},
+                       upsert=True)
+            for view_id, view in views.items()
+        ], ordered=False)
+
+
+def view_percent(view: dict | None) -> dict[str, float]:
+    if not view or not view.get("total"):
+        return checklist_percent(None)
+    # keys no transcript of the view hit were never incremented
+    hits = view.get("hits", {})
+    return checklist_percent({"total": view["total"], **{key: hits.get(key, 0) for key in RUBRIC_KEYS}})
+
+
+def weekly_percent(views: list[dict]) -> list[dict]:
+    return [
+        {"week": view["_id"].rsplit(":", 1)[1], "total": view["total"], **view_percent(view)}
+        for view in sorted(views, key=lambda view: view["_id"])
+        if view.get("total")
+    ]
+
+
+def topic_counts(view: dict | None) -> dict[str, int]:
+    counts = (view or {}).get("counts", {})
+    return dict(sorted(((word, count) for word, count in counts.items() if count > 0),
+                       key=lambda item: (-item[1], item[0])))
+
+
+def cache_headers(view: dict | None) -> dict[str, str]:
+    """ETag and Last-Modified of a view document"""
+    if view is None:
+        return {}
+    updated = view["updated"].replace(tzinfo=datetime.timezone.utc, microsecond=0)
+    return {
+        "ETag": f'W/"{view["_id"]}-{view["version"]}"',
+        "Last-Modified": format_datetime(updated, usegmt=True),
+    }
+
+
+def not_modified(headers: dict[str, str], if_none_match: str = None, if_modified_since: str = None) -> bool:
+    if not headers:
+        return False
+    if if_none_match:
+        return headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
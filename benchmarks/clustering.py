@@ -0,0 +1,87 @@
+"""
+Time and peak traced memory of `cluster_questions` from 1k to 100k
+questions, optionally against the legacy dense n x n path and charted.
+
+    python -m benchmarks.clustering --sizes 1000 10000 100000 --legacy-max 5000 --plot clustering.png
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from scipy.cluster.hierarchy import linkage, fcluster
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app.utilities import cluster_questions
+from benchmarks.corpus import lead_questions
+
+
+def legacy_cluster_questions(input_list: list[str]) -> int:
+    """the dense path: n x n cosine similarity fed to scipy linkage"""
+    matrix = TfidfVectorizer().fit_transform(input_list)
+    linked = linkage(cosine_similarity(matrix), method="complete", metric="cosine")
+    return len(set(fcluster(linked, 0.6, criterion="distance")))
+
+
+def sparse_cluster_questions(input_list: list[str]) -> int:
+    return len(cluster_questions(input_list))
+
+
+def measure(name: str, func, questions: list[str]) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    clusters = func(questions)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"path": name, "questions": len(questions), "clusters": clusters,
+            "seconds": round(seconds, 3), "peak_mb": round(peak / 2 ** 20, 1)}
+
+
+def plot(results: list[dict], path: str):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, (time_ax, memory_ax) = plt.subplots(1, 2, figsize=(11, 4))
+    for name in sorted({result["path"] for result in results}):
+        rows = [result for result in results if result["path"] == name]
+        sizes = [row["questions"] for row in rows]
+        time_ax.plot(sizes, [row["seconds"] for row in rows], marker="o", label=name)
+        memory_ax.plot(sizes, [row["peak_mb"] for row in rows], marker="o", label=name)
+    for ax, label in ((time_ax, "seconds"), (memory_ax, "peak traced MB")):
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_xlabel("questions")
+        ax.set_ylabel(label)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000, 10000, 30000, 100000])
+    parser.add_argument("--legacy-max", type=int, default=3000,
+                        help="largest size to run the dense legacy path on")
+    parser.add_argument("--plot", help="write a time / memory chart to this path")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        questions = lead_questions(size)
+        runs = [("sparse", sparse_cluster_questions)]
+        if size <= args.legacy_max:
+            runs.append(("legacy", legacy_cluster_questions))
+        for name, func in runs:
+            result = measure(name, func, questions)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    if args.plot:
+        plot(results, args.plot)
+    return results
+
+
+if __name__ == "__main__":
+    main()
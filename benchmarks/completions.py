@@ -0,0 +1,163 @@
+"""
+Local fake of the OpenAI chat completions endpoint that fails a share of
+requests with 429 / 500 / 503, and the scoring engine's retry and backoff
+path against it at different error rates.
+
+    python -m benchmarks.completions --transcripts 200 --error-rate 0 0.1 0.3
+
+`MockCompletions` answers like the stub backend, through the real
+`AsyncOpenAIBackend`, so the openai client's error mapping, `is_retryable`
+and the `Retry-After` header are all exercised:
+
+    with MockCompletions(error_rate=0.2) as server:
+        openai.api_base = server.url
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.corpus import transcript_lines
+
+# status -> OpenAI error type
+ERRORS = {
+    429: "rate_limit_exceeded",
+    500: "server_error",
+    503: "service_unavailable",
+}
+
+
+class MockCompletions:
+    """
+    Serves POST /v1/chat/completions, failing `error_rate` of the requests
+    with a random status from ERRORS, 429s carry `Retry-After: retry_after`
+    - `statuses` counts the responses sent per status code
+    """
+
+    def __init__(self, error_rate: float = 0.0, retry_after: float = 0.1, latency: float = 0.0,
+                 seed: int = 0, port: int = 0):
+        from app.backends import StubBackend
+
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.latency = latency
+        self.stub = StubBackend(latency=0)
+        self.statuses = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def status(self) -> int:
+        with self._lock:
+            status = self._rng.choice(list(ERRORS)) if self._rng.random() < self.error_rate else 200
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        return status
+
+    def response(self, body: dict) -> tuple[int, dict, dict]:
+        """(status, headers, payload) for one request body"""
+        status = self.status()
+        if status != 200:
+            headers = {"Retry-After": str(self.retry_after)} if status == 429 else {}
+            return status, headers, {"error": {"message": f"mock {status}", "type": ERRORS[status],
+                                               "param": None, "code": None}}
+        content = self.stub.respond(body["messages"])
+        return 200, {}, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(mock.latency)
+                status, headers, payload = mock.response(body)
+                payload = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure(server: MockCompletions, transcripts: list[list[str]], workers: int, base_delay: float) -> dict:
+    from app.cache import SQLiteCache
+    from app.metrics import get_metrics
+    from app.scoring import ScoringEngine
+
+    def retries() -> int:
+        return sum(value for (name, _), value in get_metrics().snapshot()["counters"].items()
+                   if name == "llm_retries_total")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = ScoringEngine(workers=workers, base_delay=base_delay, max_delay=base_delay * 8,
+                               cache=SQLiteCache(os.path.join(tmp, "cache.sqlite3"), ttl=0, max_entries=0))
+        before = retries()
+        start = time.perf_counter()
+        report = asyncio.run(engine.run(({"transcripts": turns} for turns in transcripts), lambda *_: None))
+        seconds = time.perf_counter() - start
+    return {"error_rate": server.error_rate, "transcripts": len(transcripts), "scored": report["scored"],
+            "failed": len(report["failed"]), "requests": sum(server.statuses.values()),
+            "statuses": {str(status): count for status, count in sorted(server.statuses.items())},
+            "retries": retries() - before, "seconds": round(seconds, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcripts", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, nargs="+", default=[0.0, 0.1, 0.3])
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds on 429s")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per request")
+    parser.add_argument("--base-delay", type=float, default=0.05, help="backoff base delay")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+    os.environ.update({
+        "LLM_BACKEND": "async",
+        "OPEN_AI_KEY": "mock",
+        "OPEN_AI_RPM": os.getenv("OPEN_AI_RPM", "100000"),
+        "OPEN_AI_TPM": os.getenv("OPEN_AI_TPM", "100000000"),
+    })
+    import openai
+
+    transcripts = [transcript_lines(args.turns, seed) for seed in range(args.transcripts)]
+    results = []
+    for error_rate in args.error_rate:
+        with MockCompletions(error_rate, args.retry_after, args.latency) as server:
+            openai.api_base, openai.api_key = server.url, "mock"
+            result = measure(server, transcripts, args.workers, args.base_delay)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
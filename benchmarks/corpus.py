@@ -0,0 +1,134 @@
+"""Synthetic transcript and summary PDFs for the benchmarks"""
+import datetime
+import random
+
+WORDS = ("program", "weekly", "tuition", "career", "coach", "schedule", "python",
+         "guarantee", "refund", "flexible", "beginner", "demo", "enroll", "job",
+         "support", "module", "project", "mentor", "interview", "payment")
+LINE_WIDTH = 12
+LINES_PER_PAGE = 60
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def call_date(seed: int) -> datetime.datetime:
+    """one call per day from 2023-01-02, at a few different hours"""
+    return datetime.datetime(2023, 1, 2, 9) + datetime.timedelta(days=seed % 365, hours=seed % 8)
+
+
+def write_pdf(path: str, lines: list[str], created: datetime.datetime = None):
+    """write `lines` as plain Helvetica text, LINES_PER_PAGE per page,
+       with `created` as the CreationDate"""
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in pages:
+        body = "BT /F1 10 Tf 12 TL 40 780 Td " + " ".join(
+            f"({_escape(line)}) Tj T*" for line in page
+        ) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        kids.append(len(objects) + 1)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects),)
+        )
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+    info = b""
+    if created is not None:
+        objects.append(b"<< /CreationDate (D:%s) >>" % created.strftime("%Y%m%d%H%M%S").encode())
+        info = b" /Info %d 0 R" % len(objects)
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, obj in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, obj))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R%s >>\nstartxref\n%d\n%%%%EOF\n"
+                % (len(objects) + 1, info, xref))
+
+
+def transcript_lines(turns: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    lines = []
+    for turn in range(turns):
+        lines.append(f"Speaker{turn % 2 + 1}")
+        for _ in range(rng.randint(1, 6)):
+            words = rng.choices(WORDS, k=LINE_WIDTH)
+            lines.append(" ".join(words) + rng.choice((".", "?", ",", "")))
+    return lines
+
+
+def summary_lines(seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    lines = []
+    for heading in ("AI meeting summary:", "Action items:", "Outline:", "Notes:"):
+        lines.append(heading)
+        lines.extend(" ".join(rng.choices(WORDS, k=LINE_WIDTH)) for _ in range(rng.randint(2, 8)))
+    return lines
+
+
+def write_transcript_pdf(path: str, turns: int, seed: int = 0):
+    write_pdf(path, transcript_lines(turns, seed), call_date(seed))
+
+
+def write_summary_pdf(path: str, seed: int = 0):
+    write_pdf(path, summary_lines(seed), call_date(seed))
+
+
+def write_corpus(directory: str, calls: int, turns: int = 40, seed: int = 0) -> int:
+    """a transcript and a summary PDF per call, as they land in source_data"""
+    for call in range(calls):
+        write_transcript_pdf(f"{directory}/transcript_{call}.pdf", turns, seed + call)
+        write_summary_pdf(f"{directory}/summary_{call}.pdf", seed + call)
+    return 2 * calls
+
+
+def lead_questions(count: int, topics: int = None, seed: int = 0) -> list[str]:
+    """questions drawn around `topics` stems, roughly one topic per ten questions"""
+    rng = random.Random(seed)
+    vocabulary = [f"{word}{idx}" for idx in range(count // 20 + 50) for word in WORDS[:5]]
+    stems = [" ".join(rng.choices(vocabulary, k=5)) for _ in range(topics or max(1, count // 10))]
+    return [
+        f"{rng.choice(('what', 'how', 'when', 'is'))} {rng.choice(stems)} "
+        f"{' '.join(rng.choices(vocabulary, k=2))}?"
+        for _ in range(count)
+    ]
+
+
+def fireflies_transcript(meeting: int, sentences: int, seed: int = 0) -> dict:
+    """a transcript as the Fireflies API returns it, dated one hour apart
+       per `meeting`, with speakers alternating every few sentences"""
+    rng = random.Random(seed + meeting)
+    speakers = ("Coach", "Lead")
+    speaker, start = 0, 0.0
+    rows = []
+    for _ in range(sentences):
+        if rng.random() < 0.3:
+            speaker = 1 - speaker
+        text = " ".join(rng.choices(WORDS, k=rng.randint(4, LINE_WIDTH))) + rng.choice((".", "?"))
+        duration = round(rng.uniform(1, 6), 2)
+        rows.append({"speaker_name": speakers[speaker], "start_time": round(start, 2),
+                     "end_time": round(start + duration, 2), "text": text})
+        start += duration
+    return {
+        "id": f"meeting-{meeting}",
+        "title": f"Enrollment call {meeting}",
+        "date": 1_690_000_000_000 + meeting * 3_600_000,
+        "duration": round(start / 60, 1),
+        "organizer_email": "coach@example.com",
+        "participants": ["coach@example.com", "lead@example.com"],
+        "sentences": rows,
+    }
@@ -0,0 +1,88 @@
+"""
+Time and peak traced memory of the legacy `/data-to-json` path (a DataFrame
+of every field, serialized to one JSON string) against the streaming
+NDJSON and Parquet exports, over synthetic transcript documents.
+
+    python -m benchmarks.export --transcripts 10000 50000
+
+Runs against MONGO_URL when set, otherwise against an in-memory mongomock
+server (whose cursor copies documents, so peaks include some driver overhead).
+"""
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from app.data import Database
+from app.export import export
+from benchmarks.corpus import WORDS
+
+COLLECTION = "benchmark_export"
+
+
+def transcript_document(idx: int, rng: random.Random) -> dict:
+    return {
+        "filename": f"transcript_{idx}.pdf",
+        "date": f"2023-{idx % 12 + 1:02d}-{idx % 28 + 1:02d} 10:00:00",
+        "transcripts": [f"Speaker{turn % 2 + 1}: " + " ".join(rng.choices(WORDS, k=30)) for turn in range(40)],
+        "checklist_precision": {key: rng.random() < 0.5 for key in "ABCDEFGHI"},
+        "questions_precision": {f"{' '.join(rng.choices(WORDS, k=6))}?": True for _ in range(4)},
+    }
+
+
+def seed(count: int):
+    db = Database(COLLECTION)
+    db.reset()
+    rng = random.Random(0)
+    for start in range(0, count, 1000):
+        db.create_all([transcript_document(idx, rng) for idx in range(start, min(count, start + 1000))])
+
+
+def legacy() -> int:
+    return len(json.dumps({"transcripts": Database(COLLECTION).dataframe().to_json()}))
+
+
+def streaming(output: str) -> int:
+    return sum(len(chunk) for chunk in export(COLLECTION, output))
+
+
+PATHS = {
+    "legacy": legacy,
+    "ndjson": lambda: streaming("ndjson"),
+    "parquet": lambda: streaming("parquet"),
+}
+
+
+def measure(name: str, count: int) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = PATHS[name]()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"path": name, "transcripts": count, "seconds": round(seconds, 3),
+            "peak_mb": round(peak / 2 ** 20, 1), "output_mb": round(size / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcripts", type=int, nargs="+", default=[10000, 50000])
+    args = parser.parse_args()
+    if not os.getenv("MONGO_URL"):
+        os.environ["MONGO_URL"] = "mongomock://"
+
+    results = []
+    for count in args.transcripts:
+        seed(count)
+        for name in PATHS:
+            result = measure(name, count)
+            results.append(result)
+            print(json.dumps(result))
+    Database(COLLECTION).collection.drop()
+    return results
+
+
+if __name__ == "__main__":
+    main()
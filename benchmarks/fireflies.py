@@ -0,0 +1,121 @@
+"""
+Local mock of the Fireflies GraphQL endpoint and the fetch throughput of
+the paginated client at different page concurrencies, against a server
+with a fixed per-request latency.
+
+    python -m benchmarks.fireflies --meetings 2000 --latency 0.2 --concurrency 1 4 8
+
+`MockFireflies` also serves `FirefliesPipeline` for local runs:
+
+    with MockFireflies(meetings=200) as server:
+        FirefliesPipeline(FirefliesClient(url=server.url))()
+"""
+import argparse
+import datetime
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.fireflies import FirefliesClient
+from benchmarks.corpus import fireflies_transcript
+
+SENTENCE_FIELDS = re.compile(r"sentences\s*\{([^}]*)\}")
+
+
+class MockFireflies:
+    """
+    Serves `meetings` synthetic transcripts newest first, honoring `limit`,
+    `skip`, `fromDate` and the sentence fields selected by the query
+    """
+
+    def __init__(self, meetings: int, sentences: int = 40, latency: float = 0.0, port: int = 0):
+        self.transcripts = [fireflies_transcript(meeting, sentences) for meeting in range(meetings)]
+        self.transcripts.reverse()
+        self.latency = latency
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/graphql"
+
+    def add(self, count: int, sentences: int = 40):
+        """new meetings dated after every existing one"""
+        start = len(self.transcripts)
+        new = [fireflies_transcript(meeting, sentences) for meeting in range(start, start + count)]
+        self.transcripts = new[::-1] + self.transcripts
+
+    def page(self, query: str, variables: dict) -> list[dict]:
+        transcripts = self.transcripts
+        if variables.get("fromDate"):
+            from_ms = datetime.datetime.fromisoformat(variables["fromDate"]).timestamp() * 1000
+            transcripts = [transcript for transcript in transcripts if transcript["date"] >= from_ms]
+        skip, limit = variables.get("skip") or 0, variables.get("limit") or 50
+        fields = SENTENCE_FIELDS.search(query).group(1).split()
+        return [
+            {**transcript, "sentences": [{field: row.get(field) for field in fields}
+                                         for row in transcript["sentences"]]}
+            for transcript in transcripts[skip:skip + limit]
+        ]
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                mock.requests += 1
+                time.sleep(mock.latency)
+                payload = json.dumps({"data": {"transcripts": mock.page(body["query"], body["variables"])}})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload.encode())
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure(server: MockFireflies, concurrency: int, page_size: int) -> dict:
+    client = FirefliesClient(url=server.url, key="mock", page_size=page_size, concurrency=concurrency)
+    start = time.perf_counter()
+    pages = transcripts = 0
+    for _, page in client.iter_pages():
+        pages += 1
+        transcripts += len(page)
+    seconds = time.perf_counter() - start
+    return {"concurrency": concurrency, "page_size": page_size, "pages": pages,
+            "transcripts": transcripts, "seconds": round(seconds, 3),
+            "transcripts_per_second": round(transcripts / seconds, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meetings", type=int, default=2000)
+    parser.add_argument("--sentences", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    results = []
+    with MockFireflies(args.meetings, args.sentences, args.latency) as server:
+        for concurrency in args.concurrency:
+            result = measure(server, concurrency, args.page_size)
+            results.append(result)
+            print(json.dumps(result))
+    return results
+
+
+if __name__ == "__main__":
+    main()
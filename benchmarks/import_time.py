@@ -0,0 +1,109 @@
+"""
+Cold-start import time of the API process, per module as reported by
+`python -X importtime`, best of `--runs` fresh interpreters. Exits non-zero
+when a lazily loaded dependency is imported, a Mongo client is created at
+import, or the import time on top of FastAPI itself grew by more than
+`--threshold` since a baseline saved with `--output` on the same machine.
+
+    python -m benchmarks.import_time --runs 5 --output benchmark-results/import_time.json
+    python -m benchmarks.import_time --runs 5 --compare benchmark-results/import_time.json
+
+Import times depend on the machine and on which optional packages are
+installed (dnspython pulls in httpx and trio when present), so an absolute
+budget either flips on noise or says little; `--budget-ms` is still there
+for a fixed ceiling.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODULE = "app.api"
+FRAMEWORK = "fastapi"
+# loaded on first use by the endpoints and jobs that need them
+LAZY = ("pandas", "sklearn", "scipy", "nltk", "pypdf", "openai", "pyarrow", "motor", "matplotlib")
+
+PROBE = f"""
+import json, sys
+import {MODULE}
+from app.data import get_client
+print(json.dumps({{
+    "lazy_loaded": sorted(name for name in {LAZY!r} if name in sys.modules),
+    "mongo_clients": get_client.cache_info().currsize,
+}}))
+"""
+
+
+def import_times(module: str) -> dict[str, dict[str, int]]:
+    """self and cumulative microseconds per imported module"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True, capture_output=True, text=True,
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        if own.strip().isdigit():
+            times[name.strip()] = {"self_us": int(own), "cumulative_us": int(cumulative)}
+    return times
+
+
+def best_of(runs: int) -> dict[str, dict[str, int]]:
+    best = {}
+    for _ in range(runs):
+        for name, times in import_times(MODULE).items():
+            if name not in best or times["cumulative_us"] < best[name]["cumulative_us"]:
+                best[name] = times
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="save the summary as a baseline")
+    parser.add_argument("--compare", help="baseline summary to compare the import time against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed import time growth")
+    parser.add_argument("--budget-ms", type=float, help="fixed ceiling on the import time over FastAPI")
+    args = parser.parse_args()
+
+    times = best_of(args.runs)
+    for name, result in sorted(times.items(), key=lambda item: -item[1]["cumulative_us"])[:args.top]:
+        print(json.dumps({"module": name, **result}))
+
+    probe = json.loads(subprocess.run([sys.executable, "-c", PROBE], check=True,
+                                      capture_output=True, text=True).stdout)
+    total_ms = times[MODULE]["cumulative_us"] / 1000
+    own_ms = total_ms - times.get(FRAMEWORK, {"cumulative_us": 0})["cumulative_us"] / 1000
+    summary = {"module": MODULE, "total_ms": round(total_ms, 1), "own_ms": round(own_ms, 1), **probe}
+    print(json.dumps(summary))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=1)
+
+    failures = []
+    if probe["lazy_loaded"]:
+        failures.append(f"imported at startup: {', '.join(probe['lazy_loaded'])}")
+    if probe["mongo_clients"]:
+        failures.append("Mongo client created at import")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["own_ms"]
+        change = own_ms / baseline - 1 if baseline else 0.0
+        print(json.dumps({"module": MODULE, "own_ms": round(own_ms, 1), "baseline_ms": baseline,
+                          "change": round(change, 3)}))
+        if change > args.threshold:
+            failures.append(f"{own_ms:.0f} ms is {change:.0%} over the {baseline:.0f} ms baseline")
+    if args.budget_ms is not None and own_ms > args.budget_ms:
+        failures.append(f"{own_ms:.0f} ms over the {args.budget_ms:.0f} ms budget")
+    if failures:
+        sys.exit("; ".join(failures))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Peak RSS and wall time of the legacy BytesIO transcript path against the
+streaming, memory-mapped path on large synthetic PDFs.
+
+    python -m benchmarks.pdf_extract --turns 2000 10000 40000
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import write_transcript_pdf
+
+
+def legacy_transcript_turns(path: str) -> list[str]:
+    """the pre-streaming path: whole file in a BytesIO, one joined string,
+       chained replaces, a list of every word, then speaker grouping"""
+    from pypdf import PdfReader
+    from app.utilities import group_transcript_text
+
+    with open(path, "rb") as f:
+        reader = PdfReader(io.BytesIO(f.read()))
+        long_string = "".join(page.extract_text() for page in reader.pages)
+    cleaned = long_string.replace(
+        "\n", " "
+    ).replace("\t", " ").replace(".", " ").replace("?", " ").replace(",", "").split(" ")
+    return group_transcript_text([item for item in cleaned if item != ''])
+
+
+def streaming_transcript_turns(path: str) -> list[str]:
+    from app.utilities import iter_transcript_turns
+
+    return list(iter_transcript_turns(path))
+
+
+PATHS = {"legacy": legacy_transcript_turns, "streaming": streaming_transcript_turns}
+
+
+def measure(path_name: str, pdf: str) -> dict:
+    """runs in a fresh interpreter so ru_maxrss belongs to one path only"""
+    import pypdf  # noqa: F401  import cost is excluded from the delta
+    import app.utilities  # noqa: F401
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    turns = PATHS[path_name](pdf)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"path": path_name, "turns": len(turns), "seconds": round(seconds, 3),
+            "peak_rss_mb": round(peak / 1024, 1), "delta_rss_mb": round((peak - baseline) / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, nargs="+", default=[2000, 10000, 40000])
+    parser.add_argument("--measure", nargs=2, metavar=("PATH", "PDF"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for turns in args.turns:
+            pdf = os.path.join(tmp, f"transcript_{turns}.pdf")
+            write_transcript_pdf(pdf, turns)
+            size_mb = round(os.path.getsize(pdf) / 2 ** 20, 1)
+            for path_name in PATHS:
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.pdf_extract", "--measure", path_name, pdf],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                result = {"pdf_turns": turns, "pdf_mb": size_mb, **json.loads(output)}
+                results.append(result)
+                print(json.dumps(result))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+LLM checklist requests and wall time of scoring with and without the local
+`RubricPrefilter`, and how often its decisions agree with the labels.
+
+    python -m benchmarks.rubric --transcripts 500 --latency 2 --workers 16
+
+Transcripts are synthetic calls where each rubric item is hit in plain words,
+only touched on, or never mentioned. The labels of the items only touched on
+are random, standing in for the LLM's judgement, so the agreement reported
+here is an upper bound. The prefilter run decides every key it can locally,
+on real calls run `POST /rubric-agreement` over labelled data and set
+RUBRIC_LOCAL_KEYS to its `local_keys`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+# key -> (a sentence that hits the item, one that only touches on it)
+CUES = {
+    "A": ("So what made you start looking into software engineering?", "Is there a reason it's now?"),
+    "B": ("Plan on about 20 hours per week, and it's a 9 month program.", "How are your weeks looking?"),
+    "C": ("We have a job guarantee, so you get your money back if you are not hired.",
+          "It is pretty flexible, honestly."),
+    "D": ("Are you looking at any other bootcamps right now?", "Have you compared a few things?"),
+    "E": ("Let's schedule a follow-up call for Thursday.", "I'll give you a call at some point."),
+    "F": ("Let me show you the platform with a quick demo.", "I can share my screen later."),
+    "G": ("Your next step is to complete your enrollment tonight.", "Here is the link for later."),
+    "H": ("Tuition is covered by a payment plan, and the curriculum has four units.",
+          "The program costs a bit, we can get into that."),
+    "I": ("Is there anything holding you back from starting?", "I hear you, it's a big decision."),
+}
+FILLER = ("Sounds good.", "Yeah, that makes sense.", "I work in retail right now.", "Okay, cool.",
+          "My day is pretty busy with the kids.", "Right.")
+
+
+def labelled_transcript(rng: random.Random, hit: float, touched: float) -> tuple[list[str], dict[str, bool]]:
+    coach, lead, labels = [], [], {}
+    for key, (strong, weak) in CUES.items():
+        roll = rng.random()
+        if roll < hit:
+            coach.append(strong)
+            labels[key] = True
+        elif roll < hit + touched:
+            coach.append(weak)
+            labels[key] = rng.random() < 0.5
+        else:
+            labels[key] = False
+        lead.append(rng.choice(FILLER))
+    rng.shuffle(coach)
+    turns = [f"Speaker{idx % 2 + 1} {text}" for idx, text in enumerate(
+        line for pair in zip(coach + [""] * len(lead), lead) for line in pair if line)]
+    return turns, labels
+
+
+def score(transcripts: list[list[str]], workers: int, prefilter) -> tuple[float, int]:
+    from app.cache import SQLiteCache
+    from app.metrics import get_metrics
+    from app.scoring import ScoringEngine
+
+    def requests() -> int:
+        return sum(count for (name, labels), (count, _) in get_metrics().snapshot()["timers"].items()
+                   if name == "llm_request_seconds" and dict(labels)["function"] == "checklist")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = ScoringEngine(workers=workers, prefilter=prefilter,
+                               cache=SQLiteCache(os.path.join(tmp, "cache.sqlite3"), ttl=0, max_entries=0))
+        before = requests()
+        start = time.perf_counter()
+        report = asyncio.run(engine.run(({"transcripts": turns} for turns in transcripts), lambda *_: None))
+        seconds = time.perf_counter() - start
+    assert not report["failed"], report["failed"]
+    return seconds, requests() - before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcripts", type=int, default=500)
+    parser.add_argument("--hit", type=float, default=0.6, help="share of items hit in plain words")
+    parser.add_argument("--touched", type=float, default=0.2, help="share of items only touched on")
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds per LLM request")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+    os.environ.update({
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY": str(args.latency),
+        "OPEN_AI_RPM": os.getenv("OPEN_AI_RPM", "100000"),
+        "OPEN_AI_TPM": os.getenv("OPEN_AI_TPM", "100000000"),
+    })
+    from app.rubric import RubricPrefilter, classify
+
+    rng = random.Random(0)
+    calls = [labelled_transcript(rng, args.hit, args.touched) for _ in range(args.transcripts)]
+    decided = agreed = 0
+    for turns, labels in calls:
+        for key, decision in classify(turns).items():
+            if decision is not None:
+                decided += 1
+                agreed += decision == labels[key]
+    print(json.dumps({"keys": len(calls) * len(CUES), "decided_locally": decided,
+                      "agreement": round(agreed / max(decided, 1), 4)}), flush=True)
+
+    results = []
+    for name, prefilter in (("llm_only", None), ("prefilter", RubricPrefilter(tuple(CUES)))):
+        seconds, requests = score([turns for turns, _ in calls], args.workers, prefilter)
+        results.append({"path": name, "transcripts": len(calls), "checklist_requests": requests,
+                        "seconds": round(seconds, 1)})
+        print(json.dumps(results[-1]), flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+End-to-end benchmark of every pipeline stage and analytics endpoint on
+local stand-ins, written as JSON so runs can be compared across commits.
+
+    python -m benchmarks.suite --calls 100 1000 --latency 0.05 --repeat 3
+    python -m benchmarks.suite --calls 1000 --compare benchmark-results/<commit>.json
+
+Per scale, `--calls` transcript and summary PDFs are generated, along with
+as many Fireflies meetings served by `MockFireflies`. The LLM is the stub
+backend, with `--latency` seconds per request. Mongo is an in-memory mongomock
+server unless MONGO_URL is set, e.g. to a local mongod. The suite always uses
+its own `benchmark_suite` database, whatever MONGO_DB says, and drops it
+between repetitions. A MONGO_URL that is not mongomock:// is refused unless
+`--real-mongo` is passed.
+
+Stages: `push_raw_to_mongo`, `add_precision_data`, `cluster_analysis`, the
+`FirefliesPipeline` transforms per transcript, a full Fireflies sync, and
+every analytics endpoint served over HTTP by uvicorn. `change_type` is gone:
+responses are parsed into dictionaries before they are written, so there is
+no conversion pass left to time.
+
+Each result has the items per second, p50 / p99 latency (per request for
+endpoints, per transcript for the transforms, per repetition otherwise) and
+the peak traced memory of one extra pass. Worker processes of the ingest stage
+are not traced. OPEN_AI_RPM / OPEN_AI_TPM default to effectively unlimited,
+so scoring measures the engine rather than the provider quota.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+from benchmarks.corpus import write_corpus
+from benchmarks.fireflies import MockFireflies
+
+ENDPOINTS = (
+    ("GET", "/checklist_precision_percent"),
+    ("GET", "/checklist_precision_percent?start=2000-01-01&end=2100-01-01"),
+    ("GET", "/checklist_precision_weekly"),
+    ("GET", "/topic-count"),
+    ("GET", "/questions"),
+    ("POST", "/keyword-count?keyword=tuition"),
+    ("GET", "/keyword-search?query=tuition+guarantee"),
+    ("GET", "/keyword-search?query=tuition+guarantee&phrase=true"),
+    ("GET", "/talk-ratio"),
+    ("GET", "/question-count"),
+    ("GET", "/keyword-turns?keyword=tuition"),
+    ("GET", "/turn-questions?role=lead&limit=100"),
+    ("GET", "/export/transcripts?fields=filename,date&start=2023-01-01&end=2023-03-01"),
+)
+# dropped between repetitions, MONGO_DB is never used
+SUITE_DB = "benchmark_suite"
+
+
+def configure(args):
+    """stand-in settings, set before the app is imported"""
+    from app.data import is_mock
+
+    os.environ.setdefault("MONGO_URL", "mongomock://")
+    if not is_mock(os.environ["MONGO_URL"]) and not args.real_mongo:
+        sys.exit(f"MONGO_URL is not mongomock://, pass --real-mongo to run against it "
+                 f"(the {SUITE_DB} database is dropped)")
+    os.environ["MONGO_DB"] = SUITE_DB
+    os.environ.setdefault("OPEN_AI_RPM", "10000000")
+    os.environ.setdefault("OPEN_AI_TPM", "10000000000")
+    os.environ.update({
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY": str(args.latency),
+        "LLM_CACHE": "mongo",
+    })
+
+
+def drop_database():
+    from app.data import get_database
+    database = get_database()
+    if database.name != SUITE_DB:
+        raise RuntimeError(f"refusing to drop {database.name}, the suite only drops {SUITE_DB}")
+    database.client.drop_database(database.name)
+
+
+def percentile_ms(latencies: list[float], q: float) -> float:
+    return round(float(np.percentile(latencies, q)) * 1000, 2)
+
+
+def measure(name: str, calls: int, setup: Callable[[], None],
+            run: Callable[[], tuple[int, list[float] | None]], repeat: int, memory: bool) -> dict:
+    """`run` returns (items, per-item latencies or None), timed `repeat`
+       times after `setup`, then once more under tracemalloc"""
+    totals, latencies, items, per_item = [], [], 0, False
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        items, item_latencies = run()
+        totals.append(time.perf_counter() - start)
+        per_item = item_latencies is not None
+        latencies.extend(item_latencies if per_item else totals[-1:])
+    result = {
+        "stage": name,
+        "calls": calls,
+        "items": items,
+        "seconds": round(float(np.median(totals)), 3),
+        "throughput": round(items / max(float(np.median(totals)), 1e-9), 1),
+        "latency_of": "item" if per_item else "run",
+        "p50_ms": percentile_ms(latencies, 50),
+        "p99_ms": percentile_ms(latencies, 99),
+    }
+    if memory:
+        setup()
+        tracemalloc.start()
+        run()
+        result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    print(json.dumps(result), flush=True)
+    return result
+
+
+def pipeline_stages(corpus: str) -> list[tuple[str, Callable, Callable]]:
+    from app.cache import get_cache
+    from app.data import Database
+    from app.pipeline import PDFPipeline
+
+    pipeline = PDFPipeline()
+    transcripts = Database("transcripts").collection
+
+    def reset_scores():
+        transcripts.update_many({}, {"$unset": {"checklist_precision": "", "questions_precision": "",
+                                                "clustered": ""}})
+        for name in ("dead_letter", "analytics_views"):
+            Database(name).collection.drop()
+        get_cache().clear()
+
+    def ingest():
+        report = pipeline.push_raw_to_mongo(corpus)
+        return report["transcripts"] + report["summaries"], None
+
+    def score():
+        return pipeline.add_precision_data()["scored"], None
+
+    def cluster():
+        return pipeline.cluster_analysis()["questions"], None
+
+    return [
+        ("push_raw_to_mongo", drop_database, ingest),
+        ("add_precision_data", reset_scores, score),
+        ("cluster_analysis", lambda: transcripts.update_many({}, {"$unset": {"clustered": ""}}), cluster),
+    ]
+
+
+def fireflies_stages(server: MockFireflies) -> list[tuple[str, Callable, Callable]]:
+    from app.fireflies import FirefliesClient
+    from app.pipeline import FirefliesPipeline
+
+    client = FirefliesClient(url=server.url, key="mock")
+    pipeline = FirefliesPipeline(client)
+    fetched = [transcript for _, page in client.iter_pages() for transcript in page]
+
+    def transforms():
+        latencies = []
+        for transcript in fetched:
+            transcript = {**transcript}
+            start = time.perf_counter()
+            pipeline.clean_dates(pipeline.clean_sentences([transcript]))
+            latencies.append(time.perf_counter() - start)
+        return len(latencies), latencies
+
+    def reset_sync():
+        pipeline.db.collection.drop()
+        pipeline.state_db.collection.drop()
+
+    return [
+        ("fireflies_transforms", lambda: None, transforms),
+        ("fireflies_sync", reset_sync, lambda: (pipeline(full=True)["transcripts"], None)),
+    ]
+
+
+class LocalAPI:
+    """the API on uvicorn in a background thread"""
+
+    def __enter__(self):
+        import uvicorn
+        from app.api import API
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(API, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def endpoint_stages(api: LocalAPI, requests_per_endpoint: int) -> list[tuple[str, Callable, Callable]]:
+    import requests
+
+    session = requests.Session()
+
+    def call(method: str, path: str):
+        response = session.request(method, api.url + path)
+        response.raise_for_status()
+
+    def make_run(method: str, path: str):
+        def run():
+            latencies = []
+            for _ in range(requests_per_endpoint):
+                start = time.perf_counter()
+                call(method, path)
+                latencies.append(time.perf_counter() - start)
+            return len(latencies), latencies
+        return run
+
+    stages = []
+    for method, path in ENDPOINTS:
+        call(method, path)  # builds the analytics views and search index on first use
+        stages.append((f"{method} {path}", lambda: None, make_run(method, path)))
+    return stages
+
+
+def run_scale(calls: int, args) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.workdir) as corpus:
+        write_corpus(corpus, calls, args.turns)
+        for name, setup, run in pipeline_stages(corpus):
+            results.append(measure(name, calls, setup, run, args.repeat, not args.no_memory))
+    with MockFireflies(calls, args.sentences) as server:
+        for name, setup, run in fireflies_stages(server):
+            results.append(measure(name, calls, setup, run, args.repeat, not args.no_memory))
+    with LocalAPI() as api:
+        for name, setup, run in endpoint_stages(api, args.requests):
+            results.append(measure(name, calls, setup, run, 1, not args.no_memory))
+    return results
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> list[str]:
+    """stages whose throughput dropped by more than `threshold`"""
+    with open(baseline_path) as f:
+        baseline = {(row["stage"], row["calls"]): row for row in json.load(f)["results"]}
+    regressions = []
+    for row in results:
+        old = baseline.get((row["stage"], row["calls"]))
+        if not old or not old["throughput"]:
+            continue
+        change = row["throughput"] / old["throughput"] - 1
+        print(json.dumps({"stage": row["stage"], "calls": row["calls"], "throughput": row["throughput"],
+                          "baseline": old["throughput"], "change": round(change, 3)}))
+        if change < -threshold:
+            regressions.append(f"{row['stage']} @ {row['calls']}: {change:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, nargs="+", default=[100, 1000],
+                        help="transcripts per scale, 100 to 100k")
+    parser.add_argument("--turns", type=int, default=40, help="speaker turns per transcript PDF")
+    parser.add_argument("--sentences", type=int, default=200, help="sentences per Fireflies meeting")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub LLM seconds per request")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced pass")
+    parser.add_argument("--output", help="default benchmark-results/<commit>.json")
+    parser.add_argument("--compare", help="earlier results to compare throughput against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed throughput drop")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--real-mongo", action="store_true",
+                        help=f"allow a MONGO_URL that is not mongomock://, its {SUITE_DB} database is dropped")
+    args = parser.parse_args()
+    configure(args)
+
+    results = [result for calls in args.calls for result in run_scale(calls, args)]
+    output = args.output or os.path.join("benchmark-results", f"{commit()}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {"commit": commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "python": sys.version.split()[0], "mongo": os.environ["MONGO_URL"].split("://")[0],
+                     **{key: value for key, value in vars(args).items() if key not in ("output", "compare")}},
+            "results": results,
+        }, f, indent=1)
+    print(json.dumps({"output": output}))
+    if args.compare and (regressions := compare(results, args.compare, args.threshold)):
+        sys.exit("throughput regressions: " + "; ".join(regressions))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Wall time of summarizing a clustering run: the legacy serial `summarize`
+call per cluster against `ClusterSummarizer`, cold and then with the
+membership cache warm. Runs on the offline stub backend with `--latency`
+seconds per request, a stand-in for a GPT-4 round trip.
+
+    python -m benchmarks.summaries --clusters 5000 --latency 2 --concurrency 32
+
+Cluster sizes follow a long-tailed distribution (most clusters are one or
+two questions). The legacy path is timed on `--legacy-clusters` clusters and
+extrapolated, running it in full would take hours at realistic latencies.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.corpus import lead_questions
+
+
+def make_clusters(count: int, seed: int = 0) -> dict[int, list[str]]:
+    rng = random.Random(seed)
+    sizes = [min(2000, int(rng.paretovariate(1.2))) for _ in range(count)]
+    questions = iter(lead_questions(sum(sizes), topics=count, seed=seed))
+    return {cluster_id: [next(questions) for _ in range(size)] for cluster_id, size in enumerate(sizes, start=1)}
+
+
+def legacy(clusters: dict[int, list[str]]) -> int:
+    from app.ai import chat_completion, summarize_messages
+    return len([chat_completion(summarize_messages(questions), "summarize") for questions in clusters.values()])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clusters", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds per LLM request")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--legacy-clusters", type=int, default=20)
+    args = parser.parse_args()
+    os.environ.update({
+        "LLM_SUMMARIZE_BACKEND": "stub",
+        "LLM_STUB_LATENCY": str(args.latency),
+        "LLM_SUMMARIZE_CONCURRENCY": str(args.concurrency),
+        "OPEN_AI_RPM": os.getenv("OPEN_AI_RPM", "100000"),
+        "OPEN_AI_TPM": os.getenv("OPEN_AI_TPM", "100000000"),
+    })
+    from app.cache import SQLiteCache
+    from app.summaries import ClusterSummarizer
+
+    clusters = make_clusters(args.clusters)
+    results = []
+    sample = dict(list(clusters.items())[:args.legacy_clusters])
+    start = time.perf_counter()
+    legacy(sample)
+    seconds = (time.perf_counter() - start) * len(clusters) / len(sample)
+    results.append({"path": "legacy", "clusters": len(clusters), "seconds": round(seconds, 1),
+                    "extrapolated_from": len(sample)})
+    print(json.dumps(results[-1]), flush=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SQLiteCache(os.path.join(tmp, "cache.sqlite3"), ttl=0, max_entries=0)
+        for name in ("cold", "warm"):
+            summarizer = ClusterSummarizer(cache=cache)
+            start = time.perf_counter()
+            summarizer(clusters)
+            seconds = time.perf_counter() - start
+            results.append({"path": name, "clusters": len(clusters), "seconds": round(seconds, 1),
+                            **summarizer.stats})
+            print(json.dumps(results[-1]), flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Time of topic extraction over many clusters: the legacy per-cluster
+`extract_topics` loop against `topics_by_cluster` (one tokenization, one
+vectorized pass) and `cluster_topics` on the counts clustering already built,
+which is what `process_clusters` and `ClusterModel.fit` do now.
+
+    python -m benchmarks.topics --clusters 1000 10000 --size 5
+
+The legacy path rebuilds the stopword list on every call and tests tokens
+against it with a list scan, as before. It tokenizes with nltk's Treebank
+tokenizer (what `word_tokenize` applies after sentence splitting), so it runs
+without the punkt download, and falls back to scikit-learn's English list when
+the nltk stopwords corpus isn't downloaded either.
+"""
+import argparse
+import json
+import time
+from collections import Counter
+
+import numpy as np
+from nltk.tokenize import TreebankWordTokenizer
+
+from app.utilities import FILLER_WORDS, cluster_topics, count_terms, topics_by_cluster
+from benchmarks.corpus import lead_questions
+
+
+def legacy_stop_words() -> list[str]:
+    try:
+        from nltk.corpus import stopwords
+        return stopwords.words("english") + list(FILLER_WORDS)
+    except LookupError:
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        return list(ENGLISH_STOP_WORDS) + list(FILLER_WORDS)
+
+
+def legacy_extract_topics(text_list: list[str]) -> list[tuple[str, int]]:
+    stop_words = legacy_stop_words()
+    tokens = TreebankWordTokenizer().tokenize(" ".join(text_list))
+    return Counter(word for word in tokens if word.lower() not in stop_words).most_common(4)
+
+
+def legacy(clusters: dict[int, list[str]]) -> int:
+    return len([legacy_extract_topics(questions) for questions in clusters.values()])
+
+
+def vectorized(clusters: dict[int, list[str]]) -> int:
+    return len(topics_by_cluster(clusters))
+
+
+def make_shared(clusters: dict[int, list[str]]):
+    """the counts are built by clustering, only the topic pass is timed"""
+    counts, terms, _ = count_terms([question for questions in clusters.values() for question in questions])
+    labels = np.repeat(np.arange(len(clusters)), [len(questions) for questions in clusters.values()])
+    return lambda _: len(cluster_topics(counts, terms, labels, len(clusters)))
+
+
+def make_clusters(count: int, size: int) -> dict[int, list[str]]:
+    questions = lead_questions(count * size, topics=count)
+    return {cluster_id: questions[cluster_id * size:(cluster_id + 1) * size] for cluster_id in range(count)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clusters", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--size", type=int, default=5, help="questions per cluster")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.clusters:
+        clusters = make_clusters(count, args.size)
+        for name, func in (("legacy", legacy), ("vectorized", vectorized), ("shared", make_shared(clusters))):
+            start = time.perf_counter()
+            func(clusters)
+            seconds = time.perf_counter() - start
+            result = {"path": name, "clusters": count, "questions": count * args.size, "seconds": round(seconds, 3)}
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
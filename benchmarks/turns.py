@@ -0,0 +1,96 @@
+"""
+Time and peak traced memory of the legacy triple-chunking `clean_sentences`
+against the single-pass `build_turns` on multi-hour synthetic meetings.
+
+    python -m benchmarks.turns --hours 1 3 6 --meetings 20
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from itertools import groupby
+
+from app.fireflies import build_turns, turns_text
+from benchmarks.corpus import fireflies_transcript
+
+# one sentence every ~3.5 seconds of speech
+SENTENCES_PER_HOUR = 1000
+
+
+def legacy_clean_sentences(transcripts: list[dict]) -> list[dict]:
+    """the pre-streaming path: every scalar field as a string, chunked into
+       triples, grouped, then attached by index in a second walk"""
+    split = []
+    result = []
+    for transcript in transcripts:
+        sentences = transcript.get("sentences", [])
+        raw_text = [
+            str(dictionary[key])
+            for dictionary in sentences
+            for key, value in dictionary.items()
+            if type(value) != dict
+        ]
+        split.append([raw_text[idx:idx + 3] for idx in range(0, len(raw_text), 3)])
+    for item in split:
+        groups = []
+        for key, group in groupby(item, lambda x: x[0]):
+            groups.append(f"Speaker {key}: {' '.join(item[-1] for item in list(group))}")
+        result.append("|".join(groups))
+    for j in range(len(transcripts)):
+        transcripts[j]["transcript_text"] = result[j]
+    return transcripts
+
+
+def single_pass(transcripts: list[dict], timing: bool = False) -> list[dict]:
+    for transcript in transcripts:
+        turns = build_turns(transcript["sentences"], timing)
+        transcript["transcript_text"] = turns_text(turns)
+        if timing:
+            transcript["turns"] = turns
+    return transcripts
+
+
+PATHS = {
+    "legacy": legacy_clean_sentences,
+    "single_pass": single_pass,
+    "single_pass_timing": lambda transcripts: single_pass(transcripts, timing=True),
+}
+
+
+def measure(name: str, hours: float, meetings: int) -> dict:
+    sentences = int(hours * SENTENCES_PER_HOUR)
+    transcripts = [fireflies_transcript(meeting, sentences) for meeting in range(meetings)]
+    if name == "legacy":
+        # the legacy path only lines up with exactly three scalar fields
+        for transcript in transcripts:
+            transcript["sentences"] = [{"speaker_name": row["speaker_name"], "start_time": row["start_time"],
+                                        "text": row["text"]} for row in transcript["sentences"]]
+    start = time.perf_counter()
+    PATHS[name]([{**transcript} for transcript in transcripts])
+    seconds = time.perf_counter() - start
+    # traced separately, tracemalloc slows allocation-heavy code unevenly
+    tracemalloc.start()
+    PATHS[name](transcripts)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"path": name, "hours": hours, "meetings": meetings, "sentences": sentences * meetings,
+            "seconds": round(seconds, 3), "peak_mb": round(peak / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 3, 6])
+    parser.add_argument("--meetings", type=int, default=20)
+    args = parser.parse_args()
+
+    results = []
+    for hours in args.hours:
+        for name in PATHS:
+            result = measure(name, hours, args.meetings)
+            results.append(result)
+            print(json.dumps(result))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Every test runs on an in-memory mongomock server and the offline stub LLM,
+set before the app is imported so no test can reach a real database or API.
+"""
+import os
+
+os.environ.update({
+    "MONGO_URL": "mongomock://",
+    "MONGO_DB": "tests",
+    "LLM_BACKEND": "stub",
+    "LLM_STUB_LATENCY": "0",
+    "LLM_CACHE": "mongo",
+    "OPEN_AI_RPM": "10000000",
+    "OPEN_AI_TPM": "10000000000",
+})
+
+import pytest  # noqa: E402
+
+from app.data import get_client, get_database  # noqa: E402
+from app.pipeline import PDFPipeline  # noqa: E402
+from benchmarks.corpus import write_corpus  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """a fresh database per test"""
+    database = get_database()
+    yield database
+    get_client().drop_database(database.name)
+
+
+@pytest.fixture
+def corpus(tmp_path) -> str:
+    """ten calls, a transcript and a summary PDF each"""
+    write_corpus(str(tmp_path), 10, 12)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def pipeline() -> PDFPipeline:
+    return PDFPipeline()
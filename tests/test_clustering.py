@@ -0,0 +1,39 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.clustering import rebuild_clusters, update_clusters
+from app.data import Database
+from app.utilities import cluster_document, leader_cluster
+from benchmarks.corpus import write_transcript_pdf
+
+
+def question_counts() -> tuple[int, int]:
+    scored = Database("transcripts").collection.find({"questions_precision": {"$type": "object"}})
+    clustered = Database("cluster").collection.find()
+    return (sum(len(doc["questions_precision"]) for doc in scored),
+            sum(len(doc["questions"]) for doc in clustered))
+
+
+def test_cluster_document_without_a_summary():
+    doc = cluster_document(1, ["How long is the program?", "How long does it take?"], [])
+    assert doc["summary"].startswith("Leads asked about")
+    assert doc["count"] == 2
+
+
+def test_questions_without_terms_keep_their_own_cluster():
+    questions = ["what is the price?", "what is the price", "?", "!!", "how many hours per week"]
+    labels, _ = leader_cluster(TfidfVectorizer().fit_transform(questions), 0.6)
+    assert labels[0] == labels[1]
+    assert len({labels[0], labels[2], labels[3], labels[4]}) == 4
+
+
+def test_update_after_reingest_drops_the_old_questions(corpus, pipeline):
+    pipeline.push_raw_to_mongo(corpus)
+    pipeline.add_precision_data()
+    rebuild_clusters()
+    write_transcript_pdf(f"{corpus}/transcript_0.pdf", 12, seed=99)
+    pipeline.push_raw_to_mongo(corpus)
+    pipeline.add_precision_data()
+    update_clusters()
+
+    scored, clustered = question_counts()
+    assert scored == clustered
@@ -0,0 +1,18 @@
+from benchmarks.corpus import write_transcript_pdf
+
+
+def test_unchanged_files_are_skipped(corpus, pipeline):
+    first = pipeline.push_raw_to_mongo(corpus)
+    second = pipeline.push_raw_to_mongo(corpus)
+
+    assert first["transcripts"] == first["summaries"] == 10
+    assert second["unchanged"] == second["total"] == 20
+
+
+def test_changed_files_are_reingested(corpus, pipeline):
+    pipeline.push_raw_to_mongo(corpus)
+    write_transcript_pdf(f"{corpus}/transcript_0.pdf", 12, seed=99)
+    report = pipeline.push_raw_to_mongo(corpus)
+
+    assert report["transcripts"] == 1
+    assert report["unchanged"] == 19
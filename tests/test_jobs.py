@@ -0,0 +1,50 @@
+import datetime
+import time
+
+import pytest
+
+from app import jobs
+from app.data import Database
+
+
+def wait(queue: jobs.JobQueue, job_id: str, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while (job := queue.get(job_id))["status"] in jobs.ACTIVE and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return job
+
+
+@pytest.fixture
+def queue(monkeypatch) -> jobs.JobQueue:
+    def endless(job):
+        while True:
+            job.progress({"steps": 1}, force=True)
+            time.sleep(0.01)
+
+    monkeypatch.setitem(jobs.TASKS, "endless", endless)
+    monkeypatch.setitem(jobs.TASKS, "noop", lambda job: {"done": True})
+    return jobs.JobQueue(workers=1, heartbeat=0.05, stale_after=0.5)
+
+
+def test_job_succeeds(queue):
+    assert wait(queue, queue.submit("noop"))["result"] == {"done": True}
+
+
+def test_cancel_running_and_queued_jobs(queue):
+    running = queue.submit("endless")
+    queued = queue.submit("noop")
+    time.sleep(0.1)
+    queue.cancel(queued)
+    queue.cancel(running)
+
+    assert wait(queue, running)["status"] == "cancelled"
+    assert wait(queue, queued)["status"] == "cancelled"
+
+
+def test_stale_jobs_of_other_hosts_are_interrupted(queue):
+    old = datetime.datetime.utcnow() - datetime.timedelta(minutes=5)
+    Database("jobs").collection.insert_one({"_id": "gone", "status": "running", "host": "other-dyno",
+                                            "pid": 1, "created": old, "updated": old})
+    queue.recover()
+
+    assert queue.get("gone")["status"] == "interrupted"
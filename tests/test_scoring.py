@@ -0,0 +1,54 @@
+import asyncio
+
+import openai
+import pytest
+
+from app.data import Database
+from app.scoring import ScoringEngine
+from benchmarks.completions import MockCompletions
+from benchmarks.corpus import transcript_lines
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    """MockCompletions failing half the requests, behind the real async backend"""
+    with MockCompletions(error_rate=0.5, retry_after=0.01) as server:
+        monkeypatch.setenv("LLM_BACKEND", "async")
+        monkeypatch.setattr(openai, "api_base", server.url)
+        monkeypatch.setattr(openai, "api_key", "mock")
+        yield server
+
+
+def test_retries_429_and_5xx(completions):
+    engine = ScoringEngine(workers=4, max_retries=20, base_delay=0.001, max_delay=0.01)
+    docs = [{"transcripts": transcript_lines(12, seed)} for seed in range(10)]
+    report = asyncio.run(engine.run(docs, lambda *_: None))
+
+    assert report == {"scored": 10, "failed": []}
+    assert {429, 500, 503} <= set(completions.statuses)
+    assert completions.statuses[200] == 20
+
+
+def test_exhausted_retries_fail_the_transcript(completions):
+    completions.error_rate = 1.0
+    engine = ScoringEngine(workers=1, max_retries=2, base_delay=0.001, max_delay=0.01)
+    report = asyncio.run(engine.run([{"filename": "call.pdf", "transcripts": ["Speaker1 hi"]}],
+                                    lambda *_: None))
+
+    assert report["scored"] == 0
+    assert report["failed"][0]["filename"] == "call.pdf"
+    assert sum(completions.statuses.values()) == 6
+
+
+def test_malformed_responses_go_to_the_dead_letter_collection(corpus, pipeline):
+    pipeline.push_raw_to_mongo(corpus)
+
+    async def malformed(messages, model):
+        return "not json"
+
+    transcripts = Database("transcripts").collection
+    report = asyncio.run(ScoringEngine(complete=malformed).score_collection(transcripts))
+
+    assert report["scored"] == 0
+    assert Database("dead_letter").collection.count_documents({}) == 20
+    assert transcripts.count_documents({"checklist_precision": {"$type": "object"}}) == 0
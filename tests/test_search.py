@@ -0,0 +1,43 @@
+from collections import Counter
+
+from app.data import Database
+from app.search import SearchIndex
+from benchmarks.corpus import write_pdf, write_transcript_pdf
+
+
+def naive_count(term: str) -> int:
+    counts = Counter()
+    for doc in Database("transcripts").collection.find({}, {"transcripts": True}):
+        for turn in doc["transcripts"]:
+            counts.update(word.strip(".,?!").lower() for word in turn.split()[1:])
+    return counts[term]
+
+
+def test_reindexing_a_transcript_that_had_no_words():
+    index = SearchIndex()
+    index.ensure_indexes()
+    index.add([{"filename": "call.pdf", "transcripts": []}])
+    index.add([{"filename": "call.pdf", "transcripts": ["Speaker1 what is the tuition"]}])
+    index.add([{"filename": "call.pdf", "transcripts": ["Speaker1 what is the tuition"]}])
+
+    assert index.term_stats(["tuition"])["tuition"]["count"] == 1
+    assert Database("search_pairs").collection.count_documents({"filename": "call.pdf"}) == 1
+
+
+def test_blank_pdf_then_real_transcript_ingests(tmp_path, pipeline):
+    write_pdf(f"{tmp_path}/transcript_0.pdf", [])
+    pipeline.push_raw_to_mongo(str(tmp_path))
+    write_transcript_pdf(f"{tmp_path}/transcript_0.pdf", 12, seed=1)
+    report = pipeline.push_raw_to_mongo(str(tmp_path))
+
+    assert report["failed"] == []
+    assert report["transcripts"] == 1
+
+
+def test_term_totals_follow_reingest(corpus, pipeline):
+    pipeline.push_raw_to_mongo(corpus)
+    write_transcript_pdf(f"{corpus}/transcript_0.pdf", 12, seed=99)
+    pipeline.push_raw_to_mongo(corpus)
+
+    stats = SearchIndex().term_stats(["tuition"])["tuition"]
+    assert stats["count"] == naive_count("tuition")
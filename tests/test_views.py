@@ -0,0 +1,64 @@
+import asyncio
+
+from app.api import read_view
+from app.data import Database
+from app.views import AnalyticsViews, view_percent, weekly_percent
+from benchmarks.corpus import write_transcript_pdf
+
+
+def checklist_view() -> dict:
+    return asyncio.run(read_view("checklist"))
+
+
+def test_scoring_a_new_transcript_before_the_views_exist(corpus, pipeline):
+    pipeline.push_raw_to_mongo(corpus)
+    pipeline.add_precision_data()
+    write_transcript_pdf(f"{corpus}/transcript_new.pdf", 12, seed=99)
+    pipeline.push_raw_to_mongo(corpus)
+    pipeline.add_precision_data()
+
+    assert not AnalyticsViews().built("checklist")
+    view = checklist_view()
+    assert view["total"] == 11
+    assert view_percent(view) == Database("transcripts").read_checklist_precision_percent()
+
+
+def test_scoring_updates_built_views(corpus, pipeline):
+    pipeline.push_raw_to_mongo(corpus)
+    pipeline.add_precision_data()
+    assert checklist_view()["total"] == 10
+
+    write_transcript_pdf(f"{corpus}/transcript_new.pdf", 12, seed=99)
+    pipeline.push_raw_to_mongo(corpus)
+    pipeline.add_precision_data()
+    view = checklist_view()
+    assert view["total"] == 11
+    assert view_percent(view) == Database("transcripts").read_checklist_precision_percent()
+
+
+def test_reingest_subtracts_the_replaced_checklist(corpus, pipeline):
+    pipeline.push_raw_to_mongo(corpus)
+    pipeline.add_precision_data()
+    assert checklist_view()["total"] == 10
+
+    write_transcript_pdf(f"{corpus}/transcript_0.pdf", 12, seed=99)
+    pipeline.push_raw_to_mongo(corpus)
+    assert checklist_view()["total"] == 9
+    pipeline.add_precision_data()
+    assert checklist_view()["total"] == 10
+
+
+def test_topics_view_is_built_from_existing_clusters(corpus, pipeline):
+    pipeline.push_raw_to_mongo(corpus)
+    pipeline.add_precision_data()
+    pipeline.cluster_analysis()
+    Database("analytics_views").collection.delete_many({})
+
+    topics = asyncio.run(read_view("topics"))
+    assert topics["counts"]
+
+
+def test_weeks_without_hits_count_as_zero():
+    weeks = weekly_percent([{"_id": "checklist:week:2023-W01", "total": 2, "hits": {"A": 1}}])
+    assert weeks == [{"week": "2023-W01", "total": 2, "A": 50.0,
+                      **{key: 0.0 for key in "BCDEFGHI"}}]